@@ -52,7 +52,7 @@ del %PKG%\python\get-pip.py
 
 echo.
 echo [5/8] Installing Python packages...
-%PKG%\python\python.exe -m pip install --no-warn-script-location fastapi uvicorn motor pymongo python-dotenv pydantic bcrypt python-jose python-multipart aiosqlite reportlab PyJWT pillow aiofiles
+%PKG%\python\python.exe -m pip install --no-warn-script-location fastapi uvicorn motor pymongo python-dotenv pydantic bcrypt python-jose python-multipart aiosqlite reportlab PyJWT pillow aiofiles numpy tzdata
 
 echo.
 echo [6/8] Downloading MongoDB...
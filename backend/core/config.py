@@ -10,6 +10,36 @@ UPLOAD_DIR = ROOT_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 load_dotenv(ROOT_DIR / '.env')
 
+# Columnar analytics snapshot (Parquet) written by services/analytics_snapshot.py
+ANALYTICS_DIR = Path(os.environ.get('ANALYTICS_DIR', str(ROOT_DIR / "analytics")))
+
+# PDF rendering worker pool (services/pdf_renderer.py). 0 workers = render in a thread.
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', str(min(2, os.cpu_count() or 1))))
+PDF_RENDER_QUEUE = int(os.environ.get('PDF_RENDER_QUEUE', '16'))
+PDF_RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', '30'))
+# Rendered-PDF artifact cache (services/pdf_cache.py)
+PDF_CACHE_DIR = UPLOAD_DIR / "pdf_cache"
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_MB', '200')) * 1024 * 1024
+# Background jobs (services/jobs.py). 0 CPU workers = run CPU steps in a thread.
+JOBS_DIR = UPLOAD_DIR / "jobs"
+JOB_CPU_WORKERS = int(os.environ.get('JOB_CPU_WORKERS', str(min(2, os.cpu_count() or 1))))
+JOB_RETENTION_HOURS = int(os.environ.get('JOB_RETENTION_HOURS', '24'))
+# Nightly customer RFM segmentation (services/customer_segments.py): earliest UTC hour to run
+RFM_SEGMENT_HOUR = int(os.environ.get('RFM_SEGMENT_HOUR', '2'))
+# Marketing campaigns (services/campaign_service.py): send throttle and SMTP pool size
+CAMPAIGN_SEND_RATE = float(os.environ.get('CAMPAIGN_SEND_RATE', '5'))  # messages per second
+CAMPAIGN_SMTP_CONNECTIONS = int(os.environ.get('CAMPAIGN_SMTP_CONNECTIONS', '3'))
+
+# Scheduler (services/scheduler.py): tick interval and leader lease lifetime
+SCHEDULER_TICK_SECONDS = int(os.environ.get('SCHEDULER_TICK_SECONDS', '15'))
+SCHEDULER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', '60'))
+
+# Follow-up email senders (services/followup_service.py)
+FOLLOWUP_WORKERS = int(os.environ.get('FOLLOWUP_WORKERS', '4'))
+
+# How long an Idempotency-Key response is replayed (services/idempotency.py)
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
 # Email configuration
 EMAIL_ADDRESS = os.environ.get('EMAIL_ADDRESS', '')
 EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')
@@ -60,6 +90,18 @@ except ImportError:
     OrdersCaptureRequest = None
     OrdersGetRequest = None
 
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import openpyxl  # noqa: F401
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
 # Initialize PayPal client (only if available)
 paypal_client = None
 if PAYPAL_AVAILABLE and PayPalHttpClient:
@@ -0,0 +1,78 @@
+"""MongoDB index definitions, created idempotently at startup."""
+from pymongo import ASCENDING, DESCENDING
+
+from .config import db, logger
+
+# (collection, keys, options). Keep entries grouped by the feature that needs them.
+INDEXES = [
+    # Sales: range scans by date for reports/exports
+    ("sales", [("payment_status", ASCENDING), ("created_at", ASCENDING)], {}),
+    ("sales", [("id", ASCENDING)], {"unique": True}),
+    # Per-customer purchase stats projection (top / lost customers, RFM)
+    ("customer_stats", [("customer_id", ASCENDING)], {"unique": True}),
+    ("customer_stats", [("total_spent", DESCENDING)], {}),
+    ("customer_stats", [("sales_count", DESCENDING)], {}),
+    ("customer_stats", [("last_sale_at", DESCENDING)], {}),
+    # Item sales velocity: sold counters on inventory + daily unit buckets
+    ("inventory", [("id", ASCENDING)], {"unique": True}),
+    ("inventory", [("last_sold_at", ASCENDING)], {}),
+    ("item_sales_daily", [("item_id", ASCENDING), ("day", ASCENDING)], {"unique": True}),
+    ("item_sales_daily", [("day", ASCENDING)], {}),
+    # Coupon redemption stats per (code, month)
+    ("coupon_stats", [("code", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+    ("coupon_stats", [("month", ASCENDING)], {}),
+    # Per-user daily sales / shift-close rollup (staff leaderboard)
+    ("staff_daily", [("username", ASCENDING), ("day", ASCENDING)], {"unique": True}),
+    ("staff_daily", [("day", ASCENDING)], {}),
+    # Coupons: code lookups at checkout; one code per coupon
+    ("coupons", [("code", ASCENDING)], {"unique": True}),
+    # Birthday windows and per-year dedupe markers
+    ("customers", [("birthday_mmdd", ASCENDING)], {}),
+    # Materialized RFM segments: marketing filters on customers
+    ("customers", [("rfm_segment", ASCENDING), ("rfm_score", DESCENDING)], {}),
+    ("customers", [("rfm_score", DESCENDING)], {}),
+    ("customers", [("last_sale_at", ASCENDING)], {}),
+    # Marketing campaigns: recipient work queue + coupons reused on resume
+    ("campaigns", [("id", ASCENDING)], {"unique": True}),
+    ("campaign_recipients", [("campaign_id", ASCENDING), ("customer_id", ASCENDING)], {"unique": True}),
+    ("campaign_recipients", [("campaign_id", ASCENDING), ("status", ASCENDING)], {}),
+    ("campaign_recipients", [("campaign_id", ASCENDING), ("coupon_code", ASCENDING)], {}),
+    ("coupons", [("campaign_id", ASCENDING), ("customer_id", ASCENDING)],
+     {"partialFilterExpression": {"campaign_id": {"$exists": True}}}),
+    # Bulk-generated coupon batches (rollback of a failed batch)
+    ("coupons", [("batch_id", ASCENDING)], {"partialFilterExpression": {"batch_id": {"$exists": True}}}),
+    ("birthday_coupons", [("key", ASCENDING)], {"unique": True}),
+    # Cash register: one open shift per register, shift history, per-shift transactions
+    ("cash_register_shifts", [("id", ASCENDING)], {"unique": True}),
+    ("cash_register_shifts", [("register_id", ASCENDING), ("status", ASCENDING)],
+     {"unique": True, "partialFilterExpression": {"status": "open"}}),
+    ("cash_register_shifts", [("status", ASCENDING), ("closed_at", DESCENDING)], {}),
+    ("cash_register_transactions", [("shift_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    # Follow-up email queue: due-claim scan and per-id settle
+    ("followups", [("status", ASCENDING), ("send_at", ASCENDING)], {}),
+    ("followups", [("id", ASCENDING)], {"unique": True}),
+    # Scheduler: per-job state + single leader lease document
+    ("scheduler_jobs", [("name", ASCENDING)], {"unique": True}),
+    ("scheduler_lease", [("id", ASCENDING)], {"unique": True}),
+    # Background jobs: polling by id, per-user history, per-group active count, TTL purge of finished jobs
+    ("jobs", [("id", ASCENDING)], {"unique": True}),
+    ("jobs", [("created_by", ASCENDING), ("created_at", DESCENDING)], {}),
+    ("jobs", [("group", ASCENDING), ("status", ASCENDING)], {}),
+    ("jobs", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    # Cross-worker leases (services/leases.py) and writes queued during a projection rebuild
+    ("leases", [("id", ASCENDING)], {"unique": True}),
+    ("projection_backlog", [("gen", ASCENDING)], {}),
+    # Idempotency keys: claim/replay by key, TTL purge of stored responses
+    ("idempotency_keys", [("key", ASCENDING)], {"unique": True}),
+    ("idempotency_keys", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+]
+
+
+async def ensure_indexes():
+    """Create every index in INDEXES. Failures are logged, never fatal —
+    e.g. a unique index cannot be built while legacy duplicates exist."""
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.warning(f"Index on {collection} {keys} not created: {e}")
@@ -45,6 +45,10 @@ class Customer(BaseModel):
     points_balance: float = 0  # Current points balance
     points_earned: float = 0  # Total points ever earned
     points_redeemed: float = 0  # Total points ever redeemed
+    # RFM segmentation (services/customer_segments.py; refreshed nightly)
+    rfm_score: Optional[int] = None
+    rfm_segment: Optional[str] = None  # high, medium, low or none
+    last_sale_at: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class CustomerCreate(BaseModel):
@@ -137,6 +141,9 @@ class SaleItem(BaseModel):
     quantity: int
     price: float
     subtotal: float
+    cost_price: Optional[float] = None  # Unit cost snapshot taken at sale time
+    category: Optional[str] = None  # Inventory type snapshot taken at sale time
+    tax: Optional[float] = None  # Tax charged on this line at sale time (0 when exempt)
 
 class Sale(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -168,6 +175,13 @@ class SaleCreate(BaseModel):
     coupon_code: Optional[str] = None
     points_to_use: float = 0  # Points customer wants to redeem
     created_by: str
+    register_id: Optional[str] = None  # Till taking a cash payment (defaults to "main")
+
+class SaleQuoteRequest(BaseModel):
+    items: List[SaleItem]
+    customer_id: Optional[str] = None
+    coupon_code: Optional[str] = None
+    points_to_use: float = 0
 
 class PaymentTransaction(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -324,6 +338,39 @@ class CouponUpdate(BaseModel):
     customer_id: Optional[str] = None
     customer_name: Optional[str] = None
 
+class CouponBulkCreate(BaseModel):
+    count: int  # 1-100000 coupons, each with its own random code
+    prefix: str = "PROMO"  # Codes look like PREFIX-7KQ2MX9A
+    code_length: int = 8  # Random characters after the prefix (6-16)
+    description: Optional[str] = None
+    discount_type: str
+    discount_value: float
+    min_purchase: float = 0
+    max_discount: Optional[float] = None
+    usage_limit: Optional[int] = 1
+    is_active: bool = True
+    valid_from: Optional[str] = None
+    valid_until: Optional[str] = None
+
+
+# ============ CAMPAIGN MODELS ============
+
+class CampaignCreate(BaseModel):
+    name: str
+    # Audience: RFM segment filters (see GET /customers); customers without email are skipped
+    segment: Optional[str] = None
+    min_score: Optional[int] = None
+    inactive_days: Optional[int] = None
+    # Coupon template: one single-use personalized coupon per recipient
+    discount_type: str = "percentage"  # 'percentage' or 'fixed'
+    discount_value: float
+    min_purchase: float = 0
+    max_discount: Optional[float] = None
+    valid_days: int = 30
+    code_prefix: str = "PROMO"
+    description: Optional[str] = None
+    subject: Optional[str] = None
+
 
 # ============ SUPPLIER MODELS ============
 
@@ -336,6 +383,7 @@ class Supplier(BaseModel):
     whatsapp_number: Optional[str] = None
     address: Optional[str] = None
     notes: Optional[str] = None
+    lead_time_days: Optional[int] = None  # Order-to-delivery days; used by reorder suggestions
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_by: Optional[str] = None
 
@@ -346,6 +394,7 @@ class SupplierCreate(BaseModel):
     whatsapp_number: Optional[str] = None
     address: Optional[str] = None
     notes: Optional[str] = None
+    lead_time_days: Optional[int] = None
 
 class SupplierUpdate(BaseModel):
     name: Optional[str] = None
@@ -354,6 +403,7 @@ class SupplierUpdate(BaseModel):
     whatsapp_number: Optional[str] = None
     address: Optional[str] = None
     notes: Optional[str] = None
+    lead_time_days: Optional[int] = None
 
 # ============ ACTIVATION MODELS ============
 
@@ -396,12 +446,19 @@ class CashRegisterShift(BaseModel):
     """A cash register shift (open/close)"""
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    register_id: str = "main"  # Till this shift belongs to (one open shift per register)
     opened_by: str  # User ID who opened the shift
     opened_by_name: str  # Username for display
     opening_amount: float  # Starting cash float
     closing_amount: Optional[float] = None  # Actual cash counted at close
-    expected_amount: Optional[float] = None  # Calculated expected cash
+    expected_amount: Optional[float] = None  # Expected cash (running while open, final at close)
     difference: Optional[float] = None  # closing - expected (over/short)
+    # Running totals, $inc'd as transactions are recorded (services/cash_register_service.py)
+    cash_sales: float = 0
+    payouts: float = 0
+    drops: float = 0
+    refunds: float = 0
+    transaction_count: int = 0
     status: str = "open"  # open, closed
     notes: Optional[str] = None
     opened_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -414,6 +471,7 @@ class CashRegisterTransaction(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     shift_id: str  # Links to CashRegisterShift
+    register_id: str = "main"
     transaction_type: str  # cash_sale, payout, drop, refund
     amount: float  # Positive for cash in, negative for cash out
     description: Optional[str] = None
@@ -424,15 +482,18 @@ class CashRegisterTransaction(BaseModel):
 
 class OpenShiftRequest(BaseModel):
     opening_amount: float
+    register_id: Optional[str] = None  # Defaults to "main"
 
 class CloseShiftRequest(BaseModel):
     closing_amount: float
     notes: Optional[str] = None
+    register_id: Optional[str] = None
 
 class CashTransactionRequest(BaseModel):
     transaction_type: str  # payout, drop, refund
     amount: float
     description: Optional[str] = None
+    register_id: Optional[str] = None
 
 
 class UserUpdate(BaseModel):
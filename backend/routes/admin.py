@@ -2,13 +2,22 @@
 import io
 import json
 import zipfile
+from contextlib import asynccontextmanager
+from pathlib import Path
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
 from core.config import db, logger
 from core.security import get_current_user
+from services.projections import rebuild_projections, RebuildInProgress
+from services.birthday_service import backfill_birthday_fields
+from services.jobs import job_type, submit_job, JobFile, JobQueueFull
+from services.leases import hold_lease, LeaseBusy
+from services.scheduler import scheduler_status
+from services.coupon_service import invalidate_coupons
+from services.pricing import invalidate_pricing
 
 router = APIRouter(tags=["Admin"])
 
@@ -26,34 +35,90 @@ def _json_safe(v):
     return v
 
 
-@router.get("/admin/backup")
-async def download_backup(current_user: dict = Depends(get_current_user)):
-    """Stream a ZIP containing every collection as JSON. Admin-only.
+async def _submit_admin_job(name: str, params: Optional[dict], current_user: dict, payload=None):
+    """Queue an admin operation as a background job; 202 with the job to poll."""
+    try:
+        job = await submit_job(name, params, current_user, payload=payload)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(status_code=202, content=job)
 
-    The zip is built in-memory and streamed to the browser, so it works on
-    both the cloud preview (no shell access) and the portable Windows build
-    (no mongodump binary required) with the same code path.
-    """
-    if current_user.get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can export data")
 
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for coll_name in await db.list_collection_names():
+# Per-process bookkeeping (background job status, scheduler lease/state) is neither backed up nor restored
+_TRANSIENT_COLLECTIONS = {"jobs", "scheduler_lease", "scheduler_jobs", "idempotency_keys", "leases", "projection_backlog"}
+
+# Backups, restores and migrations replace whole collections: never run two at once.
+# Jobs in the group share one slot lease across all workers (services/jobs.py) and
+# only one may be queued or running; inline runs take the same lease.
+_MAINTENANCE = {"roles": ("admin",), "group": "maintenance", "concurrency": 1, "max_active": 1}
+_MAINTENANCE_LEASE = "jobs:maintenance:0"
+
+
+@asynccontextmanager
+async def _maintenance_lock():
+    """Run an inline backup/restore/migration under the maintenance slot lease; 409 if busy."""
+    try:
+        async with hold_lease(_MAINTENANCE_LEASE):
+            yield
+    except LeaseBusy:
+        raise HTTPException(status_code=409, detail="Another backup, restore or migration is already running")
+
+
+def _backup_filename() -> str:
+    return f"techzone-backup-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.zip"
+
+
+async def _write_backup(fileobj, username: Optional[str], progress=None) -> int:
+    """Write every collection as JSON into a zip on `fileobj`. Returns documents written."""
+    total = 0
+    coll_names = [c for c in await db.list_collection_names()
+                  if c not in _TRANSIENT_COLLECTIONS and not c.endswith("__rebuild")]
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
+        for done, coll_name in enumerate(coll_names):
+            if progress:
+                await progress(done, len(coll_names), coll_name)
             docs = await db[coll_name].find({}, {"_id": 0}).to_list(length=None)
             docs = [_json_safe(d) for d in docs]
             zf.writestr(f"{coll_name}.json", json.dumps(docs, indent=2, default=str))
+            total += len(docs)
         # Manifest so a future restore tool can sanity-check the dump.
         manifest = {
             "exported_at": datetime.now(timezone.utc).isoformat(),
-            "exported_by": current_user.get("username"),
+            "exported_by": username,
             "schema_version": 1,
         }
         zf.writestr("_manifest.json", json.dumps(manifest, indent=2))
+    return total
+
+
+@job_type("backup", **_MAINTENANCE)
+async def _backup_job(ctx, params):
+    path = ctx.result_path(".zip")
+    with open(path, "wb") as fh:
+        documents = await _write_backup(fh, params.get("requested_by"), ctx.progress)
+    return JobFile(path, _backup_filename(), "application/zip", {"documents": documents})
+
+
+@router.get("/admin/backup")
+async def download_backup(background: bool = False, current_user: dict = Depends(get_current_user)):
+    """Stream a ZIP containing every collection as JSON. Admin-only.
+
+    The zip is built in-memory and streamed to the browser, so it works on
+    both the cloud preview (no shell access) and the portable Windows build
+    (no mongodump binary required) with the same code path. With
+    `?background=true` it is written by a job instead; download it from
+    GET /jobs/{id}/result.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export data")
+    if background:
+        return await _submit_admin_job("backup", {"requested_by": current_user.get("username")}, current_user)
 
+    buf = io.BytesIO()
+    async with _maintenance_lock():
+        await _write_backup(buf, current_user.get("username"))
     buf.seek(0)
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-    filename = f"techzone-backup-{ts}.zip"
+    filename = _backup_filename()
     return StreamingResponse(
         buf,
         media_type="application/zip",
@@ -67,14 +132,53 @@ async def download_backup(current_user: dict = Depends(get_current_user)):
 _PROTECTED_COLLECTIONS = {"activated_devices"}
 
 
+async def _apply_restore(parsed: Dict[str, List[Dict[str, Any]]], progress=None) -> Dict[str, Any]:
+    """Clear + bulk-insert each collection of a validated backup."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    total_restored = 0
+    for done, (coll_name, docs) in enumerate(parsed.items()):
+        if progress:
+            await progress(done, len(parsed), coll_name)
+        try:
+            if coll_name not in _PROTECTED_COLLECTIONS:
+                deleted = await db[coll_name].delete_many({})
+                deleted_count = deleted.deleted_count
+            else:
+                deleted_count = 0  # leave activated_devices intact
+            if docs:
+                await db[coll_name].insert_many(docs)
+            summary[coll_name] = {"deleted": deleted_count, "inserted": len(docs)}
+            total_restored += len(docs)
+        except Exception as e:  # pragma: no cover — defensive
+            summary[coll_name] = {"error": str(e)}
+    invalidate_coupons()
+    invalidate_pricing()
+
+    return {
+        "status": "completed",
+        "total_restored": total_restored,
+        "collections": summary,
+        "note": "You may need to sign in again — the users collection was replaced.",
+    }
+
+
+# Not submittable through POST /jobs: the backup zip arrives via /admin/restore
+@job_type("restore", public=False, **_MAINTENANCE)
+async def _restore_job(ctx, params):
+    return await _apply_restore(ctx.payload, ctx.progress)
+
+
 @router.post("/admin/restore")
 async def restore_backup(
     file: UploadFile = File(...),
+    background: bool = False,
     current_user: dict = Depends(get_current_user),
 ):
     """Replace every collection in the DB with the JSON documents in the
     uploaded backup zip. Admin-only. DESTRUCTIVE — the frontend must show a
-    confirmation dialog before calling this.
+    confirmation dialog before calling this. The zip is validated up front
+    either way; `?background=true` applies it in a job (202) instead of
+    within the request.
     """
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only admins can restore data")
@@ -88,7 +192,10 @@ async def restore_backup(
     except zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="File is not a valid zip archive")
 
-    names = [n for n in zf.namelist() if n.endswith(".json") and n != "_manifest.json"]
+    names = [
+        n for n in zf.namelist()
+        if n.endswith(".json") and n != "_manifest.json" and n[:-5] not in _TRANSIENT_COLLECTIONS
+    ]
     if not names:
         raise HTTPException(status_code=400, detail="Zip contains no collection JSON files")
 
@@ -105,51 +212,59 @@ async def restore_backup(
             raise HTTPException(status_code=400, detail=f"{n} must be a JSON array of documents")
         parsed[n[:-5]] = docs  # strip ".json"
 
-    # Apply: clear + bulk-insert per collection.
-    summary: Dict[str, Dict[str, Any]] = {}
-    total_restored = 0
-    for coll_name, docs in parsed.items():
-        try:
-            if coll_name not in _PROTECTED_COLLECTIONS:
-                deleted = await db[coll_name].delete_many({})
-                deleted_count = deleted.deleted_count
-            else:
-                deleted_count = 0  # leave activated_devices intact
-            if docs:
-                await db[coll_name].insert_many(docs)
-            summary[coll_name] = {"deleted": deleted_count, "inserted": len(docs)}
-            total_restored += len(docs)
-        except Exception as e:  # pragma: no cover — defensive
-            summary[coll_name] = {"error": str(e)}
+    if background:
+        params = {"filename": file.filename, "collections": sorted(parsed)}
+        return await _submit_admin_job("restore", params, current_user, payload=parsed)
+    async with _maintenance_lock():
+        return await _apply_restore(parsed)
 
-    return {
-        "status": "completed",
-        "total_restored": total_restored,
-        "collections": summary,
-        "note": "You may need to sign in again — the users collection was replaced.",
-    }
 
+@job_type("rebuild_projections", roles=("admin",), max_active=2)
+async def _rebuild_projections_job(ctx, params):
+    return {"status": "completed", "rebuilt": await rebuild_projections(params.get("names") or None, ctx.progress)}
 
-@router.post("/admin/migrate-data")
-async def migrate_data(current_user: dict = Depends(get_current_user)):
-    # Only admins can run migration
-    if current_user.get('role') != 'admin':
-        raise HTTPException(status_code=403, detail="Only admins can run migrations")
-    
-    from pathlib import Path
-    import json
-    
-    migration_dir = Path(__file__).parent.parent / "migration_data"
-    
-    if not migration_dir.exists():
-        raise HTTPException(status_code=500, detail="Migration data directory not found")
-    
+
+@router.post("/admin/rebuild-projections")
+async def rebuild_read_models(
+    data: Optional[dict] = None,
+    background: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """Recompute the sale-derived projections (customer stats, …) from the sales
+    collection. Admin-only. Optional body: {"names": ["customer_stats"]}.
+    `?background=true` runs it as a job (202).
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can rebuild projections")
+    names = (data or {}).get("names") or None
+    if background:
+        return await _submit_admin_job("rebuild_projections", {"names": names}, current_user)
+    try:
+        return {"status": "completed", "rebuilt": await rebuild_projections(names)}
+    except RebuildInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/admin/scheduler")
+async def get_scheduler_status(current_user: dict = Depends(get_current_user)):
+    """Leader lease and per-job schedule (next/last run, outcome, recent durations). Admin-only."""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view the scheduler")
+    return await scheduler_status()
+
+
+_MIGRATION_DIR = Path(__file__).parent.parent / "migration_data"
+
+
+async def _run_migration(progress=None) -> Dict[str, Any]:
     collections = ['users', 'customers', 'inventory', 'sales', 'repair_jobs']
     results = {}
     total_imported = 0
     
-    for collection_name in collections:
-        json_file = migration_dir / f"{collection_name}.json"
+    for done, collection_name in enumerate(collections):
+        if progress:
+            await progress(done, len(collections), collection_name)
+        json_file = _MIGRATION_DIR / f"{collection_name}.json"
         
         if not json_file.exists():
             results[collection_name] = {"status": "skipped", "reason": "file not found"}
@@ -180,8 +295,31 @@ async def migrate_data(current_user: dict = Depends(get_current_user)):
         except Exception as e:
             results[collection_name] = {"status": "error", "message": str(e)}
     
+    await backfill_birthday_fields()
+
     return {
         "status": "completed",
         "total_imported": total_imported,
         "collections": results
     }
+
+
+@job_type("migrate_data", **_MAINTENANCE)
+async def _migrate_data_job(ctx, params):
+    if not _MIGRATION_DIR.exists():
+        raise RuntimeError("Migration data directory not found")
+    return await _run_migration(ctx.progress)
+
+
+@router.post("/admin/migrate-data")
+async def migrate_data(background: bool = False, current_user: dict = Depends(get_current_user)):
+    # Only admins can run migration
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can run migrations")
+    
+    if not _MIGRATION_DIR.exists():
+        raise HTTPException(status_code=500, detail="Migration data directory not found")
+    if background:
+        return await _submit_admin_job("migrate_data", None, current_user)
+    async with _maintenance_lock():
+        return await _run_migration()
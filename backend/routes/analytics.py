@@ -0,0 +1,85 @@
+"""Ad-hoc analytics served from the columnar Parquet snapshot (never from Mongo)."""
+import asyncio
+from datetime import datetime, timezone, timedelta, date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends
+
+from core.config import PYARROW_AVAILABLE
+from core.security import get_current_user
+from services.analytics_snapshot import (
+    export_snapshot, snapshot_status, query_margins, query_category_mix, query_hourly_heatmap,
+)
+
+router = APIRouter(tags=["Analytics"])
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Analytics snapshot unavailable: pyarrow is not installed")
+
+
+def _date_range(start_date: Optional[str], end_date: Optional[str], default_days: int = 30):
+    """Inclusive YYYY-MM-DD bounds -> half-open [start, end) dates."""
+    try:
+        end = date.fromisoformat(end_date) if end_date else datetime.now(timezone.utc).date()
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+    return start, end + timedelta(days=1)
+
+
+@router.get("/analytics/snapshot")
+async def get_snapshot_status(current_user: dict = Depends(get_current_user)):
+    return snapshot_status()
+
+
+@router.post("/analytics/snapshot")
+async def refresh_snapshot(full: bool = False, current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    _require_pyarrow()
+    return await export_snapshot(full=full)
+
+
+@router.get("/analytics/margins")
+async def get_margins(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    group_by: str = "category",
+    current_user: dict = Depends(get_current_user),
+):
+    _require_pyarrow()
+    if group_by not in ("category", "sku", "day"):
+        raise HTTPException(status_code=400, detail="group_by must be category, sku or day")
+    start, end = _date_range(start_date, end_date)
+    rows = await asyncio.to_thread(query_margins, start, end, group_by)
+    return {"start_date": start.isoformat(), "end_date": (end - timedelta(days=1)).isoformat(),
+            "group_by": group_by, "rows": rows}
+
+
+@router.get("/analytics/categories")
+async def get_category_mix(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    _require_pyarrow()
+    start, end = _date_range(start_date, end_date)
+    rows = await asyncio.to_thread(query_category_mix, start, end)
+    return {"start_date": start.isoformat(), "end_date": (end - timedelta(days=1)).isoformat(), "rows": rows}
+
+
+@router.get("/analytics/hourly-heatmap")
+async def get_hourly_heatmap(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    _require_pyarrow()
+    start, end = _date_range(start_date, end_date, default_days=90)
+    result = await asyncio.to_thread(query_hourly_heatmap, start, end)
+    return {"start_date": start.isoformat(), "end_date": (end - timedelta(days=1)).isoformat(),
+            "timezone": "UTC", **result}
@@ -0,0 +1,117 @@
+"""Marketing campaigns: segment-targeted personalized coupons sent in the background."""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends
+
+from core.config import db
+from core.security import get_current_user
+from models import CampaignCreate
+from services.campaign_service import (
+    create_campaign, start_campaign, run_campaign, count_audience, ACTIVE_STATUSES,
+)
+from services.coupon_codes import normalize_prefix
+from services.customer_segments import segment_query
+from services.jobs import job_type, cancel_job, JobQueueFull
+
+router = APIRouter(tags=["Campaigns"])
+
+
+def _require_marketing(current_user: dict):
+    if current_user.get("role") not in ("admin", "manager"):
+        raise HTTPException(status_code=403, detail="Admin/manager only")
+
+
+async def _get_campaign(campaign_id: str) -> dict:
+    campaign = await db.campaigns.find_one({"id": campaign_id}, {"_id": 0})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+
+# Submitted through POST /campaigns (and resumed at boot), never directly via POST /jobs
+@job_type("campaign", public=False, concurrency=1, max_active=20)
+async def _campaign_job(ctx, params):
+    return await run_campaign(params["campaign_id"], ctx.progress)
+
+
+@router.get("/campaigns/audience")
+async def campaign_audience(
+    segment: Optional[str] = None,
+    min_score: Optional[int] = None,
+    inactive_days: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """How many customers (with an email on file) a campaign with these filters would reach."""
+    _require_marketing(current_user)
+    filters = {"segment": segment, "min_score": min_score, "inactive_days": inactive_days}
+    try:
+        return {"recipients": await count_audience(filters)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/campaigns", status_code=202)
+async def create_and_start_campaign(data: CampaignCreate, current_user: dict = Depends(get_current_user)):
+    """Create a campaign and start sending in the background; poll GET /campaigns/{id}."""
+    _require_marketing(current_user)
+    payload = data.model_dump()
+    try:
+        segment_query(data.segment, data.min_score, data.inactive_days)
+        payload["code_prefix"] = normalize_prefix(data.code_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data.discount_type not in ("percentage", "fixed"):
+        raise HTTPException(status_code=400, detail="discount_type must be percentage or fixed")
+    if data.discount_value <= 0 or (data.discount_type == "percentage" and data.discount_value > 100):
+        raise HTTPException(status_code=400, detail="Invalid discount_value")
+    if data.valid_days < 1:
+        raise HTTPException(status_code=400, detail="valid_days must be at least 1")
+
+    campaign = await create_campaign(payload, current_user)
+    try:
+        await start_campaign(campaign["id"], current_user)
+    except JobQueueFull as e:
+        await db.campaigns.update_one({"id": campaign["id"]}, {"$set": {"status": "paused", "error": str(e)}})
+        raise HTTPException(status_code=503, detail=str(e))
+    return await _get_campaign(campaign["id"])
+
+
+@router.get("/campaigns")
+async def list_campaigns(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    _require_marketing(current_user)
+    if limit < 1 or limit > 200:
+        limit = 50
+    return await db.campaigns.find({}, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    _require_marketing(current_user)
+    return await _get_campaign(campaign_id)
+
+
+@router.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    _require_marketing(current_user)
+    campaign = await _get_campaign(campaign_id)
+    if campaign["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign['status']}")
+    # The flag stops a run on any worker between batches; cancelling stops a local one at once
+    await db.campaigns.update_one({"id": campaign_id}, {"$set": {"status": "paused", "pause_requested": True}})
+    if campaign.get("job_id"):
+        await cancel_job(campaign["job_id"])
+    return await _get_campaign(campaign_id)
+
+
+@router.post("/campaigns/{campaign_id}/resume", status_code=202)
+async def resume_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    """Continue a paused or failed campaign from where it stopped."""
+    _require_marketing(current_user)
+    campaign = await _get_campaign(campaign_id)
+    if campaign["status"] not in ("paused", "failed"):
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign['status']}")
+    try:
+        await start_campaign(campaign_id, current_user)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return await _get_campaign(campaign_id)
@@ -1,66 +1,95 @@
 """Route module extracted from server.py."""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
 from core.config import db, logger
-import io
 import uuid
-from fastapi.responses import StreamingResponse
 from core.security import get_current_user, check_not_readonly, strip_html
 from services.email_service import send_shift_report_email
 from services.shift_report_service import (
-    calculate_transaction_totals,
-    calculate_expected_cash,
     fetch_business_info,
-    build_shift_report_pdf,
     build_close_shift_email_pdf,
+    shift_report_data,
+    shift_report_filename,
+    shift_report_pin,
 )
+from services.projections import record_closed_shift, projection_marker
+from services.cash_register_service import (
+    record_transaction,
+    initial_totals,
+    compute_shift_totals,
+    stored_totals,
+    shift_totals,
+    verify_shift_totals,
+    summarize_shifts,
+    normalize_register_id,
+    forget_open_shift,
+    DEFAULT_REGISTER,
+)
+from services.pdf_renderer import pdf_response
+from services.idempotency import run_idempotent
 from models import CashRegisterShift, CashRegisterTransaction, OpenShiftRequest, CloseShiftRequest, CashTransactionRequest
 
 router = APIRouter(tags=["Cash Register"])
 
+def _register(register_id: Optional[str]) -> str:
+    try:
+        return normalize_register_id(register_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/cash-register/current")
-async def get_current_shift(current_user: dict = Depends(get_current_user)):
-    """Get the current open shift, if any"""
+async def get_current_shift(
+    register_id: str = DEFAULT_REGISTER,
+    limit: int = 100,
+    skip: int = 0,
+    current_user: dict = Depends(get_current_user),
+):
+    """Get the register's open shift, if any, with its running totals and the
+    newest transactions (paginated with limit/skip; `transactions_total` is the full count)."""
     shift = await db.cash_register_shifts.find_one(
-        {"status": "open"},
+        {"register_id": _register(register_id), "status": "open"},
         {"_id": 0}
     )
     if not shift:
         return {"shift": None, "transactions": [], "totals": {}}
-    
-    # Get all transactions for this shift
+
+    limit = max(1, min(limit, 500))
+    skip = max(0, skip)
+    running = await shift_totals(shift)
     transactions = await db.cash_register_transactions.find(
         {"shift_id": shift["id"]},
         {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
-    
-    # Calculate totals
-    cash_sales = sum(t["amount"] for t in transactions if t["transaction_type"] == "cash_sale")
-    payouts = sum(abs(t["amount"]) for t in transactions if t["transaction_type"] == "payout")
-    drops = sum(abs(t["amount"]) for t in transactions if t["transaction_type"] == "drop")
-    refunds = sum(abs(t["amount"]) for t in transactions if t["transaction_type"] == "refund")
-    
-    expected = shift["opening_amount"] + cash_sales - payouts - drops - refunds
-    
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+
     totals = {
         "opening_amount": shift["opening_amount"],
-        "cash_sales": cash_sales,
-        "payouts": payouts,
-        "drops": drops,
-        "refunds": refunds,
-        "expected_amount": expected
+        "cash_sales": running["cash_sales"],
+        "payouts": running["payouts"],
+        "drops": running["drops"],
+        "refunds": running["refunds"],
+        "expected_amount": running["expected_amount"],
+    }
+
+    return {
+        "shift": {**shift, **running},
+        "transactions": transactions,
+        "transactions_total": running["transaction_count"],
+        "limit": limit,
+        "skip": skip,
+        "totals": totals,
     }
-    
-    return {"shift": shift, "transactions": transactions, "totals": totals}
 
 @router.post("/cash-register/open")
 async def open_shift(request: OpenShiftRequest, current_user: dict = Depends(get_current_user)):
-    """Open a new cash register shift"""
+    """Open a new cash register shift on the given register"""
     check_not_readonly(current_user)
+    register_id = _register(request.register_id)
     
-    # Check if there's already an open shift
-    existing = await db.cash_register_shifts.find_one({"status": "open"})
+    # Check if there's already an open shift on this register
+    existing = await db.cash_register_shifts.find_one({"register_id": register_id, "status": "open"})
     if existing:
         raise HTTPException(status_code=400, detail="A shift is already open. Please close it first.")
     
@@ -71,13 +100,20 @@ async def open_shift(request: OpenShiftRequest, current_user: dict = Depends(get
     shift = CashRegisterShift(
         opened_by=current_user["user_id"],
         opened_by_name=username,
-        opening_amount=request.opening_amount
+        opening_amount=request.opening_amount,
+        register_id=register_id,
     )
     
     doc = shift.model_dump()
     doc["opened_at"] = doc["opened_at"].isoformat()
+    doc.update(initial_totals(request.opening_amount))
     
-    await db.cash_register_shifts.insert_one(doc)
+    try:
+        await db.cash_register_shifts.insert_one(doc)
+    except DuplicateKeyError:
+        # Another request opened this register's shift in the meantime
+        raise HTTPException(status_code=400, detail="A shift is already open. Please close it first.")
+    forget_open_shift(register_id)
     
     # Remove MongoDB's _id before returning
     doc.pop("_id", None)
@@ -86,36 +122,59 @@ async def open_shift(request: OpenShiftRequest, current_user: dict = Depends(get
 
 @router.post("/cash-register/close")
 async def close_shift(request: CloseShiftRequest, current_user: dict = Depends(get_current_user)):
-    """Close the current cash register shift"""
+    """Close the register's current cash register shift"""
     check_not_readonly(current_user)
+    register_id = _register(request.register_id)
 
-    shift = await db.cash_register_shifts.find_one({"status": "open"})
+    shift = await db.cash_register_shifts.find_one({"register_id": register_id, "status": "open"})
     if not shift:
         raise HTTPException(status_code=400, detail="No open shift found")
 
-    # Recompute totals at close
-    transactions = await db.cash_register_transactions.find({"shift_id": shift["id"]}).to_list(1000)
-    totals = calculate_transaction_totals(transactions)
-    expected = calculate_expected_cash(shift["opening_amount"], totals)
-    difference = request.closing_amount - expected
-
     user_doc = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
     username = user_doc.get("username", "Unknown") if user_doc else current_user.get("username", "Unknown")
     closed_at = datetime.now(timezone.utc)
+    marker = await projection_marker()
 
-    await db.cash_register_shifts.update_one(
-        {"id": shift["id"]},
-        {"$set": {
+    # Close first: from here on record_transaction cannot add to this shift, so
+    # the running totals on it are final. The variance is derived from them in
+    # the same update, so no reader ever sees a closed shift without it.
+    closed = await db.cash_register_shifts.find_one_and_update(
+        {"id": shift["id"], "status": "open"},
+        [{"$set": {
             "status": "closed",
             "closing_amount": request.closing_amount,
-            "expected_amount": expected,
-            "difference": difference,
-            "notes": request.notes,
-            "closed_at": closed_at.isoformat(),
-            "closed_by": current_user["user_id"],
-            "closed_by_name": username,
-        }},
+            "difference": {"$subtract": [request.closing_amount, "$expected_amount"]},
+            **{key: {"$literal": value} for key, value in {
+                "notes": request.notes,
+                "closed_at": closed_at.isoformat(),
+                "closed_by": current_user["user_id"],
+                "closed_by_name": username,
+                **marker,
+            }.items()},
+        }}],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
     )
+    forget_open_shift(register_id)
+    if not closed:
+        raise HTTPException(status_code=400, detail="No open shift found")
+    totals = stored_totals(closed)
+    if totals is None:
+        # Opened before running totals existed: aggregate them now
+        totals = await compute_shift_totals(closed)
+        await db.cash_register_shifts.update_one(
+            {"id": shift["id"]},
+            {"$set": {**totals, "difference": request.closing_amount - totals["expected_amount"]}},
+        )
+    expected = totals["expected_amount"]
+    difference = request.closing_amount - expected
+    await record_closed_shift({
+        "id": shift["id"],
+        "closed_by_name": username,
+        "closed_at": closed_at.isoformat(),
+        "difference": difference,
+        **marker,
+    })
 
     email_sent = await _maybe_send_close_shift_email(shift, totals, expected, request.closing_amount, difference, username)
 
@@ -144,7 +203,7 @@ async def _maybe_send_close_shift_email(shift, totals, expected, closing_amount,
 
     business_name = strip_html(settings.get("business_name", "TECHZONE"))
     try:
-        pdf_bytes = build_close_shift_email_pdf(business_name, shift, totals, expected, closing_amount, difference)
+        pdf_bytes = await build_close_shift_email_pdf(business_name, shift, totals, expected, closing_amount, difference)
         shift_data = {
             "opened_at": shift["opened_at"],
             "opened_by_name": shift.get("opened_by_name", "Unknown"),
@@ -160,12 +219,18 @@ async def _maybe_send_close_shift_email(shift, totals, expected, closing_amount,
         return False
 
 @router.post("/cash-register/transaction")
-async def add_cash_transaction(request: CashTransactionRequest, current_user: dict = Depends(get_current_user)):
-    """Add a cash register transaction (payout, drop, refund)"""
+async def add_cash_transaction(request: CashTransactionRequest, current_user: dict = Depends(get_current_user),
+                               idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Add a cash register transaction (payout, drop, refund) to the register's open shift"""
     check_not_readonly(current_user)
+    return await run_idempotent("cash-transaction", idempotency_key, current_user, request.model_dump(),
+                                lambda: _add_cash_transaction(request, current_user))
+
+async def _add_cash_transaction(request: CashTransactionRequest, current_user: dict):
+    register_id = _register(request.register_id)
     
     # Find open shift
-    shift = await db.cash_register_shifts.find_one({"status": "open"})
+    shift = await db.cash_register_shifts.find_one({"register_id": register_id, "status": "open"})
     if not shift:
         raise HTTPException(status_code=400, detail="No open shift. Please open a shift first.")
     
@@ -181,6 +246,7 @@ async def add_cash_transaction(request: CashTransactionRequest, current_user: di
     
     transaction = CashRegisterTransaction(
         shift_id=shift["id"],
+        register_id=register_id,
         transaction_type=request.transaction_type,
         amount=amount,
         description=request.description,
@@ -191,26 +257,37 @@ async def add_cash_transaction(request: CashTransactionRequest, current_user: di
     doc = transaction.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     
-    await db.cash_register_transactions.insert_one(doc)
-    
-    # Remove MongoDB's _id before returning
-    doc.pop("_id", None)
+    if not await record_transaction(doc):
+        raise HTTPException(status_code=400, detail="No open shift. Please open a shift first.")
     
     return {"message": "Transaction recorded", "transaction": doc}
 
 @router.get("/cash-register/history")
 async def get_shift_history(
     limit: int = 10,
+    register_id: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get recent closed shifts for history/reporting"""
+    """Get recent closed shifts for history/reporting (all registers unless one is given)"""
+    query = {"status": "closed"}
+    if register_id:
+        query["register_id"] = _register(register_id)
     shifts = await db.cash_register_shifts.find(
-        {"status": "closed"},
+        query,
         {"_id": 0}
     ).sort("closed_at", -1).limit(limit).to_list(limit)
     
     return shifts
 
+@router.get("/cash-register/registers")
+async def list_open_registers(current_user: dict = Depends(get_current_user)):
+    """Every register with an open shift, with its running totals"""
+    shifts = await db.cash_register_shifts.find({"status": "open"}, {"_id": 0}).sort("register_id", 1).to_list(None)
+    return [
+        {"register_id": shift.get("register_id", DEFAULT_REGISTER), "shift": {**shift, **await shift_totals(shift)}}
+        for shift in shifts
+    ]
+
 @router.get("/cash-register/shift/{shift_id}")
 async def get_shift_details(shift_id: str, current_user: dict = Depends(get_current_user)):
     """Get details of a specific shift including all transactions"""
@@ -218,19 +295,39 @@ async def get_shift_details(shift_id: str, current_user: dict = Depends(get_curr
     if not shift:
         raise HTTPException(status_code=404, detail="Shift not found")
     
-    transactions = await db.cash_register_transactions.find(
-        {"shift_id": shift_id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+    # Every transaction of the shift, however many (a busy shift can have thousands)
+    cursor = db.cash_register_transactions.find({"shift_id": shift_id}, {"_id": 0}).sort("created_at", -1)
+    transactions = [t async for t in cursor]
     
     return {"shift": shift, "transactions": transactions}
 
+@router.get("/cash-register/shift/{shift_id}/verify")
+async def verify_shift(shift_id: str, current_user: dict = Depends(get_current_user)):
+    """Audit a shift's running totals against its transactions."""
+    if current_user['role'] not in ('admin', 'manager'):
+        raise HTTPException(status_code=403, detail="Only admins and managers can audit shifts")
+    shift = await db.cash_register_shifts.find_one({"id": shift_id}, {"_id": 0})
+    if not shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+    return await verify_shift_totals(shift)
+
+@router.post("/cash-register/shift/{shift_id}/rebuild-totals")
+async def rebuild_shift_totals(shift_id: str, current_user: dict = Depends(get_current_user)):
+    """Overwrite a shift's running totals with ones recomputed from its transactions."""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can rebuild shift totals")
+    shift = await db.cash_register_shifts.find_one({"id": shift_id}, {"_id": 0})
+    if not shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+    return await verify_shift_totals(shift, repair=True)
+
 @router.get("/cash-register/daily-summary")
 async def get_daily_summary(
     date: Optional[str] = None,
+    register_id: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get daily summary of all shifts and transactions"""
+    """Get daily summary of all shifts and transactions (all registers unless one is given)"""
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can view daily summary")
     
@@ -246,68 +343,80 @@ async def get_daily_summary(
     start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = start_of_day + timedelta(days=1)
     
-    # Get all shifts that were opened or closed on this day
-    shifts = await db.cash_register_shifts.find({
-        "$or": [
-            {"opened_at": {"$gte": start_of_day.isoformat(), "$lt": end_of_day.isoformat()}},
-            {"closed_at": {"$gte": start_of_day.isoformat(), "$lt": end_of_day.isoformat()}}
-        ]
-    }, {"_id": 0}).to_list(100)
-    
-    # Aggregate totals
-    total_cash_sales = 0
-    total_payouts = 0
-    total_drops = 0
-    total_refunds = 0
-    total_difference = 0
-    
-    for shift in shifts:
-        transactions = await db.cash_register_transactions.find(
-            {"shift_id": shift["id"]},
-            {"_id": 0}
-        ).to_list(1000)
-        
-        for t in transactions:
-            if t["transaction_type"] == "cash_sale":
-                total_cash_sales += t["amount"]
-            elif t["transaction_type"] == "payout":
-                total_payouts += abs(t["amount"])
-            elif t["transaction_type"] == "drop":
-                total_drops += abs(t["amount"])
-            elif t["transaction_type"] == "refund":
-                total_refunds += abs(t["amount"])
-        
-        if shift.get("difference"):
-            total_difference += shift["difference"]
-    
+    shifts = await _shifts_between(start_of_day, end_of_day, register_id)
+    summary = await summarize_shifts(shifts)
+
     return {
         "date": start_of_day.strftime("%Y-%m-%d"),
         "shifts_count": len(shifts),
         "shifts": shifts,
-        "totals": {
-            "cash_sales": total_cash_sales,
-            "payouts": total_payouts,
-            "drops": total_drops,
-            "refunds": total_refunds,
-            "variance": total_difference
-        }
+        "totals": summary["totals"],
+    }
+
+async def _shifts_between(start: datetime, end: datetime, register_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Shifts opened or closed in [start, end), optionally on one register."""
+    window = {"$gte": start.isoformat(), "$lt": end.isoformat()}
+    query: Dict[str, Any] = {"$or": [{"opened_at": window}, {"closed_at": window}]}
+    if register_id:
+        query["register_id"] = _register(register_id)
+    return await db.cash_register_shifts.find(query, {"_id": 0}).sort("opened_at", 1).to_list(None)
+
+_MAX_RANGE_DAYS = 92
+
+@router.get("/cash-register/range-summary")
+async def get_range_summary(
+    start_date: str,
+    end_date: Optional[str] = None,
+    register_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Cash reconciliation over an inclusive YYYY-MM-DD range (e.g. a week):
+    overall totals plus one row per day, for all registers or one. Admin only."""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can view cash summaries")
+    try:
+        start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
+        last = datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc) if end_date else start + timedelta(days=6)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = last.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+    if (end - start).days > _MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {_MAX_RANGE_DAYS} days")
+
+    shifts = await _shifts_between(start, end, register_id)
+    summary = await summarize_shifts(shifts)
+    return {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": (end - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "shifts_count": len(shifts),
+        "totals": summary["totals"],
+        "by_day": summary["by_day"],
     }
 
 @router.get("/cash-register/report/{shift_id}")
-async def generate_shift_report(shift_id: str, current_user: dict = Depends(get_current_user)):
-    """Generate PDF report for a specific shift."""
+async def generate_shift_report(
+    shift_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """Generate PDF report for a specific shift (closed shifts are served from a permanent cache)."""
     shift = await db.cash_register_shifts.find_one({"id": shift_id}, {"_id": 0})
     if not shift:
         raise HTTPException(status_code=404, detail="Shift not found")
 
-    transactions = await db.cash_register_transactions.find(
-        {"shift_id": shift_id}, {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
-
-    pdf_bytes, filename = await build_shift_report_pdf(shift, transactions)
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    async def load_data():
+        # All of them: the report's totals are summed from this list
+        cursor = db.cash_register_transactions.find(
+            {"shift_id": shift_id},
+            {"_id": 0, "created_at": 1, "transaction_type": 1, "amount": 1, "description": 1},
+        ).sort("created_at", 1)
+        transactions = [t async for t in cursor]
+        return await shift_report_data(shift, transactions)
 
+    return await pdf_response(
+        "shift_report", load_data, shift_report_filename(shift), if_none_match,
+        pin_as=shift_report_pin(shift),
+    )
@@ -1,11 +1,17 @@
 """Route module extracted from server.py."""
+import csv
+import io
+
 from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime, timezone, timedelta
+from fastapi.responses import StreamingResponse
+from datetime import timedelta
 from typing import List, Optional, Dict, Any
 from core.config import db, logger
 from core.security import get_current_user, check_not_readonly, strip_html
 from services.email_service import send_coupon_email
-from models import Coupon, CouponCreate, CouponUpdate
+from services.coupon_codes import create_bulk_coupons, normalize_prefix, MAX_BULK_CODES
+from services.coupon_service import get_coupon as lookup_coupon, coupon_discount, invalidate_coupons, CouponError
+from models import Coupon, CouponCreate, CouponUpdate, CouponBulkCreate
 
 router = APIRouter(tags=["Coupons"])
 
@@ -51,9 +57,69 @@ async def create_coupon(coupon_data: CouponCreate, current_user: dict = Depends(
     doc = coupon.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.coupons.insert_one(doc)
+    invalidate_coupons(doc['code'])
     
     return {k: v for k, v in doc.items() if k != '_id'}
 
+_BULK_CSV_COLUMNS = ["code", "discount_type", "discount_value", "min_purchase", "max_discount",
+                     "usage_limit", "valid_from", "valid_until"]
+_BULK_CSV_FLUSH_ROWS = 5000
+
+
+def _bulk_csv_chunks(codes, template):
+    """CSV (with BOM, like the sales export) of the generated codes, a few thousand rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(_BULK_CSV_COLUMNS)
+    shared = [template.get(column) for column in _BULK_CSV_COLUMNS[1:]]
+    for offset in range(0, len(codes), _BULK_CSV_FLUSH_ROWS):
+        writer.writerows([code, *shared] for code in codes[offset:offset + _BULK_CSV_FLUSH_ROWS])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+@router.post("/coupons/bulk")
+async def create_bulk_coupons_csv(data: CouponBulkCreate, current_user: dict = Depends(get_current_user)):
+    """Generate `count` coupons with unique random codes (PREFIX-XXXXXXXX) and
+    return them as a CSV download. All share one batch_id (X-Batch-Id header)."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Only admin can create coupons")
+    if not 1 <= data.count <= MAX_BULK_CODES:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {MAX_BULK_CODES}")
+    if not 6 <= data.code_length <= 16:
+        raise HTTPException(status_code=400, detail="code_length must be between 6 and 16")
+    if data.discount_type not in ("percentage", "fixed"):
+        raise HTTPException(status_code=400, detail="discount_type must be percentage or fixed")
+    if data.discount_value <= 0 or (data.discount_type == "percentage" and data.discount_value > 100):
+        raise HTTPException(status_code=400, detail="Invalid discount_value")
+    try:
+        prefix = normalize_prefix(data.prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    template = data.model_dump(exclude={"count", "prefix", "code_length"})
+    try:
+        created = await create_bulk_coupons(template, data.count, prefix, data.code_length,
+                                            created_by=current_user.get('username'))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    invalidate_coupons()
+
+    filename = f"coupons_{prefix}_{created['batch_id'][:8]}.csv"
+    return StreamingResponse(
+        _bulk_csv_chunks(created["codes"], template),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Batch-Id": created["batch_id"],
+            "X-Coupon-Count": str(len(created["codes"])),
+        },
+    )
+
 @router.put("/coupons/{coupon_id}")
 async def update_coupon(coupon_id: str, coupon_data: CouponUpdate, current_user: dict = Depends(get_current_user)):
     if current_user.get('role') != 'admin':
@@ -70,6 +136,7 @@ async def update_coupon(coupon_id: str, coupon_data: CouponUpdate, current_user:
     result = await db.coupons.update_one({"id": coupon_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Coupon not found")
+    invalidate_coupons()  # the old code is not known here
     
     coupon = await db.coupons.find_one({"id": coupon_id}, {"_id": 0})
     return coupon
@@ -82,57 +149,22 @@ async def delete_coupon(coupon_id: str, current_user: dict = Depends(get_current
     result = await db.coupons.delete_one({"id": coupon_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Coupon not found")
+    invalidate_coupons()
     return {"message": "Coupon deleted successfully"}
 
 @router.post("/coupons/validate")
 async def validate_coupon(data: dict, current_user: dict = Depends(get_current_user)):
-    """Validate a coupon code and calculate discount"""
-    code = data.get('code', '').upper()
+    """Validate a coupon code and calculate discount (served from the coupon cache)"""
     subtotal = data.get('subtotal', 0)
     customer_id = data.get('customer_id')
 
-    coupon = await db.coupons.find_one({"code": code}, {"_id": 0})
+    coupon = await lookup_coupon(data.get('code', ''))
     if not coupon:
         raise HTTPException(status_code=404, detail="Invalid coupon code")
-    
-    if not coupon.get('is_active', False):
-        raise HTTPException(status_code=400, detail="This coupon is no longer active")
-
-    # Personalized coupon: locked to a specific customer
-    if coupon.get('customer_id'):
-        if not customer_id:
-            raise HTTPException(
-                status_code=400,
-                detail="This coupon is personalized and requires a customer at checkout",
-            )
-        if customer_id != coupon.get('customer_id'):
-            raise HTTPException(
-                status_code=400,
-                detail="This coupon is not valid for this customer",
-            )
-
-    # Check usage limit
-    if coupon.get('usage_limit') and coupon.get('usage_count', 0) >= coupon.get('usage_limit'):
-        raise HTTPException(status_code=400, detail="This coupon has reached its usage limit")
-    
-    # Check minimum purchase
-    if subtotal < coupon.get('min_purchase', 0):
-        raise HTTPException(status_code=400, detail=f"Minimum purchase of ${coupon.get('min_purchase', 0):.2f} required")
-    
-    # Check validity dates
-    now = datetime.now(timezone.utc).isoformat()
-    if coupon.get('valid_from') and now < coupon.get('valid_from'):
-        raise HTTPException(status_code=400, detail="This coupon is not yet valid")
-    if coupon.get('valid_until') and now > coupon.get('valid_until'):
-        raise HTTPException(status_code=400, detail="This coupon has expired")
-    
-    # Calculate discount
-    if coupon.get('discount_type') == 'percentage':
-        discount = subtotal * (coupon.get('discount_value', 0) / 100)
-        if coupon.get('max_discount') and discount > coupon.get('max_discount'):
-            discount = coupon.get('max_discount')
-    else:  # fixed
-        discount = min(coupon.get('discount_value', 0), subtotal)
+    try:
+        discount = coupon_discount(coupon, subtotal, customer_id)
+    except CouponError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "valid": True,
@@ -142,14 +174,12 @@ async def validate_coupon(data: dict, current_user: dict = Depends(get_current_u
 
 @router.post("/coupons/{coupon_id}/increment-usage")
 async def increment_coupon_usage(coupon_id: str, current_user: dict = Depends(get_current_user)):
-    """Increment usage count when a coupon is used in a sale"""
-    result = await db.coupons.update_one(
-        {"id": coupon_id},
-        {"$inc": {"usage_count": 1}}
-    )
-    if result.matched_count == 0:
+    """Deprecated: POST /sales redeems the coupon atomically, so this no longer
+    counts a use (doing so would double-count). Returns the current usage."""
+    coupon = await db.coupons.find_one({"id": coupon_id}, {"_id": 0, "usage_count": 1})
+    if not coupon:
         raise HTTPException(status_code=404, detail="Coupon not found")
-    return {"message": "Usage count incremented"}
+    return {"message": "Usage is recorded when the sale is created", "usage_count": coupon.get("usage_count", 0)}
 
 
 @router.post("/coupons/{coupon_id}/email-to-customer")
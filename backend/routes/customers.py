@@ -5,6 +5,9 @@ from typing import List, Optional, Dict, Any
 from core.config import db, logger
 from core.security import get_current_user, check_not_readonly
 from models import Customer, CustomerCreate
+from services.birthday_service import birthday_fields
+from services.customer_segments import segment_query, refresh_customer_segments, segment_summary
+from services.jobs import job_type
 
 router = APIRouter(tags=["Customers"])
 
@@ -46,17 +49,45 @@ async def create_customer(customer_data: CustomerCreate, current_user: dict = De
     customer = Customer(**customer_dict)
     doc = customer.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
+    doc.update(birthday_fields(doc.get('birthday')))
     await db.customers.insert_one(doc)
     return customer
 
 @router.get("/customers", response_model=List[Customer])
-async def get_customers(current_user: dict = Depends(get_current_user)):
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
+async def get_customers(
+    segment: Optional[str] = None,
+    min_score: Optional[int] = None,
+    inactive_days: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """All customers, or — with any filter — those matching the nightly RFM
+    segmentation, best score first. `inactive_days` keeps customers whose last
+    purchase is at least that many days old."""
+    try:
+        query = segment_query(segment, min_score, inactive_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = db.customers.find(query, {"_id": 0})
+    if query:
+        cursor = cursor.sort("rfm_score", -1)
+    customers = await cursor.to_list(1000)
     for customer in customers:
         if isinstance(customer['created_at'], str):
             customer['created_at'] = datetime.fromisoformat(customer['created_at'])
     return customers
 
+@job_type("customer_segments", max_active=2)
+async def _customer_segments_job(ctx, params):
+    return await refresh_customer_segments(ctx.progress)
+
+
+@router.get("/customers/segments")
+async def get_customer_segments(current_user: dict = Depends(get_current_user)):
+    """Customer counts per RFM segment and when they were last computed.
+    Recompute on demand with POST /jobs/customer_segments."""
+    return await segment_summary()
+
+
 @router.get("/customers/{customer_id}")
 async def get_customer(customer_id: str, current_user: dict = Depends(get_current_user)):
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
@@ -115,7 +146,7 @@ async def update_customer(customer_id: str, customer_data: CustomerCreate, curre
     check_not_readonly(current_user)
     result = await db.customers.update_one(
         {"id": customer_id},
-        {"$set": customer_data.model_dump()}
+        {"$set": {**customer_data.model_dump(), **birthday_fields(customer_data.birthday)}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
@@ -127,5 +158,6 @@ async def delete_customer(customer_id: str, current_user: dict = Depends(get_cur
     result = await db.customers.delete_one({"id": customer_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
+    await db.customer_stats.delete_one({"customer_id": customer_id})
     return {"message": "Customer deleted successfully"}
 
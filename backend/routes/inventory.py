@@ -4,6 +4,7 @@ from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
 from core.config import db, logger
 from core.security import get_current_user, check_not_readonly
+from services.pricing import invalidate_pricing
 from models import InventoryItem, InventoryItemCreate, InventoryItemUpdate
 
 router = APIRouter(tags=["Inventory"])
@@ -15,6 +16,7 @@ async def create_inventory_item(item_data: InventoryItemCreate, current_user: di
     doc = item.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.inventory.insert_one(doc)
+    invalidate_pricing(item.id)
     return item
 
 @router.get("/inventory", response_model=List[InventoryItem])
@@ -54,6 +56,7 @@ async def update_inventory_item(item_id: str, item_data: InventoryItemUpdate, cu
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    invalidate_pricing(item_id)
     return {"message": "Item updated successfully"}
 
 @router.delete("/inventory/{item_id}")
@@ -62,6 +65,7 @@ async def delete_inventory_item(item_id: str, current_user: dict = Depends(get_c
     result = await db.inventory.delete_one({"id": item_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    invalidate_pricing(item_id)
     return {"message": "Item deleted successfully"}
 
 @router.get("/inventory/barcode/{barcode}")
@@ -94,12 +98,16 @@ async def email_purchase_order(data: dict, current_user: dict = Depends(get_curr
     if not items:
         raise HTTPException(status_code=404, detail="No matching inventory items found")
 
-    # Compute suggested order qty: top up to 3× threshold, min 5
+    # Suggested order qty from the demand-based reorder engine; items it does not
+    # flag (or with no history) fall back to topping up to 3× threshold, min 5.
+    from services.reorder_service import build_reorder_plan
+    plan = await build_reorder_plan(item_ids=[it["id"] for it in items], include_all=True)
+    engine_qty = {row["id"]: row["suggested_order_qty"] for g in plan["suppliers"] for row in g["items"]}
     enriched = []
     for it in items:
         threshold = int(it.get("low_stock_threshold") or 10)
         qty = int(it.get("quantity") or 0)
-        suggested = max(threshold * 3 - qty, 5)
+        suggested = engine_qty.get(it["id"]) or max(threshold * 3 - qty, 5)
         enriched.append({
             "name": it.get("name"),
             "sku": it.get("sku"),
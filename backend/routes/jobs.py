@@ -0,0 +1,76 @@
+"""Background job submission, polling, results and cancellation."""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import FileResponse
+
+from core.security import get_current_user
+from services.jobs import (
+    UnknownJobType, JobQueueFull, job_spec, submit_job, get_job, list_jobs, cancel_job, job_file_path,
+)
+
+router = APIRouter(tags=["Jobs"])
+
+
+async def _load_visible_job(job_id: str, current_user: dict) -> dict:
+    job = await get_job(job_id)
+    # Someone else's job is reported as missing rather than forbidden
+    if not job or (current_user.get("role") != "admin" and job.get("created_by") != current_user.get("username")):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs/{job_type}", status_code=202)
+async def create_job(job_type: str, params: Optional[dict] = None, current_user: dict = Depends(get_current_user)):
+    """Queue a `job_type` job with the JSON body as its parameters; poll GET /jobs/{id}."""
+    try:
+        spec = job_spec(job_type)
+    except UnknownJobType as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not spec.public:
+        raise HTTPException(status_code=404, detail=f"Unknown job type: {job_type}")
+    if spec.roles and current_user.get("role") not in spec.roles:
+        raise HTTPException(status_code=403, detail="You are not allowed to run this job")
+    try:
+        return await submit_job(job_type, params, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/jobs")
+async def get_jobs(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    """Recent jobs: your own, or everyone's for admins."""
+    if limit < 1 or limit > 200:
+        limit = 50
+    username = None if current_user.get("role") == "admin" else current_user.get("username")
+    return await list_jobs(username, limit)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await _load_visible_job(job_id, current_user)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Download a file result, or return the inline JSON result of a completed job."""
+    job = await _load_visible_job(job_id, current_user)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if job.get("result_file"):
+        path = job_file_path(job)
+        if path is None:
+            raise HTTPException(status_code=410, detail="Job result has expired")
+        info = job["result_file"]
+        return FileResponse(path, media_type=info["media_type"], filename=info["filename"])
+    return {"id": job_id, "type": job["type"], "result": job.get("result")}
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await _load_visible_job(job_id, current_user)
+    if job["status"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    return await cancel_job(job_id)
@@ -1,5 +1,5 @@
 """Route module extracted from server.py."""
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Header
 from pydantic import BaseModel
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
@@ -13,12 +13,19 @@ from core.config import (
     OrdersCreateRequest, OrdersCaptureRequest, OrdersGetRequest,
 )
 from core.security import get_current_user
+from services.projections import record_completed_sale, projection_marker
+from services.idempotency import run_idempotent
 from models import Sale, PaymentTransaction, CheckoutRequest
 
 router = APIRouter(tags=["Payments"])
 
 @router.post("/payments/checkout")
-async def create_checkout_session(checkout_data: CheckoutRequest, request: Request, current_user: dict = Depends(get_current_user)):
+async def create_checkout_session(checkout_data: CheckoutRequest, request: Request, current_user: dict = Depends(get_current_user),
+                                  idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent("stripe-checkout", idempotency_key, current_user, checkout_data.model_dump(),
+                                lambda: _create_checkout_session(checkout_data))
+
+async def _create_checkout_session(checkout_data: CheckoutRequest):
     # Get sale details
     sale = await db.sales.find_one({"id": checkout_data.sale_id})
     if not sale:
@@ -70,6 +77,26 @@ async def create_checkout_session(checkout_data: CheckoutRequest, request: Reque
     
     return {"url": session.url, "session_id": session.session_id}
 
+async def _complete_sale(sale_id: str):
+    """Mark a paid sale completed. Only the call that flips it (a status poll and
+    the webhook can race) decrements inventory and updates the projections."""
+    marker = await projection_marker()
+    sale = await db.sales.find_one_and_update(
+        {"id": sale_id, "payment_status": {"$ne": "completed"}},
+        {"$set": {"payment_status": "completed", **marker}},
+        projection={"_id": 0},
+    )
+    if not sale:
+        return
+
+    # Update inventory
+    for item in sale['items']:
+        await db.inventory.update_one(
+            {"id": item['item_id']},
+            {"$inc": {"quantity": -item['quantity']}}
+        )
+    await record_completed_sale({**sale, "payment_status": "completed", **marker})
+
 @router.get("/payments/status/{session_id}")
 async def check_payment_status(session_id: str, current_user: dict = Depends(get_current_user)):
     # Initialize Stripe
@@ -92,21 +119,7 @@ async def check_payment_status(session_id: str, current_user: dict = Depends(get
                 # Update sale if payment successful
                 if checkout_status.payment_status == "paid":
                     sale_id = transaction['sale_id']
-                    sale = await db.sales.find_one({"id": sale_id})
-                    
-                    # Only update inventory once
-                    if sale and sale['payment_status'] != "completed":
-                        await db.sales.update_one(
-                            {"id": sale_id},
-                            {"$set": {"payment_status": "completed"}}
-                        )
-                        
-                        # Update inventory
-                        for item in sale['items']:
-                            await db.inventory.update_one(
-                                {"id": item['item_id']},
-                                {"$inc": {"quantity": -item['quantity']}}
-                            )
+                    await _complete_sale(sale_id)
         
         return checkout_status
     except Exception as e:
@@ -135,19 +148,7 @@ async def stripe_webhook(request: Request):
                 )
                 
                 sale_id = transaction['sale_id']
-                sale = await db.sales.find_one({"id": sale_id})
-                
-                if sale and sale['payment_status'] != "completed":
-                    await db.sales.update_one(
-                        {"id": sale_id},
-                        {"$set": {"payment_status": "completed"}}
-                    )
-                    
-                    for item in sale['items']:
-                        await db.inventory.update_one(
-                            {"id": item['item_id']},
-                            {"$inc": {"quantity": -item['quantity']}}
-                        )
+                await _complete_sale(sale_id)
         
         return {"status": "success"}
     except Exception as e:
@@ -159,7 +160,12 @@ class PayPalOrderRequest(BaseModel):
     sale_id: str
 
 @router.post("/payments/paypal/create-order")
-async def create_paypal_order(order_data: PayPalOrderRequest, current_user: dict = Depends(get_current_user)):
+async def create_paypal_order(order_data: PayPalOrderRequest, current_user: dict = Depends(get_current_user),
+                              idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent("paypal-order", idempotency_key, current_user, order_data.model_dump(),
+                                lambda: _create_paypal_order(order_data))
+
+async def _create_paypal_order(order_data: PayPalOrderRequest):
     # Get sale details
     sale = await db.sales.find_one({"id": order_data.sale_id})
     if not sale:
@@ -244,20 +250,7 @@ async def capture_paypal_order(order_id: str, current_user: dict = Depends(get_c
                 
                 # Update sale
                 sale_id = transaction['sale_id']
-                sale = await db.sales.find_one({"id": sale_id})
-                
-                if sale and sale['payment_status'] != "completed":
-                    await db.sales.update_one(
-                        {"id": sale_id},
-                        {"$set": {"payment_status": "completed"}}
-                    )
-                    
-                    # Update inventory
-                    for item in sale['items']:
-                        await db.inventory.update_one(
-                            {"id": item['item_id']},
-                            {"$inc": {"quantity": -item['quantity']}}
-                        )
+                await _complete_sale(sale_id)
         
         return {
             "status": response.result.status,
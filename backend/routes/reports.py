@@ -1,18 +1,21 @@
 """Route module extracted from server.py."""
-from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime, timezone, timedelta
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from datetime import datetime, timezone, timedelta, date
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from typing import List, Optional, Dict, Any
-from core.config import db, logger
-import io
+from core.config import db, logger, OPENPYXL_AVAILABLE
+import csv
 from fastapi.responses import StreamingResponse
 from core.security import get_current_user, strip_html
 from services.summary_service import build_summary_pdf, send_summary_email
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from services.tax_report_service import collect_tax_report_data, tax_report_filename
+from services.pdf_renderer import PdfRenderError, pdf_response
+from services.export_service import iter_sale_rows, csv_chunks, xlsx_chunks, gzip_chunks
+from services.projections import rolling_unit_counts, coupon_totals, staff_totals, margin_rows
+from services.reorder_service import build_reorder_plan
+from services.birthday_service import sent_birthday_keys
+from services.customer_scoring import parse_dt as _parse_dt, rfm_score as _rfm_score, score_customers
+from services.jobs import job_type, JobFile
 
 router = APIRouter(tags=["Reports"])
 
@@ -227,57 +230,47 @@ async def get_coupon_analytics(current_user: dict = Depends(get_current_user)):
     start_of_month = today.replace(day=1)
     month_iso = start_of_month.isoformat()
     
-    # Get all coupons
-    all_coupons = await db.coupons.find({}, {"_id": 0}).to_list(1000)
+    # Get all coupons (only the fields the report shows), indexed by code
+    all_coupons = await db.coupons.find(
+        {},
+        {"_id": 0, "code": 1, "description": 1, "discount_type": 1, "discount_value": 1,
+         "usage_count": 1, "usage_limit": 1, "is_active": 1},
+    ).to_list(None)
+    coupons_by_code = {c.get('code'): c for c in all_coupons if c.get('code')}
     
-    # Get sales with coupons this month
-    sales_with_coupons = await db.sales.find(
-        {"coupon_code": {"$ne": None}, "created_at": {"$gte": month_iso}, "payment_status": "completed"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    # Get all sales this month for comparison
-    all_sales_month = await db.sales.find(
-        {"created_at": {"$gte": month_iso}, "payment_status": "completed"},
-        {"_id": 0, "total": 1, "discount": 1, "coupon_code": 1}
-    ).to_list(1000)
-    
-    # Calculate overall stats
-    total_sales_count = len(all_sales_month)
-    sales_with_coupon_count = len([s for s in all_sales_month if s.get('coupon_code')])
-    total_discount_given = sum(s.get('discount', 0) for s in all_sales_month)
-    total_revenue = sum(s.get('total', 0) for s in all_sales_month)
-    
-    # Coupon usage breakdown
-    coupon_stats = {}
-    for sale in sales_with_coupons:
-        code = sale.get('coupon_code')
-        if code:
-            if code not in coupon_stats:
-                coupon_stats[code] = {
-                    'code': code,
-                    'usage_count': 0,
-                    'total_discount': 0,
-                    'total_revenue': 0,
-                    'avg_order_value': 0
-                }
-            coupon_stats[code]['usage_count'] += 1
-            coupon_stats[code]['total_discount'] += sale.get('discount', 0)
-            coupon_stats[code]['total_revenue'] += sale.get('total', 0)
+    # Month-wide totals in one indexed aggregation (nothing loaded into Python)
+    month_pipeline = [
+        {"$match": {"created_at": {"$gte": month_iso}, "payment_status": "completed"}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "with_coupon": {"$sum": {"$cond": [{"$ifNull": ["$coupon_code", False]}, 1, 0]}},
+            "discount": {"$sum": {"$ifNull": ["$discount", 0]}},
+            "revenue": {"$sum": {"$ifNull": ["$total", 0]}},
+        }},
+    ]
+    month_totals = (await db.sales.aggregate(month_pipeline).to_list(1) or [{}])[0]
+    total_sales_count = int(month_totals.get('count', 0))
+    sales_with_coupon_count = int(month_totals.get('with_coupon', 0))
+    total_discount_given = float(month_totals.get('discount', 0))
     
-    # Calculate averages and sort by usage
+    # Per-coupon usage for this month from the coupon_stats projection
+    per_code = await coupon_totals(start_of_month.strftime("%Y-%m"))
     coupon_breakdown = []
-    for code, stats in coupon_stats.items():
-        if stats['usage_count'] > 0:
-            stats['avg_order_value'] = stats['total_revenue'] / stats['usage_count']
-        
-        # Find coupon details
-        coupon = next((c for c in all_coupons if c.get('code') == code), None)
+    for code, row in per_code.items():
+        usage_count = int(row.get('redemptions', 0))
+        stats = {
+            'code': code,
+            'usage_count': usage_count,
+            'total_discount': float(row.get('total_discount', 0)),
+            'total_revenue': float(row.get('total_revenue', 0)),
+            'avg_order_value': float(row.get('total_revenue', 0)) / usage_count if usage_count > 0 else 0,
+        }
+        coupon = coupons_by_code.get(code)
         if coupon:
             stats['discount_type'] = coupon.get('discount_type')
             stats['discount_value'] = coupon.get('discount_value')
             stats['is_active'] = coupon.get('is_active', False)
-        
         coupon_breakdown.append(stats)
     
     # Sort by usage count (most popular first)
@@ -297,7 +290,7 @@ async def get_coupon_analytics(current_user: dict = Depends(get_current_user)):
             "sales_with_coupons": sales_with_coupon_count,
             "coupon_usage_rate": round(conversion_rate, 1),
             "total_discount_given": round(total_discount_given, 2),
-            "total_revenue_with_coupons": round(sum(s.get('total', 0) for s in sales_with_coupons), 2),
+            "total_revenue_with_coupons": round(sum(s['total_revenue'] for s in coupon_breakdown), 2),
             "avg_discount_per_sale": round(total_discount_given / sales_with_coupon_count, 2) if sales_with_coupon_count > 0 else 0,
             "month": today.strftime("%B %Y")
         },
@@ -451,207 +444,12 @@ async def get_tax_summary(current_user: dict = Depends(get_current_user)):
     }
 
 @router.get("/reports/tax-summary/pdf")
-async def export_tax_report_pdf(current_user: dict = Depends(get_current_user)):
+async def export_tax_report_pdf(
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
     """Generate PDF export of tax report"""
-    # Get tax summary data (reuse the logic)
-    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    start_of_week = today - timedelta(days=today.weekday())
-    start_of_month = today.replace(day=1)
-    
-    today_iso = today.isoformat()
-    week_iso = start_of_week.isoformat()
-    month_iso = start_of_month.isoformat()
-    
-    # Get settings
-    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0})
-    tax_enabled = settings.get('tax_enabled', False) if settings else False
-    tax_rate = settings.get('tax_rate', 0) if settings else 0
-    exempt_categories = settings.get('tax_exempt_categories', []) if settings else []
-    
-    # Get aggregated data
-    daily_pipeline = [
-        {"$match": {"created_at": {"$gte": today_iso}, "payment_status": "completed"}},
-        {"$group": {"_id": None, "total_tax": {"$sum": "$tax"}, "total_sales": {"$sum": "$subtotal"}, "transaction_count": {"$sum": 1}}}
-    ]
-    weekly_pipeline = [
-        {"$match": {"created_at": {"$gte": week_iso}, "payment_status": "completed"}},
-        {"$group": {"_id": None, "total_tax": {"$sum": "$tax"}, "total_sales": {"$sum": "$subtotal"}, "transaction_count": {"$sum": 1}}}
-    ]
-    monthly_pipeline = [
-        {"$match": {"created_at": {"$gte": month_iso}, "payment_status": "completed"}},
-        {"$group": {"_id": None, "total_tax": {"$sum": "$tax"}, "total_sales": {"$sum": "$subtotal"}, "transaction_count": {"$sum": 1}}}
-    ]
-    
-    daily_result = await db.sales.aggregate(daily_pipeline).to_list(1)
-    weekly_result = await db.sales.aggregate(weekly_pipeline).to_list(1)
-    monthly_result = await db.sales.aggregate(monthly_pipeline).to_list(1)
-    
-    # Get category breakdown
-    all_sales = await db.sales.find(
-        {"created_at": {"$gte": month_iso}, "payment_status": "completed"},
-        {"_id": 0, "items": 1}
-    ).to_list(1000)
-    
-    category_totals = {}
-    taxable_total = 0
-    exempt_total = 0
-    total_tax_collected = monthly_result[0]["total_tax"] if monthly_result else 0
-    
-    for sale in all_sales:
-        for item in sale.get('items', []):
-            inv_item = await db.inventory.find_one({"id": item.get('item_id')}, {"_id": 0, "type": 1})
-            item_type = inv_item.get('type', 'other') if inv_item else 'other'
-            item_subtotal = item.get('subtotal', 0)
-            
-            if item_type not in category_totals:
-                category_totals[item_type] = {"sales": 0, "is_exempt": False}
-            category_totals[item_type]["sales"] += item_subtotal
-            
-            is_exempt = item_type.lower() in [c.lower() for c in exempt_categories]
-            category_totals[item_type]["is_exempt"] = is_exempt
-            
-            if is_exempt:
-                exempt_total += item_subtotal
-            else:
-                taxable_total += item_subtotal
-    
-    # Create PDF
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
-    
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=24, alignment=TA_CENTER, spaceAfter=20, textColor=colors.HexColor('#1e3a8a'))
-    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=12, alignment=TA_CENTER, spaceAfter=30, textColor=colors.gray)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, spaceBefore=20, spaceAfter=10, textColor=colors.HexColor('#374151'))
-    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=11, spaceAfter=6)
-    
-    elements = []
-    
-    # Title
-    elements.append(Paragraph("TECHZONE", title_style))
-    elements.append(Paragraph("Tax Report", ParagraphStyle('ReportTitle', parent=styles['Heading2'], fontSize=18, alignment=TA_CENTER, spaceAfter=10)))
-    elements.append(Paragraph(f"Generated: {today.strftime('%B %d, %Y at %I:%M %p')}", subtitle_style))
-    
-    # Tax Configuration
-    elements.append(Paragraph("Tax Configuration", heading_style))
-    config_data = [
-        ["Status", "Enabled" if tax_enabled else "Disabled"],
-        ["Tax Rate", f"{tax_rate * 100:.1f}%"],
-        ["Exempt Categories", ", ".join(exempt_categories) if exempt_categories else "None"]
-    ]
-    config_table = Table(config_data, colWidths=[2*inch, 4*inch])
-    config_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('PADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-    ]))
-    elements.append(config_table)
-    elements.append(Spacer(1, 20))
-    
-    # Tax Collection Summary
-    elements.append(Paragraph("Tax Collection Summary", heading_style))
-    summary_data = [
-        ["Period", "Sales", "Tax Collected", "Transactions"],
-        ["Today", f"${daily_result[0]['total_sales']:.2f}" if daily_result else "$0.00", 
-         f"${daily_result[0]['total_tax']:.2f}" if daily_result else "$0.00",
-         str(daily_result[0]['transaction_count']) if daily_result else "0"],
-        ["This Week", f"${weekly_result[0]['total_sales']:.2f}" if weekly_result else "$0.00",
-         f"${weekly_result[0]['total_tax']:.2f}" if weekly_result else "$0.00",
-         str(weekly_result[0]['transaction_count']) if weekly_result else "0"],
-        [today.strftime("%B %Y"), f"${monthly_result[0]['total_sales']:.2f}" if monthly_result else "$0.00",
-         f"${monthly_result[0]['total_tax']:.2f}" if monthly_result else "$0.00",
-         str(monthly_result[0]['transaction_count']) if monthly_result else "0"],
-    ]
-    summary_table = Table(summary_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('PADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 20))
-    
-    # Taxable vs Exempt
-    elements.append(Paragraph("Taxable vs Exempt Sales (This Month)", heading_style))
-    total_sales = taxable_total + exempt_total
-    taxable_pct = (taxable_total / total_sales * 100) if total_sales > 0 else 0
-    exempt_pct = (exempt_total / total_sales * 100) if total_sales > 0 else 0
-    
-    taxable_exempt_data = [
-        ["Type", "Amount", "Percentage"],
-        ["Taxable Sales", f"${taxable_total:.2f}", f"{taxable_pct:.1f}%"],
-        ["Exempt Sales", f"${exempt_total:.2f}", f"{exempt_pct:.1f}%"],
-        ["Total", f"${total_sales:.2f}", "100%"],
-    ]
-    te_table = Table(taxable_exempt_data, colWidths=[2*inch, 2*inch, 2*inch])
-    te_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#059669')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0fdf4')),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('PADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-    ]))
-    elements.append(te_table)
-    elements.append(Spacer(1, 20))
-    
-    # Category Breakdown
-    if category_totals:
-        elements.append(Paragraph("Sales by Category (This Month)", heading_style))
-        cat_data = [["Category", "Status", "Sales", "Tax Collected"]]
-        
-        for cat, data in sorted(category_totals.items(), key=lambda x: x[1]["sales"], reverse=True):
-            status = "EXEMPT" if data["is_exempt"] else "TAXABLE"
-            tax_for_cat = 0 if data["is_exempt"] else (data["sales"] / taxable_total * total_tax_collected if taxable_total > 0 else 0)
-            cat_data.append([
-                cat.capitalize(),
-                status,
-                f"${data['sales']:.2f}",
-                f"${tax_for_cat:.2f}" if not data["is_exempt"] else "-"
-            ])
-        
-        # Total row
-        cat_data.append(["Total", "", f"${total_sales:.2f}", f"${total_tax_collected:.2f}"])
-        
-        cat_table = Table(cat_data, colWidths=[1.5*inch, 1.2*inch, 1.5*inch, 1.5*inch])
-        cat_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#eff6ff')),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('PADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-        ]))
-        elements.append(cat_table)
-    
-    # Footer
-    elements.append(Spacer(1, 40))
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, textColor=colors.gray, alignment=TA_CENTER)
-    elements.append(Paragraph("30 Giltress Street, Kingston 2, JA | 876-633-9251 / 876-843-2416", footer_style))
-    elements.append(Paragraph("This report is for internal accounting purposes.", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    filename = f"tax_report_{today.strftime('%Y%m%d')}.pdf"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return await pdf_response("tax_report", collect_tax_report_data, tax_report_filename(), if_none_match)
 
 # ============ AUTO-EMAIL SUMMARY REPORTS ============
 
@@ -701,7 +499,10 @@ async def send_summary_now(data: dict, current_user: dict = Depends(get_current_
         )
 
     start, end, label = _period_range(period)
-    pdf_bytes = await build_summary_pdf(label, start, end)
+    try:
+        pdf_bytes = await build_summary_pdf(label, start, end)
+    except PdfRenderError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     business_name = strip_html(settings.get("business_name", "TECHZONE"))
 
     sent = send_summary_email(to_email, pdf_bytes, label, start, end, business_name)
@@ -725,88 +526,51 @@ async def send_summary_now(data: dict, current_user: dict = Depends(get_current_
 
 @router.get("/reports/top-customers")
 async def top_customers(limit: int = 10, current_user: dict = Depends(get_current_user)):
-    """Return top N customers by completed-sale spend, each with an RFM-based retention score (0-100)."""
+    """Return top N customers by completed-sale spend, each with an RFM-based retention score (0-100).
+
+    Reads the `customer_stats` projection (indexed on total_spent) instead of grouping all sales.
+    """
     if limit < 1 or limit > 100:
         limit = 10
 
-    # Aggregate completed sales by customer_id
-    pipeline = [
-        {"$match": {"payment_status": "completed", "customer_id": {"$ne": None}}},
-        {"$group": {
-            "_id": "$customer_id",
-            "total_spent": {"$sum": "$total"},
-            "sales_count": {"$sum": 1},
-            "last_sale_at": {"$max": "$created_at"},
-        }},
-        {"$sort": {"total_spent": -1}},
-        {"$limit": limit},
-    ]
-    agg = await db.sales.aggregate(pipeline).to_list(limit)
+    agg = await db.customer_stats.find(
+        {"sales_count": {"$gt": 0}}, {"_id": 0}
+    ).sort("total_spent", -1).limit(limit).to_list(limit)
 
     if not agg:
         return []
 
-    customer_ids = [row["_id"] for row in agg]
+    customer_ids = [row["customer_id"] for row in agg]
     customers_cursor = db.customers.find({"id": {"$in": customer_ids}}, {"_id": 0})
     customer_map = {c["id"]: c async for c in customers_cursor}
 
-    # Normalization references for the RFM score
-    max_spent = max((float(r["total_spent"]) for r in agg), default=0) or 1
-    max_count = max((int(r["sales_count"]) for r in agg), default=0) or 1
+    # Store-wide normalization references for the RFM score (both index-backed)
+    max_spent = float(agg[0]["total_spent"]) or 1
+    top_freq = await db.customer_stats.find_one({}, {"_id": 0, "sales_count": 1}, sort=[("sales_count", -1)])
+    max_count = int((top_freq or {}).get("sales_count") or 0) or 1
     now = datetime.now(timezone.utc)
 
-    def _parse(dt):
-        if isinstance(dt, datetime):
-            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-        if isinstance(dt, str):
-            try:
-                return datetime.fromisoformat(dt.replace("Z", "+00:00"))
-            except ValueError:
-                return None
-        return None
-
     results = []
     for idx, row in enumerate(agg, start=1):
-        cust = customer_map.get(row["_id"])
+        cust = customer_map.get(row["customer_id"])
         if not cust:
             continue
 
         total_spent = float(row["total_spent"])
         sales_count = int(row["sales_count"])
-        last_sale = _parse(row["last_sale_at"])
-
-        # Recency: 0-40 pts. 0 days = 40 pts. Linearly decays to 0 at 120 days away.
-        if last_sale:
-            days_since = max((now - last_sale).days, 0)
-            recency_score = max(0.0, 40.0 * (1 - min(days_since, 120) / 120))
-        else:
-            recency_score = 0.0
-
-        # Frequency: 0-30 pts relative to the top-frequency customer in this slice
-        frequency_score = 30.0 * (sales_count / max_count)
-
-        # Monetary: 0-30 pts relative to the top-spend customer in this slice
-        monetary_score = 30.0 * (total_spent / max_spent)
-
-        retention_score = round(recency_score + frequency_score + monetary_score)
-        retention_score = max(0, min(100, retention_score))
-
-        if retention_score >= 70:
-            retention_tier = "high"
-        elif retention_score >= 40:
-            retention_tier = "medium"
-        else:
-            retention_tier = "low"
+        retention_score, retention_tier = _rfm_score(
+            total_spent, sales_count, _parse_dt(row.get("last_sale_at")), max_spent, max_count, now,
+        )
 
         results.append({
             "rank": idx,
-            "customer_id": row["_id"],
+            "customer_id": row["customer_id"],
             "name": cust.get("name", "Unknown"),
             "phone": cust.get("phone"),
             "email": cust.get("email"),
             "total_spent": total_spent,
             "sales_count": sales_count,
-            "last_sale_at": row["last_sale_at"],
+            "last_sale_at": row.get("last_sale_at"),
             "points_balance": cust.get("points_balance", 0),
             "retention_score": retention_score,
             "retention_tier": retention_tier,
@@ -829,45 +593,33 @@ async def lost_customers(
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
     cutoff_iso = cutoff.isoformat()
 
-    pipeline = [
-        {"$match": {"payment_status": "completed", "customer_id": {"$ne": None}}},
-        {"$group": {
-            "_id": "$customer_id",
-            "total_spent": {"$sum": "$total"},
-            "sales_count": {"$sum": 1},
-            "last_sale_at": {"$max": "$created_at"},
-        }},
-        {"$match": {"last_sale_at": {"$lt": cutoff_iso}}},
-        {"$sort": {"total_spent": -1}},
-        {"$limit": limit},
-    ]
-    agg = await db.sales.aggregate(pipeline).to_list(limit)
+    agg = await db.customer_stats.find(
+        {"last_sale_at": {"$lt": cutoff_iso}, "sales_count": {"$gt": 0}},
+        {"_id": 0},
+    ).sort("total_spent", -1).limit(limit).to_list(limit)
     if not agg:
         return []
 
-    customer_ids = [row["_id"] for row in agg]
+    customer_ids = [row["customer_id"] for row in agg]
     customers_cursor = db.customers.find({"id": {"$in": customer_ids}}, {"_id": 0})
     customer_map = {c["id"]: c async for c in customers_cursor}
 
     now = datetime.now(timezone.utc)
     results = []
     for row in agg:
-        cust = customer_map.get(row["_id"])
+        cust = customer_map.get(row["customer_id"])
         if not cust:
             continue
-        try:
-            last_dt = datetime.fromisoformat(str(row["last_sale_at"]).replace("Z", "+00:00"))
-            days_away = max(0, (now - last_dt).days)
-        except Exception:
-            days_away = None
+        last_dt = _parse_dt(row.get("last_sale_at"))
+        days_away = max(0, (now - last_dt).days) if last_dt else None
         results.append({
-            "customer_id": row["_id"],
+            "customer_id": row["customer_id"],
             "name": cust.get("name", "Unknown"),
             "phone": cust.get("phone"),
             "email": cust.get("email"),
             "total_spent": float(row["total_spent"]),
             "sales_count": int(row["sales_count"]),
-            "last_sale_at": row["last_sale_at"],
+            "last_sale_at": row.get("last_sale_at"),
             "days_since_last_sale": days_away,
         })
     return results
@@ -879,7 +631,11 @@ async def slow_moving(
     limit: int = 20,
     current_user: dict = Depends(get_current_user),
 ):
-    """Return in-stock inventory items whose most recent sale (if any) is older than `days` days."""
+    """Return in-stock inventory items whose most recent sale (if any) is older than `days` days.
+
+    Uses the sold counters maintained on each inventory doc (`last_sold_at`,
+    `units_sold_total`) plus rolling 7/30/90-day units from `item_sales_daily`.
+    """
     if days < 1:
         days = 90
     if limit < 1 or limit > 200:
@@ -888,79 +644,90 @@ async def slow_moving(
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
     cutoff_iso = cutoff.isoformat()
 
-    # Aggregate last-sale-at per item_id from completed sales
     pipeline = [
-        {"$match": {"payment_status": "completed"}},
-        {"$unwind": "$items"},
-        {"$group": {
-            "_id": "$items.item_id",
-            "last_sale_at": {"$max": "$created_at"},
-            "total_sold": {"$sum": "$items.quantity"},
+        {"$match": {
+            "quantity": {"$gt": 0},
+            "$or": [
+                {"last_sold_at": {"$lt": cutoff_iso}},
+                # Never sold: only "slow" once the item is older than the stale window
+                {"last_sold_at": None, "created_at": {"$not": {"$gte": cutoff_iso}}},
+            ],
         }},
+        {"$addFields": {"stock_value": {"$multiply": [
+            {"$ifNull": ["$selling_price", {"$ifNull": ["$price", 0]}]}, "$quantity",
+        ]}}},
+        # Higher-value dead stock first
+        {"$sort": {"stock_value": -1, "last_sold_at": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0}},
     ]
-    sold_rows = await db.sales.aggregate(pipeline).to_list(10000)
-    sold_map = {row["_id"]: row for row in sold_rows}
-
-    # Pull in-stock inventory (quantity > 0)
-    inv_cursor = db.inventory.find({"quantity": {"$gt": 0}}, {"_id": 0})
-    candidates = []
+    items = await db.inventory.aggregate(pipeline).to_list(limit)
+    velocity = await rolling_unit_counts([it.get("id") for it in items])
     now = datetime.now(timezone.utc)
 
-    async for item in inv_cursor:
-        item_id = item.get("id")
-        sold = sold_map.get(item_id)
-        if sold:
-            last_sale = sold.get("last_sale_at")
-            if not last_sale:
-                continue
-            # Skip items sold recently
-            if last_sale >= cutoff_iso:
-                continue
-            try:
-                last_dt = datetime.fromisoformat(str(last_sale).replace("Z", "+00:00"))
-                days_stale = max(0, (now - last_dt).days)
-            except Exception:
-                days_stale = None
-            total_sold = int(sold.get("total_sold") or 0)
-            ever_sold = True
-        else:
-            # Never sold — use created_at if present
-            created = item.get("created_at")
-            if created:
-                try:
-                    c_dt = datetime.fromisoformat(str(created).replace("Z", "+00:00"))
-                    if c_dt >= cutoff:
-                        # Item is newer than the stale window; not "slow"
-                        continue
-                    days_stale = (now - c_dt).days
-                except Exception:
-                    days_stale = None
-            else:
-                days_stale = None
-            last_sale = None
-            total_sold = 0
-            ever_sold = False
-
-        price = float(item.get("price") or 0)
+    candidates = []
+    for item in items:
+        last_sale = item.get("last_sold_at")
+        ever_sold = bool(last_sale)
+        stale_since = _parse_dt(last_sale if ever_sold else item.get("created_at"))
+        days_stale = max(0, (now - stale_since).days) if stale_since else None
+        price = float(item.get("selling_price") or item.get("price") or 0)
         qty = int(item.get("quantity") or 0)
+        units = velocity.get(item.get("id"), {})
         candidates.append({
-            "id": item_id,
+            "id": item.get("id"),
             "name": item.get("name"),
             "sku": item.get("sku"),
-            "category": item.get("category"),
+            "category": item.get("category") or item.get("type"),
             "supplier": item.get("supplier"),
             "quantity": qty,
             "price": price,
             "stock_value": round(price * qty, 2),
             "last_sale_at": last_sale,
             "days_stale": days_stale,
-            "total_sold": total_sold,
+            "total_sold": int(item.get("units_sold_total") or 0),
             "ever_sold": ever_sold,
+            "units_7d": units.get("units_7d", 0),
+            "units_30d": units.get("units_30d", 0),
+            "units_90d": units.get("units_90d", 0),
         })
+    return candidates
 
-    # Sort: stock_value desc (higher-value dead stock first)
-    candidates.sort(key=lambda c: (c["stock_value"], c["days_stale"] or 0), reverse=True)
-    return candidates[:limit]
+
+@router.get("/reports/reorder-suggestions")
+async def reorder_suggestions(
+    history_days: int = 90,
+    lead_time_days: Optional[int] = None,
+    review_days: int = 14,
+    service_level: float = 0.95,
+    supplier: Optional[str] = None,
+    include_all: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """Demand-based reorder points and suggested order quantities for the whole
+    catalogue, grouped by supplier (one entry per purchase order to draft).
+
+    `lead_time_days` overrides each supplier's configured lead time; `supplier`
+    narrows the response to one supplier (case-insensitive).
+    """
+    history_days = max(7, min(history_days, 730))
+    review_days = max(1, min(review_days, 180))
+    if lead_time_days is not None:
+        lead_time_days = max(1, min(lead_time_days, 180))
+    if not 0.5 <= service_level < 1:
+        service_level = 0.95
+
+    plan = await build_reorder_plan(
+        history_days=history_days,
+        lead_time_days=lead_time_days,
+        review_days=review_days,
+        service_level=service_level,
+        include_all=include_all,
+    )
+    if supplier:
+        wanted = supplier.strip().lower()
+        plan["suppliers"] = [g for g in plan["suppliers"] if (g["supplier"] or "").lower() == wanted]
+    return plan
 
 
 @router.get("/reports/coupon-performance")
@@ -972,25 +739,18 @@ async def coupon_performance(
     if limit < 1 or limit > 200:
         limit = 20
 
-    # Aggregate completed sales per coupon_code
-    pipeline = [
-        {"$match": {"payment_status": "completed", "coupon_code": {"$ne": None, "$exists": True}}},
-        {"$group": {
-            "_id": "$coupon_code",
-            "redemptions": {"$sum": 1},
-            "total_discount": {"$sum": "$discount"},
-            "total_revenue": {"$sum": "$total"},
-            "total_subtotal": {"$sum": "$subtotal"},
-            "last_used_at": {"$max": "$created_at"},
-        }},
-    ]
-    sale_rows = await db.sales.aggregate(pipeline).to_list(10000)
-    sale_map = {row["_id"]: row for row in sale_rows if row.get("_id")}
+    # All-time per-coupon totals from the coupon_stats projection
+    sale_map = await coupon_totals()
+
+    # Redeemed coupons are fetched by code; un-redeemed ones only fill the tail
+    redeemed = await db.coupons.find({"code": {"$in": list(sale_map)}}, {"_id": 0}).to_list(None)
+    fill = max(limit - len(redeemed), 0)
+    unredeemed = await db.coupons.find(
+        {"code": {"$nin": list(sale_map)}}, {"_id": 0}
+    ).limit(fill).to_list(fill) if fill else []
 
-    # Fetch all coupons and merge
-    coupons = await db.coupons.find({}, {"_id": 0}).to_list(1000)
     results = []
-    for cp in coupons:
+    for cp in redeemed + unredeemed:
         code = cp.get("code")
         if not code:
             continue
@@ -1041,36 +801,15 @@ async def staff_performance(
         days = 30
     if days > 365:
         days = 365
+    return await _staff_performance_rows(days)
 
-    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-    cutoff_iso = cutoff.isoformat()
 
-    # Sales aggregation per cashier (created_by)
-    sales_pipeline = [
-        {"$match": {"payment_status": "completed", "created_at": {"$gte": cutoff_iso}}},
-        {"$group": {
-            "_id": "$created_by",
-            "sales_count": {"$sum": 1},
-            "total_revenue": {"$sum": "$total"},
-            "total_subtotal": {"$sum": "$subtotal"},
-            "last_sale_at": {"$max": "$created_at"},
-        }},
-    ]
-    sales_rows = await db.sales.aggregate(sales_pipeline).to_list(10000)
-    sales_map = {row["_id"]: row for row in sales_rows if row.get("_id")}
-
-    # Shift aggregation per user (closed_by_name) — shift accuracy
-    shift_pipeline = [
-        {"$match": {"status": "closed", "closed_at": {"$gte": cutoff_iso}}},
-        {"$group": {
-            "_id": "$closed_by_name",
-            "shifts_closed": {"$sum": 1},
-            "sum_abs_variance": {"$sum": {"$abs": "$difference"}},
-            "sum_variance": {"$sum": "$difference"},
-        }},
-    ]
-    shift_rows = await db.cash_register_shifts.aggregate(shift_pipeline).to_list(1000)
-    shift_map = {row["_id"]: row for row in shift_rows if row.get("_id")}
+async def _staff_performance_rows(days: int) -> List[Dict[str, Any]]:
+    # Per-user daily buckets (sales + shift closes); cost is O(users x days), not O(sales)
+    since_day = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    totals = await staff_totals(since_day)
+    sales_map = {u: row for u, row in totals.items() if row.get("sales_count")}
+    shift_map = {u: row for u, row in totals.items() if row.get("shifts_closed")}
 
     # Union of all staff usernames appearing in either aggregation
     usernames = set(sales_map.keys()) | set(shift_map.keys())
@@ -1113,24 +852,224 @@ async def staff_performance(
     return results
 
 
+def _margin_fields(row: Dict[str, Any]) -> Dict[str, Any]:
+    revenue = float(row.get("revenue") or 0)
+    cost = float(row.get("cost") or 0)
+    profit = revenue - cost
+    return {
+        "units": int(row.get("units") or 0),
+        "revenue": round(revenue, 2),
+        "cost": round(cost, 2),
+        "gross_profit": round(profit, 2),
+        "margin_pct": round(profit / revenue * 100, 2) if revenue else 0,
+    }
+
+
+@router.get("/reports/margins")
+async def gross_margins(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    group_by: str = "sku",
+    limit: int = 100,
+    current_user: dict = Depends(get_current_user),
+):
+    """Gross profit and margin % per SKU, category or day for [start_date, end_date]
+    (inclusive UTC days; default last 30 days).
+
+    Reads the pre-summed revenue/cost buckets in `item_sales_daily`; line cost is
+    the `cost_price` snapshotted onto each sale item at checkout.
+    """
+    if current_user.get("role") not in ("admin", "manager"):
+        raise HTTPException(status_code=403, detail="Admin/manager only")
+    if group_by not in ("sku", "category", "day"):
+        raise HTTPException(status_code=400, detail="group_by must be sku, category or day")
+    if limit < 1 or limit > 1000:
+        limit = 100
+    today = datetime.now(timezone.utc).date()
+    try:
+        last = date.fromisoformat(end_date) if end_date else today
+        first = date.fromisoformat(start_date) if start_date else last - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if first > last:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+
+    rows = await margin_rows(first.isoformat(), last.isoformat(), group_by)
+    totals = _margin_fields({
+        "units": sum(r["units"] for r in rows),
+        "revenue": sum(r["revenue"] for r in rows),
+        "cost": sum(r["cost"] for r in rows),
+    })
+
+    if group_by == "day":
+        rows.sort(key=lambda r: r["day"])
+    else:
+        rows.sort(key=lambda r: (r["revenue"] or 0) - (r["cost"] or 0), reverse=True)
+        rows = rows[:limit]
+
+    names = {}
+    if group_by == "sku":
+        cursor = db.inventory.find(
+            {"id": {"$in": [r["item_id"] for r in rows]}},
+            {"_id": 0, "id": 1, "name": 1, "sku": 1, "type": 1},
+        )
+        names = {doc["id"]: doc async for doc in cursor}
+
+    key = "item_id" if group_by == "sku" else group_by
+    results = []
+    for row in rows:
+        entry = {key: row[key]}
+        if group_by == "sku":
+            inv = names.get(row["item_id"], {})
+            entry.update({"name": inv.get("name"), "sku": inv.get("sku"), "category": inv.get("type")})
+        entry.update(_margin_fields(row))
+        results.append(entry)
+
+    return {
+        "start_date": first.isoformat(),
+        "end_date": last.isoformat(),
+        "group_by": group_by,
+        "totals": totals,
+        "rows": results,
+    }
+
+
+
+@router.get("/reports/sales-heatmap")
+async def sales_heatmap(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    tz: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """7x24 matrices (weekday Monday=0 x local hour) of transactions, revenue and
+    average basket for completed sales between `from` and `to` (inclusive local
+    dates; default last 90 days). Bucketing happens in a single server-side $group."""
+    # UTC needs no tz database (the standalone Windows build may have none)
+    if not tz or tz.upper() == "UTC":
+        tz, zone = "UTC", timezone.utc
+    else:
+        try:
+            zone = ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+    today = datetime.now(zone).date()
+    try:
+        first = date.fromisoformat(from_date) if from_date else today - timedelta(days=89)
+        last = date.fromisoformat(to_date) if to_date else today
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if first > last:
+        raise HTTPException(status_code=400, detail="'from' must be on or before 'to'")
+    start = datetime.combine(first, datetime.min.time(), tzinfo=zone).astimezone(timezone.utc)
+    end = datetime.combine(last + timedelta(days=1), datetime.min.time(), tzinfo=zone).astimezone(timezone.utc)
+
+    local_date = {"date": {"$dateFromString": {"dateString": "$created_at"}}, "timezone": tz}
+    pipeline = [
+        {"$match": {"payment_status": "completed", "created_at": {"$gte": start.isoformat(), "$lt": end.isoformat()}}},
+        {"$project": {"_id": 0, "total": 1, "hour": {"$hour": local_date}, "dow": {"$dayOfWeek": local_date}}},
+        {"$group": {"_id": {"dow": "$dow", "hour": "$hour"}, "count": {"$sum": 1}, "revenue": {"$sum": "$total"}}},
+    ]
+    rows = await db.sales.aggregate(pipeline).to_list(7 * 24)
+
+    transactions = [[0] * 24 for _ in range(7)]
+    revenue = [[0.0] * 24 for _ in range(7)]
+    for row in rows:
+        weekday = (row["_id"]["dow"] + 5) % 7  # Mongo: 1=Sunday .. 7=Saturday
+        hour = row["_id"]["hour"]
+        transactions[weekday][hour] = int(row["count"])
+        revenue[weekday][hour] = round(float(row["revenue"] or 0), 2)
+    avg_basket = [
+        [round(revenue[d][h] / transactions[d][h], 2) if transactions[d][h] else 0 for h in range(24)]
+        for d in range(7)
+    ]
+    return {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "timezone": tz,
+        "weekdays": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+        "transactions": transactions,
+        "revenue": revenue,
+        "avg_basket": avg_basket,
+    }
+
+
+# ============ LINE-ITEM EXPORTS ============
 
-def _normalize_mmdd(raw):
-    """Accept 'MM-DD', 'YYYY-MM-DD', or 'MM/DD' and return canonical 'MM-DD' or None."""
-    if not raw:
-        return None
-    s = str(raw).strip().replace("/", "-")
-    if len(s) == 10 and s[4] == "-":
-        s = s[5:]
-    if len(s) != 5 or s[2] != "-":
-        return None
+def _export_range(start_date: Optional[str], end_date: Optional[str]):
+    """Inclusive YYYY-MM-DD bounds -> [start, end) datetimes; defaults to year-to-date."""
+    now = datetime.now(timezone.utc)
     try:
-        m = int(s[:2])
-        d = int(s[3:])
-        if 1 <= m <= 12 and 1 <= d <= 31:
-            return f"{m:02d}-{d:02d}"
+        start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc) if start_date \
+            else now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        end_day = datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc) if end_date \
+            else now.replace(hour=0, minute=0, second=0, microsecond=0)
     except ValueError:
-        pass
-    return None
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    end = end_day + timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+    return start, end
+
+
+_XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _export_response(chunks, media_type: str, filename: str, accept_encoding: Optional[str]):
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if "gzip" in (accept_encoding or "").lower():
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def _export_filename(start: datetime, end: datetime, ext: str) -> str:
+    return f"sales_{start.strftime('%Y%m%d')}_{(end - timedelta(days=1)).strftime('%Y%m%d')}.{ext}"
+
+
+def _check_export_access(current_user: dict, status: str):
+    if current_user.get("role") not in ("admin", "manager"):
+        raise HTTPException(status_code=403, detail="Admin/manager only")
+    if status not in ("completed", "pending", "all"):
+        raise HTTPException(status_code=400, detail="status must be completed, pending or all")
+
+
+@router.get("/reports/export/sales.csv")
+async def export_sales_csv(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: str = "completed",
+    accept_encoding: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream one CSV row per sale item for [start_date, end_date] (inclusive, UTC)."""
+    _check_export_access(current_user, status)
+    start, end = _export_range(start_date, end_date)
+    filename = _export_filename(start, end, "csv")
+    return _export_response(
+        csv_chunks(iter_sale_rows(start, end, status)), "text/csv; charset=utf-8", filename, accept_encoding,
+    )
+
+
+@router.get("/reports/export/sales.xlsx")
+async def export_sales_xlsx(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: str = "completed",
+    accept_encoding: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """Same rows as sales.csv as an Excel workbook (openpyxl write-only mode)."""
+    _check_export_access(current_user, status)
+    if not OPENPYXL_AVAILABLE:
+        raise HTTPException(status_code=503, detail="XLSX export unavailable: openpyxl is not installed")
+    start, end = _export_range(start_date, end_date)
+    filename = _export_filename(start, end, "xlsx")
+    return _export_response(
+        xlsx_chunks(iter_sale_rows(start, end, status)),
+        _XLSX_MEDIA_TYPE, filename, accept_encoding,
+    )
 
 
 @router.get("/reports/upcoming-birthdays")
@@ -1150,20 +1089,18 @@ async def upcoming_birthdays(days: int = 7, current_user: dict = Depends(get_cur
         window[f"{d.month:02d}-{d.day:02d}"] = offset
 
     customers = await db.customers.find(
-        {"birthday": {"$exists": True, "$ne": None}},
+        {"birthday_mmdd": {"$in": list(window)}},
         {"_id": 0},
-    ).to_list(10000)
+    ).to_list(None)
 
     current_year = today.year
+    sent_keys = await sent_birthday_keys([c["id"] for c in customers], current_year)
     results = []
     for c in customers:
-        mmdd = _normalize_mmdd(c.get("birthday"))
-        if not mmdd or mmdd not in window:
-            continue
+        mmdd = c["birthday_mmdd"]
         days_until = window[mmdd]
         # Check if they've already received a birthday coupon this year
-        dedupe_key = f"{c['id']}:{current_year}"
-        got_coupon = await db.birthday_coupons.find_one({"key": dedupe_key}, {"_id": 0})
+        got_coupon = f"{c['id']}:{current_year}" in sent_keys
         # Compute the actual date this year (for label)
         month, day = mmdd.split("-")
         try:
@@ -1184,3 +1121,106 @@ async def upcoming_birthdays(days: int = 7, current_user: dict = Depends(get_cur
 
     results.sort(key=lambda r: (r["days_until"], r["name"].lower()))
     return results
+
+
+# ============ BACKGROUND JOBS (POST /jobs/{type}) ============
+
+def _validate_staff_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        days = int(params.get("days", 365))
+    except (TypeError, ValueError):
+        raise ValueError("days must be an integer")
+    return {"days": max(1, min(days, 365))}
+
+
+@job_type("staff_performance", concurrency=2, max_active=5, validate=_validate_staff_job)
+async def _staff_performance_job(ctx, params):
+    return await _staff_performance_rows(params["days"])
+
+
+def _validate_export_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    fmt = params.get("format", "csv")
+    status = params.get("status", "completed")
+    if fmt not in ("csv", "xlsx"):
+        raise ValueError("format must be csv or xlsx")
+    if fmt == "xlsx" and not OPENPYXL_AVAILABLE:
+        raise ValueError("XLSX export unavailable: openpyxl is not installed")
+    if status not in ("completed", "pending", "all"):
+        raise ValueError("status must be completed, pending or all")
+    start, end = _export_range(params.get("start_date"), params.get("end_date"))
+    return {
+        "format": fmt,
+        "status": status,
+        "start_date": start.date().isoformat(),
+        "end_date": (end - timedelta(days=1)).date().isoformat(),
+    }
+
+
+@job_type("sales_export", concurrency=2, max_active=5, validate=_validate_export_job)
+async def _sales_export_job(ctx, params):
+    """Same rows as /reports/export/sales.{csv,xlsx}, written to a downloadable file."""
+    start, end = _export_range(params["start_date"], params["end_date"])
+    fmt = params["format"]
+    written = 0
+
+    async def counted(rows):
+        nonlocal written
+        async for row in rows:
+            yield row
+            written += 1
+            await ctx.progress(written, message=f"{written} rows")
+
+    rows = counted(iter_sale_rows(start, end, params["status"]))
+    chunks = csv_chunks(rows) if fmt == "csv" else xlsx_chunks(rows)
+    path = ctx.result_path(f".{fmt}")
+    with open(path, "wb") as fh:
+        async for chunk in chunks:
+            fh.write(chunk)
+    await ctx.progress(written, written, "done", force=True)
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else _XLSX_MEDIA_TYPE
+    return JobFile(path, _export_filename(start, end, fmt), media_type, {"rows": written})
+
+
+_RFM_COLUMNS = [
+    "rank", "customer_id", "name", "phone", "email", "total_spent", "sales_count",
+    "last_sale_at", "retention_score", "retention_tier",
+]
+
+
+@job_type("customer_rfm", max_active=2)
+async def _customer_rfm_job(ctx, params):
+    """Retention score for every customer with purchases, as a ranked CSV.
+
+    Scoring runs on the job CPU pool; customer details are joined 1000 at a time.
+    """
+    rows = await db.customer_stats.find(
+        {"sales_count": {"$gt": 0}},
+        {"_id": 0, "customer_id": 1, "total_spent": 1, "sales_count": 1, "last_sale_at": 1},
+    ).to_list(None)
+    await ctx.progress(0, len(rows), "scoring", force=True)
+    scored = await ctx.run_cpu(score_customers, rows, datetime.now(timezone.utc).isoformat())
+
+    tiers = {"high": 0, "medium": 0, "low": 0}
+    path = ctx.result_path(".csv")
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        fh.write("\ufeff")
+        writer = csv.writer(fh)
+        writer.writerow(_RFM_COLUMNS)
+        for offset in range(0, len(scored), 1000):
+            batch = scored[offset:offset + 1000]
+            cursor = db.customers.find(
+                {"id": {"$in": [r["customer_id"] for r in batch]}},
+                {"_id": 0, "id": 1, "name": 1, "phone": 1, "email": 1},
+            )
+            customer_map = {c["id"]: c async for c in cursor}
+            for rank, row in enumerate(batch, start=offset + 1):
+                cust = customer_map.get(row["customer_id"], {})
+                tiers[row["retention_tier"]] += 1
+                writer.writerow([
+                    rank, row["customer_id"], cust.get("name"), cust.get("phone"), cust.get("email"),
+                    float(row.get("total_spent") or 0), int(row.get("sales_count") or 0),
+                    row.get("last_sale_at"), row["retention_score"], row["retention_tier"],
+                ])
+            await ctx.progress(offset + len(batch), len(scored), "writing")
+    filename = f"customer_rfm_{datetime.now(timezone.utc).strftime('%Y%m%d')}.csv"
+    return JobFile(path, filename, "text/csv; charset=utf-8", {"customers": len(scored), "tiers": tiers})
@@ -1,103 +1,52 @@
 """Route module extracted from server.py."""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
 from core.config import db, logger
 import uuid
 from core.security import get_current_user, check_not_readonly
-from models import Sale, SaleCreate, SaleItem, PaymentTransaction, CheckoutRequest
+from services.projections import (
+    record_completed_sale, retract_completed_sale, projection_marker, projections_rebuilding,
+)
+from services.cash_register_service import record_transaction, get_open_shift, normalize_register_id
+from services.coupon_service import redeem_coupon
+from services.pricing import pricing_context, price_cart
+from services.idempotency import run_idempotent
+from models import Sale, SaleCreate, SaleQuoteRequest, SaleItem, PaymentTransaction, CheckoutRequest
 
 router = APIRouter(tags=["Sales"])
 
 @router.post("/sales", response_model=Sale)
-async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_current_user)):
+async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_current_user),
+                      idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     check_not_readonly(current_user)
+    return await run_idempotent("sales", idempotency_key, current_user, sale_data.model_dump(),
+                                lambda: _create_sale(sale_data, current_user))
+
+async def _create_sale(sale_data: SaleCreate, current_user: dict):
+    try:
+        register_id = normalize_register_id(sale_data.register_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Get tax settings
-    settings = await db.settings.find_one({"id": "app_settings"})
-    tax_rate = 0.0
-    tax_exempt_categories = []
-    if settings and settings.get('tax_enabled', False):
-        tax_rate = settings.get('tax_rate', 0.0)
-        tax_exempt_categories = settings.get('tax_exempt_categories', [])
-    
-    # Calculate totals with category-based tax exemptions
-    subtotal = sum(item.subtotal for item in sale_data.items)
-    taxable_subtotal = 0.0
-    
-    # Look up each item's type to determine if it's taxable
-    for item in sale_data.items:
-        inv_item = await db.inventory.find_one({"id": item.item_id})
-        item_type = inv_item.get('type', '') if inv_item else ''
-        # Item is taxable if its type is NOT in the exempt list
-        if item_type.lower() not in [cat.lower() for cat in tax_exempt_categories]:
-            taxable_subtotal += item.subtotal
-    
-    tax = taxable_subtotal * tax_rate
-    
-    # Handle coupon discount
-    discount = 0
-    coupon_code = None
-    coupon_id = None
-    
-    if sale_data.coupon_code:
-        coupon = await db.coupons.find_one({"code": sale_data.coupon_code.upper(), "is_active": True})
-        if coupon:
-            # Personalized coupon: must match the customer on this sale
-            if coupon.get('customer_id') and coupon.get('customer_id') != sale_data.customer_id:
-                pass  # Skip - coupon locked to another customer
-            # Validate coupon
-            elif coupon.get('usage_limit') and coupon.get('usage_count', 0) >= coupon.get('usage_limit'):
-                pass  # Skip - usage limit reached
-            elif subtotal < coupon.get('min_purchase', 0):
-                pass  # Skip - minimum not met
-            else:
-                # Calculate discount
-                if coupon.get('discount_type') == 'percentage':
-                    discount = subtotal * (coupon.get('discount_value', 0) / 100)
-                    if coupon.get('max_discount') and discount > coupon.get('max_discount'):
-                        discount = coupon.get('max_discount')
-                else:
-                    discount = min(coupon.get('discount_value', 0), subtotal)
-                
-                coupon_code = coupon.get('code')
-                coupon_id = coupon.get('id')
-                
-                # Increment usage count
-                await db.coupons.update_one({"id": coupon_id}, {"$inc": {"usage_count": 1}})
-    
-    # Handle points redemption
-    points_used = 0
-    points_discount = 0
-    points_earned = 0
     customer = None
-    
     if sale_data.customer_id:
         customer = await db.customers.find_one({"id": sale_data.customer_id})
     
-    # Check points settings
-    points_enabled = settings.get('points_enabled', False) if settings else False
-    points_per_dollar = settings.get('points_per_dollar', 0.002) if settings else 0.002  # 1 point per $500
-    points_threshold = settings.get('points_redemption_threshold', 3500) if settings else 3500
-    points_value = settings.get('points_value', 1) if settings else 1
-    
-    if points_enabled and customer:
-        customer_total_spent = customer.get('total_spent', 0)
-        customer_points = customer.get('points_balance', 0)
-        
-        # Handle points redemption if requested and eligible
-        if sale_data.points_to_use > 0 and customer_total_spent >= points_threshold:
-            # Use up to available points, but not more than sale total after other discounts
-            max_points_can_use = min(sale_data.points_to_use, customer_points)
-            max_discount_from_points = subtotal + tax - discount  # Can't discount more than remaining
-            points_discount = min(max_points_can_use * points_value, max_discount_from_points)
-            points_used = points_discount / points_value  # Actual points used
-    
-    total = subtotal + tax - discount - points_discount
-    
-    # Calculate points earned from this purchase (after all discounts applied)
-    if points_enabled and customer:
-        points_earned = total * points_per_dollar
+    context = await pricing_context()
+    settings = context.settings
+    points_enabled = context.points_enabled
+    price = await price_cart(sale_data.items, sale_data.customer_id, customer,
+                             sale_data.coupon_code, sale_data.points_to_use)
+    # Atomic: counts the coupon use only if it is still available (no over-redemption)
+    if price["coupon_id"] and not await redeem_coupon(price["coupon_id"]):
+        price = await price_cart(sale_data.items, sale_data.customer_id, customer,
+                                 None, sale_data.points_to_use)
+    
+    subtotal, tax, discount = price["subtotal"], price["tax"], price["discount"]
+    coupon_code, coupon_id = price["coupon_code"], price["coupon_id"]
+    points_used, points_discount = price["points_used"], price["points_discount"]
+    points_earned, total = price["points_earned"], price["total"]
     
     # Get customer name - prioritize the direct customer_name field over customer_id lookup
     customer_name = sale_data.customer_name
@@ -127,6 +76,8 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
     
     doc = sale.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
+    if payment_status == "completed":
+        doc.update(await projection_marker())
     await db.sales.insert_one(doc)
     
     # Update inventory quantities for completed sales
@@ -136,6 +87,7 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
                 {"id": item.item_id},
                 {"$inc": {"quantity": -item.quantity}}
             )
+        await record_completed_sale(doc)
         
         # Update customer points if applicable
         if points_enabled and customer and sale_data.customer_id:
@@ -214,6 +166,7 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
                     "days": days,
                     "send_at": send_at,
                     "status": "pending",
+                    "attempts": 0,
                     "is_first_purchase": prev_total_spent == 0,
                     "cumulative_total_spent": prev_total_spent + float(total),
                     "created_at": datetime.now(timezone.utc).isoformat(),
@@ -221,9 +174,9 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
             except Exception as _e:
                 logger.warning(f"Failed to schedule follow-up (non-fatal): {_e}")
         
-        # Record cash sale in cash register if shift is open
+        # Record cash sale in the register's cash drawer if it has an open shift
         if sale_data.payment_method == "cash":
-            open_shift = await db.cash_register_shifts.find_one({"status": "open"})
+            open_shift = await get_open_shift(register_id)
             if open_shift:
                 user_doc = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
                 username = user_doc.get("username", "Unknown") if user_doc else current_user.get("username", "Unknown")
@@ -231,6 +184,7 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
                 cash_transaction = {
                     "id": str(uuid.uuid4()),
                     "shift_id": open_shift["id"],
+                    "register_id": register_id,
                     "transaction_type": "cash_sale",
                     "amount": total,  # Positive amount for cash coming in
                     "description": f"Sale #{sale.id[:8]}",
@@ -239,10 +193,24 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
                     "created_by_name": username,
                     "created_at": datetime.now(timezone.utc).isoformat()
                 }
-                await db.cash_register_transactions.insert_one(cash_transaction)
+                if not await record_transaction(cash_transaction):
+                    # Cached shift was closed meanwhile (e.g. by another worker): look again
+                    open_shift = await get_open_shift(register_id, fresh=True)
+                    if open_shift:
+                        cash_transaction["shift_id"] = open_shift["id"]
+                        await record_transaction(cash_transaction)
     
     return sale
 
+@router.post("/sales/quote")
+async def quote_sale(quote_data: SaleQuoteRequest, current_user: dict = Depends(get_current_user)):
+    """Price a cart exactly as POST /sales would, without recording anything"""
+    customer = None
+    if quote_data.customer_id:
+        customer = await db.customers.find_one({"id": quote_data.customer_id}, {"_id": 0})
+    return await price_cart(quote_data.items, quote_data.customer_id, customer,
+                            quote_data.coupon_code, quote_data.points_to_use)
+
 @router.get("/sales", response_model=List[Sale])
 async def get_sales(current_user: dict = Depends(get_current_user)):
     sales = await db.sales.find({}, {"_id": 0}).to_list(1000)
@@ -269,11 +237,14 @@ async def delete_sale(sale_id: str, current_user: dict = Depends(get_current_use
     sale = await db.sales.find_one({"id": sale_id})
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
+    if sale.get("payment_status") == "completed" and await projections_rebuilding():
+        raise HTTPException(status_code=409, detail="Reports are being rebuilt, try again in a minute")
     
     # Delete the sale
     result = await db.sales.delete_one({"id": sale_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Failed to delete sale")
+    await retract_completed_sale(sale)
     
     return {"message": "Sale deleted successfully", "sale_id": sale_id}
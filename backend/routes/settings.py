@@ -10,6 +10,7 @@ import uuid
 from pathlib import Path
 from core.config import UPLOAD_DIR
 from core.security import get_current_user, check_not_readonly
+from services.pricing import invalidate_pricing
 from models import Settings, SettingsUpdate
 
 router = APIRouter(tags=["Settings"])
@@ -85,6 +86,7 @@ async def update_settings(settings_data: SettingsUpdate, current_user: dict = De
         {"$set": update_data},
         upsert=True
     )
+    invalidate_pricing()
     
     settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0})
     return settings
@@ -56,6 +56,7 @@ async def create_supplier(data: SupplierCreate, current_user: dict = Depends(get
         whatsapp_number=data.whatsapp_number,
         address=data.address,
         notes=data.notes,
+        lead_time_days=data.lead_time_days,
         created_by=current_user.get("username"),
     )
     doc = supplier.model_dump()
@@ -5,6 +5,7 @@ Models live in /app/backend/models.py.
 Shared config & security helpers live in /app/backend/core/.
 Email/PDF services live in /app/backend/services/.
 """
+import asyncio
 import os
 import os.path as osp
 import uuid
@@ -17,13 +18,20 @@ from starlette.middleware.cors import CORSMiddleware
 
 from core.config import db, client, logger  # noqa: F401  (imports initialize)
 from core.security import hash_password
+from core.indexes import ensure_indexes
+from services.projections import bootstrap_projections
+from services.birthday_service import backfill_birthday_fields
 from services.scheduler import start_scheduler
+from services.pdf_renderer import shutdown_renderer
+from services.jobs import recover_jobs, shutdown_jobs
+from services.campaign_service import resume_campaigns
+from services.cash_register_service import backfill_register_ids
 
 # Route modules
 from routes import (
     auth, customers, inventory, repairs, settings as settings_routes,
     activation, coupons, sales, admin, payments, reports, cash_register,
-    suppliers,
+    suppliers, analytics, jobs, campaigns,
 )
 
 app = FastAPI()
@@ -43,10 +51,13 @@ api_router.include_router(payments.router)
 api_router.include_router(reports.router)
 api_router.include_router(cash_register.router)
 api_router.include_router(suppliers.router)
+api_router.include_router(analytics.router)
+api_router.include_router(jobs.router)
+api_router.include_router(campaigns.router)
 
 app.include_router(api_router)
 
-# Attach hourly auto-summary email scheduler
+# Attach the background job scheduler (leader-elected across workers)
 start_scheduler(app)
 
 app.add_middleware(
@@ -86,9 +97,24 @@ async def startup_event():
         print(f"Startup error: {e}")
 
 
+@app.on_event("startup")
+async def startup_indexes():
+    """Create indexes, tag pre-multi-register shifts with "main", fail jobs orphaned
+    by a restart and requeue interrupted campaigns,
+    then backfill derived fields and empty read-model projections in the background."""
+    await ensure_indexes()
+    await backfill_register_ids()
+    await recover_jobs()
+    await resume_campaigns()
+    asyncio.create_task(backfill_birthday_fields())
+    asyncio.create_task(bootstrap_projections())
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    shutdown_renderer()
+    shutdown_jobs()
 
 
 # --------- Static / SPA serving for portable Windows build ---------
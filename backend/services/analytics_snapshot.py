@@ -0,0 +1,346 @@
+"""Columnar analytics snapshot: sales flattened to one row per sale item in Parquet.
+
+Heavy ad-hoc analysis (margins, hour-of-day heatmaps, category mix) should not
+scan the transactional `sales` collection that checkout writes to. A periodic
+exporter flattens completed sales and their items — denormalized with item,
+customer and cashier attributes — into Parquet files partitioned by month:
+
+    ANALYTICS_DIR/sales_items/month=YYYY-MM/part-0.parquet
+
+Files are zstd-compressed with dictionary-encoded string columns and are read
+back memory-mapped through `pyarrow.dataset`, so queries never touch Mongo.
+pyarrow is optional: without it the exporter is a no-op and the query API
+answers 503.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timezone, timedelta, date
+from typing import Any, Dict, List, Optional
+
+from core.config import db, logger, ANALYTICS_DIR, PYARROW_AVAILABLE
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+SALES_ITEMS_DIR = ANALYTICS_DIR / "sales_items"
+MANIFEST_PATH = ANALYTICS_DIR / "_manifest.json"
+_CURSOR_BATCH = 2000
+
+_COLUMNS = [
+    # name, arrow type factory (lazy so the module imports without pyarrow)
+    ("sale_id", lambda: pa.string()),
+    ("created_at", lambda: pa.timestamp("us", tz="UTC")),
+    ("day", lambda: pa.date32()),
+    ("hour", lambda: pa.int8()),
+    ("weekday", lambda: pa.int8()),  # Monday = 0
+    ("payment_method", lambda: pa.string()),
+    ("cashier", lambda: pa.string()),
+    ("cashier_role", lambda: pa.string()),
+    ("customer_id", lambda: pa.string()),
+    ("customer_name", lambda: pa.string()),
+    ("customer_type", lambda: pa.string()),
+    ("coupon_code", lambda: pa.string()),
+    ("item_id", lambda: pa.string()),
+    ("item_name", lambda: pa.string()),
+    ("sku", lambda: pa.string()),
+    ("category", lambda: pa.string()),
+    ("supplier", lambda: pa.string()),
+    ("quantity", lambda: pa.int32()),
+    ("unit_price", lambda: pa.float64()),
+    ("line_subtotal", lambda: pa.float64()),
+    ("unit_cost", lambda: pa.float64()),
+    ("line_cost", lambda: pa.float64()),
+    ("sale_subtotal", lambda: pa.float64()),
+    ("sale_tax", lambda: pa.float64()),
+    ("sale_discount", lambda: pa.float64()),
+    ("sale_total", lambda: pa.float64()),
+    ("items_in_sale", lambda: pa.int16()),
+]
+_DICTIONARY_COLUMNS = [
+    "payment_method", "cashier", "cashier_role", "customer_type", "coupon_code",
+    "category", "supplier",
+]
+
+
+def _schema():
+    return pa.schema([(name, factory()) for name, factory in _COLUMNS])
+
+
+def _parse_created_at(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def _month_bounds(month: str):
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _read_manifest() -> Dict[str, Any]:
+    try:
+        return json.loads(MANIFEST_PATH.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"exported_at": None, "months": {}}
+
+
+def _write_manifest(manifest: Dict[str, Any]):
+    ANALYTICS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, MANIFEST_PATH)
+
+
+async def _lookup_maps():
+    """Item and cashier attributes are small enough to hold as dicts for the export."""
+    items = {
+        it["id"]: it
+        async for it in db.inventory.find(
+            {}, {"_id": 0, "id": 1, "sku": 1, "type": 1, "supplier": 1, "cost_price": 1}
+        )
+        if it.get("id")
+    }
+    users = {
+        u["username"]: u.get("role")
+        async for u in db.users.find({}, {"_id": 0, "username": 1, "role": 1})
+        if u.get("username")
+    }
+    return items, users
+
+
+def _write_month(month: str, columns: Dict[str, list]) -> int:
+    """Write one month partition atomically. Runs in a worker thread."""
+    table = pa.table(columns, schema=_schema())
+    part_dir = SALES_ITEMS_DIR / f"month={month}"
+    part_dir.mkdir(parents=True, exist_ok=True)
+    tmp = part_dir / "part-0.parquet.tmp"
+    pq.write_table(
+        table, tmp,
+        compression="zstd",
+        use_dictionary=_DICTIONARY_COLUMNS,
+        row_group_size=128_000,
+    )
+    os.replace(tmp, part_dir / "part-0.parquet")
+    return table.num_rows
+
+
+async def export_month(month: str, items_map=None, users_map=None) -> int:
+    """Flatten every completed sale created in `month` ('YYYY-MM') into its partition."""
+    if items_map is None or users_map is None:
+        items_map, users_map = await _lookup_maps()
+    start, end = _month_bounds(month)
+    columns: Dict[str, list] = {name: [] for name, _ in _COLUMNS}
+    customers: Dict[str, Dict[str, Any]] = {}
+
+    cursor = db.sales.find(
+        {"payment_status": "completed", "created_at": {"$gte": start.isoformat(), "$lt": end.isoformat()}},
+        {"_id": 0},
+    ).batch_size(_CURSOR_BATCH)
+    pending: List[dict] = []
+
+    async def flush():
+        missing = {s["customer_id"] for s in pending if s.get("customer_id")} - customers.keys()
+        if missing:
+            async for c in db.customers.find(
+                {"id": {"$in": list(missing)}}, {"_id": 0, "id": 1, "name": 1, "customer_type": 1}
+            ):
+                customers[c["id"]] = c
+        for sale in pending:
+            created = _parse_created_at(sale.get("created_at"))
+            if not created:
+                continue
+            cust = customers.get(sale.get("customer_id")) or {}
+            sale_items = sale.get("items") or []
+            for line in sale_items:
+                inv = items_map.get(line.get("item_id")) or {}
+                qty = int(line.get("quantity") or 0)
+                unit_cost = line.get("cost_price")
+                if unit_cost is None:
+                    unit_cost = inv.get("cost_price")
+                unit_cost = float(unit_cost or 0)
+                row = {
+                    "sale_id": sale.get("id"),
+                    "created_at": created,
+                    "day": created.date(),
+                    "hour": created.hour,
+                    "weekday": created.weekday(),
+                    "payment_method": sale.get("payment_method"),
+                    "cashier": sale.get("created_by"),
+                    "cashier_role": users_map.get(sale.get("created_by")),
+                    "customer_id": sale.get("customer_id"),
+                    "customer_name": sale.get("customer_name") or cust.get("name"),
+                    "customer_type": cust.get("customer_type"),
+                    "coupon_code": sale.get("coupon_code"),
+                    "item_id": line.get("item_id"),
+                    "item_name": line.get("item_name"),
+                    "sku": inv.get("sku"),
+                    "category": line.get("category") or inv.get("type") or "other",
+                    "supplier": inv.get("supplier"),
+                    "quantity": qty,
+                    "unit_price": float(line.get("price") or 0),
+                    "line_subtotal": float(line.get("subtotal") or 0),
+                    "unit_cost": unit_cost,
+                    "line_cost": unit_cost * qty,
+                    "sale_subtotal": float(sale.get("subtotal") or 0),
+                    "sale_tax": float(sale.get("tax") or 0),
+                    "sale_discount": float(sale.get("discount") or 0) + float(sale.get("points_discount") or 0),
+                    "sale_total": float(sale.get("total") or 0),
+                    "items_in_sale": len(sale_items),
+                }
+                for name, value in row.items():
+                    columns[name].append(value)
+        pending.clear()
+
+    async for sale in cursor:
+        pending.append(sale)
+        if len(pending) >= _CURSOR_BATCH:
+            await flush()
+    await flush()
+    return await asyncio.to_thread(_write_month, month, columns)
+
+
+def _months_between(first: date, last: date) -> List[str]:
+    months = []
+    cur = first.replace(day=1)
+    while cur <= last:
+        months.append(cur.strftime("%Y-%m"))
+        cur = (cur + timedelta(days=32)).replace(day=1)
+    return months
+
+
+async def export_snapshot(full: bool = False) -> Dict[str, Any]:
+    """Export month partitions. Incremental runs refresh the current and previous
+    month (card payments can complete after the month rolls over); `full`
+    re-exports every month since the first completed sale."""
+    if not PYARROW_AVAILABLE:
+        logger.warning("pyarrow not installed; analytics snapshot skipped")
+        return {"exported": {}, "skipped": "pyarrow not installed"}
+
+    today = datetime.now(timezone.utc).date()
+    if full:
+        first = await db.sales.find_one(
+            {"payment_status": "completed"}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)]
+        )
+        first_dt = _parse_created_at(first.get("created_at")) if first else None
+        months = _months_between(first_dt.date() if first_dt else today, today)
+    else:
+        months = _months_between((today.replace(day=1) - timedelta(days=1)).replace(day=1), today)
+
+    items_map, users_map = await _lookup_maps()
+    manifest = _read_manifest()
+    exported = {}
+    for month in months:
+        exported[month] = await export_month(month, items_map, users_map)
+        manifest["months"][month] = {"rows": exported[month], "exported_at": datetime.now(timezone.utc).isoformat()}
+    manifest["exported_at"] = datetime.now(timezone.utc).isoformat()
+    _write_manifest(manifest)
+    logger.info(f"Analytics snapshot exported: {exported}")
+    return {"exported": exported, "exported_at": manifest["exported_at"]}
+
+
+async def maybe_export_snapshot():
+    """Scheduler hook: refresh the snapshot at most once per UTC day."""
+    if not PYARROW_AVAILABLE:
+        return
+    last = _read_manifest().get("exported_at")
+    if last and last[:10] == datetime.now(timezone.utc).date().isoformat():
+        return
+    try:
+        await export_snapshot(full=not SALES_ITEMS_DIR.exists())
+    except Exception as e:
+        logger.error(f"Analytics snapshot export failed: {e}")
+
+
+def snapshot_status() -> Dict[str, Any]:
+    manifest = _read_manifest()
+    return {
+        "available": PYARROW_AVAILABLE,
+        "exported_at": manifest.get("exported_at"),
+        "months": manifest.get("months", {}),
+        "total_rows": sum(m.get("rows", 0) for m in manifest.get("months", {}).values()),
+    }
+
+
+# ---------- Query API (runs in worker threads; never touches Mongo) ----------
+
+def _scan(start: date, end: date, columns: List[str]):
+    """Memory-mapped scan of line rows with start <= day < end."""
+    if not SALES_ITEMS_DIR.exists():
+        return pa.table({c: pa.array([], type=dict(_COLUMNS)[c]()) for c in columns})
+    dataset = ds.dataset(
+        str(SALES_ITEMS_DIR), format="parquet", partitioning="hive",
+        exclude_invalid_files=True,
+    )
+    months = [m for m in _months_between(start, end)]
+    flt = (
+        pc.field("month").isin(months)
+        & (pc.field("day") >= pa.scalar(start, pa.date32()))
+        & (pc.field("day") < pa.scalar(end, pa.date32()))
+    )
+    return dataset.to_table(columns=columns, filter=flt)
+
+
+def _margin_rows(table, keys: List[str]) -> List[Dict[str, Any]]:
+    grouped = table.group_by(keys).aggregate([
+        ("quantity", "sum"), ("line_subtotal", "sum"), ("line_cost", "sum"), ("sale_id", "count_distinct"),
+    ]).to_pylist()
+    rows = []
+    for g in grouped:
+        revenue = float(g["line_subtotal_sum"] or 0)
+        cost = float(g["line_cost_sum"] or 0)
+        row = {k: (g[k].isoformat() if isinstance(g[k], date) else g[k]) for k in keys}
+        row.update({
+            "units": int(g["quantity_sum"] or 0),
+            "orders": int(g["sale_id_count_distinct"] or 0),
+            "revenue": round(revenue, 2),
+            "cost": round(cost, 2),
+            "gross_profit": round(revenue - cost, 2),
+            "margin_pct": round((revenue - cost) / revenue * 100, 1) if revenue else None,
+        })
+        rows.append(row)
+    return rows
+
+
+def query_margins(start: date, end: date, group_by: str = "category") -> List[Dict[str, Any]]:
+    keys = {"category": ["category"], "sku": ["item_id", "sku", "item_name"], "day": ["day"]}[group_by]
+    table = _scan(start, end, keys + ["quantity", "line_subtotal", "line_cost", "sale_id"])
+    rows = _margin_rows(table, keys)
+    if group_by == "day":
+        rows.sort(key=lambda r: r["day"])
+    else:
+        rows.sort(key=lambda r: r["gross_profit"], reverse=True)
+    return rows
+
+
+def query_category_mix(start: date, end: date) -> List[Dict[str, Any]]:
+    rows = query_margins(start, end, "category")
+    total = sum(r["revenue"] for r in rows) or 1
+    for r in rows:
+        r["share_pct"] = round(r["revenue"] / total * 100, 1)
+    return rows
+
+
+def query_hourly_heatmap(start: date, end: date) -> Dict[str, Any]:
+    """7x24 matrices (weekday Monday=0 x hour UTC) of orders, line revenue and avg basket."""
+    table = _scan(start, end, ["weekday", "hour", "sale_id", "line_subtotal"])
+    grouped = table.group_by(["weekday", "hour"]).aggregate([
+        ("sale_id", "count_distinct"), ("line_subtotal", "sum"),
+    ]).to_pylist()
+    orders = [[0] * 24 for _ in range(7)]
+    revenue = [[0.0] * 24 for _ in range(7)]
+    for g in grouped:
+        orders[g["weekday"]][g["hour"]] = int(g["sale_id_count_distinct"])
+        revenue[g["weekday"]][g["hour"]] = round(float(g["line_subtotal_sum"] or 0), 2)
+    avg = [
+        [round(revenue[d][h] / orders[d][h], 2) if orders[d][h] else 0 for h in range(24)]
+        for d in range(7)
+    ]
+    return {"transactions": orders, "revenue": revenue, "avg_basket": avg}
@@ -4,12 +4,22 @@ any customer whose birthday is today.
 A `birthday_coupons` collection tracks (customer_id, year) dedupe keys so a
 customer only gets one birthday coupon per calendar year, even if the scheduler
 fires multiple times or the server restarts mid-sweep.
+
+Customers carry a normalized, indexed `birthday_mmdd` ('MM-DD') and
+`birthday_doy` (day of year in a leap year, 1-366) written alongside the raw
+`birthday`, so birthday windows are an indexed `$in` instead of a full scan.
 """
+import asyncio
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone, timedelta, date
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from core.config import db, logger
 from core.security import strip_html
+from services.coupon_codes import insert_with_unique_codes
+from services.coupon_service import invalidate_coupons
 from services.email_service import send_coupon_email
 
 
@@ -37,6 +47,50 @@ def _normalize_mmdd(raw: str):
     return None
 
 
+def birthday_fields(raw) -> dict:
+    """Derived fields to store next to a customer's raw `birthday`."""
+    mmdd = _normalize_mmdd(raw)
+    doy = None
+    if mmdd:
+        try:
+            doy = date(2000, int(mmdd[:2]), int(mmdd[3:])).timetuple().tm_yday
+        except ValueError:  # e.g. '02-31'
+            doy = None
+    return {"birthday_mmdd": mmdd, "birthday_doy": doy}
+
+
+async def backfill_birthday_fields() -> int:
+    """Populate `birthday_mmdd`/`birthday_doy` on customers written before they
+    existed (or imported in bulk). Returns the number of customers updated."""
+    ops = []
+    updated = 0
+    cursor = db.customers.find(
+        {"birthday": {"$nin": [None, ""]}, "birthday_mmdd": {"$exists": False}},
+        {"_id": 0, "id": 1, "birthday": 1},
+    )
+    async for c in cursor:
+        ops.append(UpdateOne({"id": c["id"]}, {"$set": birthday_fields(c.get("birthday"))}))
+        if len(ops) >= 1000:
+            await db.customers.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.customers.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    if updated:
+        logger.info(f"Birthday fields backfilled on {updated} customer(s).")
+    return updated
+
+
+async def sent_birthday_keys(customer_ids, year: int) -> set:
+    """Dedupe keys ('<customer_id>:<year>') already issued, in one `$in` lookup."""
+    keys = [f"{cid}:{year}" for cid in customer_ids]
+    if not keys:
+        return set()
+    rows = await db.birthday_coupons.find({"key": {"$in": keys}}, {"_id": 0, "key": 1}).to_list(None)
+    return {r["key"] for r in rows}
+
+
 async def process_birthday_coupons():
     """Generate + email one personalized coupon per customer whose birthday is today.
 
@@ -57,28 +111,23 @@ async def process_birthday_coupons():
     valid_days = int(settings.get("birthday_valid_days") or 14) or 14
     business_name = strip_html(settings.get("business_name", "TECHZONE"))
 
+    # Customers imported/edited outside the API may still lack birthday_mmdd
+    await backfill_birthday_fields()
     customers = await db.customers.find(
-        {"birthday": {"$exists": True, "$ne": None}},
-        {"_id": 0},
-    ).to_list(10000)
-
-    created = 0
+        {"birthday_mmdd": today_mmdd},
+        {"_id": 0, "id": 1, "name": 1, "email": 1},
+    ).to_list(None)
+    already = await sent_birthday_keys([c["id"] for c in customers], today_year)
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+    valid_until = (datetime.now(timezone.utc) + timedelta(days=valid_days)).isoformat()
+    pending = []  # (customer, coupon_doc, dedupe_key)
     for c in customers:
-        mmdd = _normalize_mmdd(c.get("birthday"))
-        if not mmdd or mmdd != today_mmdd:
-            continue
-
-        # Dedupe per customer per year
         dedupe_key = f"{c['id']}:{today_year}"
-        already = await db.birthday_coupons.find_one({"key": dedupe_key})
-        if already:
+        if dedupe_key in already:
             continue
-
-        code = f"BDAY-{c['id'][:4].upper()}-{today_year}"
-        valid_until = (datetime.now(timezone.utc) + timedelta(days=valid_days)).isoformat()
         coupon_doc = {
             "id": str(uuid.uuid4()),
-            "code": code,
             "description": f"Happy Birthday from {business_name}! Your personal {int(discount_percent)}% off.",
             "discount_type": "percentage",
             "discount_value": discount_percent,
@@ -87,36 +136,49 @@ async def process_birthday_coupons():
             "usage_limit": 1,
             "usage_count": 0,
             "is_active": True,
-            "valid_from": datetime.now(timezone.utc).isoformat(),
+            "valid_from": now_iso,
             "valid_until": valid_until,
             "customer_id": c["id"],
             "customer_name": c.get("name"),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": now_iso,
             "created_by": "birthday-scheduler",
             "source": "birthday",
         }
+        pending.append((c, coupon_doc, dedupe_key))
 
-        # Insert coupon; if unique code collides (same customer retriggered), skip
+    # Insert the day's coupons in one batch, each with a unique random BDAY-XXXXXXXX code
+    if pending:
         try:
-            await db.coupons.insert_one(coupon_doc)
+            await insert_with_unique_codes(db.coupons, [doc for _, doc, _ in pending], "BDAY")
         except Exception as e:
-            logger.warning(f"Birthday coupon insert skipped for {c['id']}: {e}")
-            continue
+            logger.error(f"Birthday coupon insert failed: {e}")
+            return
+        invalidate_coupons()
+    issued = pending
 
-        # Mark dedupe
-        await db.birthday_coupons.insert_one({
-            "key": dedupe_key,
-            "customer_id": c["id"],
-            "year": today_year,
-            "coupon_id": coupon_doc["id"],
-            "coupon_code": code,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-        })
-
-        # Email it if we have an email on file
+    # Mark dedupe keys in one batch (duplicate keys from a concurrent sweep are ignored)
+    if issued:
+        try:
+            await db.birthday_coupons.insert_many([
+                {
+                    "key": dedupe_key,
+                    "customer_id": c["id"],
+                    "year": today_year,
+                    "coupon_id": doc["id"],
+                    "coupon_code": doc["code"],
+                    "created_at": now_iso,
+                }
+                for c, doc, dedupe_key in issued
+            ], ordered=False)
+        except BulkWriteError as e:
+            logger.warning(f"Birthday dedupe markers partially skipped: {len(e.details.get('writeErrors', []))}")
+
+    # Email each coupon if we have an email on file
+    for c, coupon_doc, _ in issued:
         if c.get("email"):
             try:
-                send_coupon_email(
+                await asyncio.to_thread(
+                    send_coupon_email,
                     to_email=c["email"],
                     customer_name=c.get("name", "Valued Customer"),
                     coupon=coupon_doc,
@@ -124,8 +186,7 @@ async def process_birthday_coupons():
                 )
             except Exception as e:
                 logger.warning(f"Birthday coupon email failed for {c.get('email')}: {e}")
-
-        created += 1
+    created = len(issued)
 
     # Mark the daily run so we don't resweep in the same UTC day
     await db.settings.update_one(
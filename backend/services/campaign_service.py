@@ -0,0 +1,429 @@
+"""Marketing campaigns: a personalized coupon emailed to every customer in a segment.
+
+A campaign runs as a background job (services/jobs.py) through three
+resumable phases. The current phase is recorded on the `campaigns` document.
+
+1. recipients: customers that match the segment filter and have an email
+   are copied into `campaign_recipients`, 1000 at a time. A unique
+   (campaign_id, customer_id) index makes a re-run idempotent.
+2. coupons: each recipient without a code gets a single-use personalized
+   coupon, inserted in batches by `insert_with_unique_codes`. Coupons that an
+   interrupted run already created are found by (campaign_id, customer_id)
+   and reused.
+3. send: a batch of pending recipients is claimed (`pending` -> `sending`,
+   tagged with the run's owner) and rendered in a worker thread. Up to
+   CAMPAIGN_SMTP_CONNECTIONS sender workers deliver them over a shared
+   `SmtpPool`, throttled to CAMPAIGN_SEND_RATE messages per second. Each
+   batch's outcome is bulk-written before the next batch is claimed.
+
+A run holds the `campaign:{id}` lease (services/leases.py), so one worker at a
+time sends a given campaign; a second run waits for the first to stop.
+Pausing sets `pause_requested`, which the run checks between batches, and
+cancels the job. Resuming, or recovery after a worker died (see
+`resume_campaigns`), continues from the first unfinished phase and retries
+failed sends up to _MAX_ATTEMPTS times. Recipients a dead run had claimed go
+back to pending, so a message in flight when it died may be sent twice; none
+is skipped.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core.config import db, logger, CAMPAIGN_SEND_RATE, CAMPAIGN_SMTP_CONNECTIONS
+from core.security import strip_html
+from services.coupon_codes import insert_with_unique_codes
+from services.coupon_service import invalidate_coupons
+from services.customer_segments import segment_query
+from services.email_service import SmtpPool, build_coupon_message
+from services.jobs import submit_job, JobCancelled
+from services.leases import acquire_lease, hold_lease, new_owner, LeaseBusy
+
+_BATCH_SIZE = 1000
+_SEND_BATCH = 200
+_MAX_ATTEMPTS = 3
+_LEASE_TTL = 60
+_LEASE_POLL_SECONDS = 2.0
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all sender workers."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def _update(campaign_id: str, fields: Dict[str, Any], inc: Optional[Dict[str, int]] = None):
+    update: Dict[str, Any] = {"$set": {**fields, "updated_at": _now_iso()}}
+    if inc:
+        update["$inc"] = inc
+    await db.campaigns.update_one({"id": campaign_id}, update)
+
+
+async def _check_paused(campaign_id: str):
+    """Stop the run between batches once a pause was requested (from any worker)."""
+    campaign = await db.campaigns.find_one({"id": campaign_id}, {"_id": 0, "pause_requested": 1})
+    if campaign and campaign.get("pause_requested"):
+        raise JobCancelled("Campaign paused")
+
+
+async def create_campaign(data: Dict[str, Any], user: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a new campaign (validated by the caller) in the 'queued' state."""
+    now_iso = _now_iso()
+    doc = {
+        "id": str(uuid.uuid4()),
+        "name": data["name"],
+        "filters": {k: data.get(k) for k in ("segment", "min_score", "inactive_days")},
+        "coupon": {k: data.get(k) for k in (
+            "discount_type", "discount_value", "min_purchase", "max_discount",
+            "valid_days", "code_prefix", "description",
+        )},
+        "subject": data.get("subject"),
+        "status": "queued",
+        "pause_requested": False,
+        "phase": "recipients",
+        "counts": {"recipients": 0, "coupons": 0, "sent": 0, "failed": 0},
+        "job_id": None,
+        "error": None,
+        "created_by": user.get("username"),
+        "created_at": now_iso,
+        "updated_at": now_iso,
+        "started_at": None,
+        "finished_at": None,
+    }
+    await db.campaigns.insert_one(doc)
+    doc.pop("_id", None)
+    return doc
+
+
+async def count_audience(filters: Dict[str, Any]) -> int:
+    return await db.customers.count_documents(_audience_query(filters))
+
+
+def _audience_query(filters: Dict[str, Any]) -> Dict[str, Any]:
+    query = segment_query(filters.get("segment"), filters.get("min_score"), filters.get("inactive_days"))
+    query["email"] = {"$nin": [None, ""]}
+    return query
+
+
+async def _insert_ignoring_duplicates(collection, docs: List[Dict[str, Any]]):
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+async def _collect_recipients(campaign: Dict[str, Any], progress):
+    campaign_id = campaign["id"]
+    cursor = db.customers.find(
+        _audience_query(campaign["filters"]), {"_id": 0, "id": 1, "name": 1, "email": 1},
+    ).batch_size(_BATCH_SIZE)
+    batch, seen = [], 0
+    async for customer in cursor:
+        batch.append({
+            "campaign_id": campaign_id,
+            "customer_id": customer["id"],
+            "name": customer.get("name"),
+            "email": customer["email"],
+            "coupon_code": None,
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+        })
+        if len(batch) >= _BATCH_SIZE:
+            await _insert_ignoring_duplicates(db.campaign_recipients, batch)
+            seen += len(batch)
+            batch = []
+            if progress:
+                await progress(seen, None, "collecting recipients")
+            await _check_paused(campaign_id)
+    if batch:
+        await _insert_ignoring_duplicates(db.campaign_recipients, batch)
+    total = await db.campaign_recipients.count_documents({"campaign_id": campaign_id})
+    await _update(campaign_id, {"phase": "coupons", "counts.recipients": total})
+    campaign["counts"]["recipients"] = total
+
+
+def _coupon_doc(campaign: Dict[str, Any], recipient: Dict[str, Any], business_name: str,
+                now: datetime) -> Dict[str, Any]:
+    template = campaign["coupon"]
+    return {
+        "id": str(uuid.uuid4()),
+        "description": template.get("description") or f"A personal offer from {business_name}.",
+        "discount_type": template["discount_type"],
+        "discount_value": template["discount_value"],
+        "min_purchase": template.get("min_purchase") or 0,
+        "max_discount": template.get("max_discount"),
+        "usage_limit": 1,
+        "usage_count": 0,
+        "is_active": True,
+        "valid_from": now.isoformat(),
+        "valid_until": (now + timedelta(days=int(template.get("valid_days") or 30))).isoformat(),
+        "customer_id": recipient["customer_id"],
+        "customer_name": recipient.get("name"),
+        "created_at": now.isoformat(),
+        "created_by": campaign.get("created_by"),
+        "source": "campaign",
+        "campaign_id": campaign["id"],
+    }
+
+
+async def _issue_coupons(campaign: Dict[str, Any], business_name: str, progress):
+    campaign_id = campaign["id"]
+    prefix = campaign["coupon"]["code_prefix"]
+    seen_codes: set = set()
+    total = campaign["counts"]["recipients"]
+    done = await db.campaign_recipients.count_documents({"campaign_id": campaign_id, "coupon_code": {"$ne": None}})
+    while True:
+        batch = await db.campaign_recipients.find(
+            {"campaign_id": campaign_id, "coupon_code": None},
+            {"_id": 0, "customer_id": 1, "name": 1},
+        ).limit(_BATCH_SIZE).to_list(_BATCH_SIZE)
+        if not batch:
+            break
+        # Coupons created by an interrupted run, before its recipients were updated
+        codes = {
+            c["customer_id"]: c["code"]
+            async for c in db.coupons.find(
+                {"campaign_id": campaign_id, "customer_id": {"$in": [r["customer_id"] for r in batch]}},
+                {"_id": 0, "customer_id": 1, "code": 1},
+            )
+        }
+        now = datetime.now(timezone.utc)
+        docs = [_coupon_doc(campaign, r, business_name, now) for r in batch if r["customer_id"] not in codes]
+        if docs:
+            inserted = await insert_with_unique_codes(db.coupons, docs, prefix, seen=seen_codes)
+            codes.update({doc["customer_id"]: doc["code"] for doc in inserted})
+        await db.campaign_recipients.bulk_write([
+            UpdateOne({"campaign_id": campaign_id, "customer_id": customer_id}, {"$set": {"coupon_code": code}})
+            for customer_id, code in codes.items()
+        ], ordered=False)
+        await _update(campaign_id, {}, inc={"counts.coupons": len(docs)})
+        done += len(batch)
+        if progress:
+            await progress(done, total, "issuing coupons")
+        await _check_paused(campaign_id)
+    invalidate_coupons()
+    await _update(campaign_id, {"phase": "send"})
+
+
+def _render_batch(recipients, coupons, business_name: str, subject: Optional[str], sender: str):
+    """(email, rendered message or None) per recipient; runs in a worker thread."""
+    rendered = []
+    for r in recipients:
+        coupon = coupons.get(r.get("coupon_code"))
+        if coupon is None:
+            rendered.append((r["email"], None))
+            continue
+        msg = build_coupon_message(r["email"], r.get("name") or "Valued Customer", coupon, business_name,
+                                   sender, subject)
+        rendered.append((r["email"], msg.as_string()))
+    return rendered
+
+
+async def _deliver(rendered, pool: SmtpPool, limiter: _RateLimiter) -> List[bool]:
+    results = [False] * len(rendered)
+    work: asyncio.Queue = asyncio.Queue()
+    for item in enumerate(rendered):
+        work.put_nowait(item)
+
+    async def sender():
+        while True:
+            try:
+                i, (email, message) = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if message is None:
+                continue
+            await limiter.wait()
+            results[i] = await asyncio.to_thread(pool.send, email, message)
+
+    await asyncio.gather(*(sender() for _ in range(max(1, CAMPAIGN_SMTP_CONNECTIONS))))
+    return results
+
+
+async def _claim_batch(campaign_id: str, owner: str) -> List[Dict[str, Any]]:
+    """Move up to _SEND_BATCH pending recipients to `sending` under `owner` and return them."""
+    pending = await db.campaign_recipients.find(
+        {"campaign_id": campaign_id, "status": "pending"}, {"_id": 0, "customer_id": 1},
+    ).limit(_SEND_BATCH).to_list(_SEND_BATCH)
+    if not pending:
+        return []
+    await db.campaign_recipients.update_many(
+        {"campaign_id": campaign_id, "status": "pending",
+         "customer_id": {"$in": [r["customer_id"] for r in pending]}},
+        {"$set": {"status": "sending", "claimed_by": owner, "claimed_at": _now_iso()}},
+    )
+    return await db.campaign_recipients.find(
+        {"campaign_id": campaign_id, "status": "sending", "claimed_by": owner},
+        {"_id": 0, "customer_id": 1, "name": 1, "email": 1, "coupon_code": 1},
+    ).to_list(_SEND_BATCH)
+
+
+async def _send_all(campaign: Dict[str, Any], business_name: str, owner: str, progress):
+    campaign_id = campaign["id"]
+    pool = SmtpPool(size=max(1, CAMPAIGN_SMTP_CONNECTIONS))
+    if not pool.configured:
+        raise RuntimeError("Email is not configured (EMAIL_ADDRESS / EMAIL_PASSWORD)")
+
+    # Claimed by a run that died mid-batch (we hold the lease, so no other run is live)
+    await db.campaign_recipients.update_many(
+        {"campaign_id": campaign_id, "status": "sending", "claimed_by": {"$ne": owner}},
+        {"$set": {"status": "pending"}},
+    )
+
+    # Give earlier failures another chance on resume
+    retried = await db.campaign_recipients.update_many(
+        {"campaign_id": campaign_id, "status": "failed", "attempts": {"$lt": _MAX_ATTEMPTS}},
+        {"$set": {"status": "pending"}},
+    )
+    if retried.modified_count:
+        await _update(campaign_id, {}, inc={"counts.failed": -retried.modified_count})
+
+    limiter = _RateLimiter(CAMPAIGN_SEND_RATE)
+    total = campaign["counts"]["recipients"]
+    try:
+        while True:
+            await _check_paused(campaign_id)
+            batch = await _claim_batch(campaign_id, owner)
+            if not batch:
+                break
+            coupons = {
+                c["code"]: c
+                async for c in db.coupons.find(
+                    {"code": {"$in": [r["coupon_code"] for r in batch if r.get("coupon_code")]}}, {"_id": 0},
+                )
+            }
+            rendered = await asyncio.to_thread(
+                _render_batch, batch, coupons, business_name, campaign.get("subject"), pool.sender,
+            )
+            results = await _deliver(rendered, pool, limiter)
+
+            now_iso = _now_iso()
+            ops = []
+            for r, (_, message), ok in zip(batch, rendered, results):
+                if ok:
+                    fields = {"status": "sent", "sent_at": now_iso, "error": None}
+                else:
+                    fields = {"status": "failed", "error": "coupon missing" if message is None else "send failed"}
+                ops.append(UpdateOne(
+                    {"campaign_id": campaign_id, "customer_id": r["customer_id"], "claimed_by": owner},
+                    {"$set": fields, "$inc": {"attempts": 1}},
+                ))
+            await db.campaign_recipients.bulk_write(ops, ordered=False)
+            sent = sum(results)
+            await _update(campaign_id, {}, inc={"counts.sent": sent, "counts.failed": len(batch) - sent})
+            if progress:
+                processed = await db.campaign_recipients.count_documents(
+                    {"campaign_id": campaign_id, "status": {"$nin": ["pending", "sending"]}},
+                )
+                await progress(processed, total, "sending")
+    finally:
+        await asyncio.to_thread(pool.close)
+
+
+async def run_campaign(campaign_id: str, progress=None) -> Dict[str, Any]:
+    """Run (or continue) a campaign to completion. Returns its final counts."""
+    name, owner = f"campaign:{campaign_id}", new_owner()
+    while not await acquire_lease(name, owner, _LEASE_TTL):
+        await asyncio.sleep(_LEASE_POLL_SECONDS)  # an earlier run is still stopping
+    async with hold_lease(name, _LEASE_TTL, owner=owner):
+        return await _run_campaign(campaign_id, owner, progress)
+
+
+async def _finish(campaign_id: str, owner: str, fields: Dict[str, Any]):
+    """Record this run's outcome unless a later run has taken the campaign over."""
+    await db.campaigns.update_one({"id": campaign_id, "runner": owner},
+                                  {"$set": {**fields, "updated_at": _now_iso()}})
+
+
+async def _run_campaign(campaign_id: str, owner: str, progress) -> Dict[str, Any]:
+    campaign = await db.campaigns.find_one({"id": campaign_id}, {"_id": 0})
+    if not campaign:
+        raise RuntimeError(f"Campaign {campaign_id} not found")
+    if campaign["status"] == "completed":
+        return campaign["counts"]
+    if campaign.get("pause_requested"):
+        raise JobCancelled("Campaign paused")
+
+    await _update(campaign_id, {
+        "status": "running", "runner": owner, "error": None,
+        "started_at": campaign.get("started_at") or _now_iso(),
+    })
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0, "business_name": 1}) or {}
+    business_name = strip_html(settings.get("business_name", "TECHZONE"))
+    try:
+        if campaign["phase"] == "recipients":
+            await _collect_recipients(campaign, progress)
+            campaign["phase"] = "coupons"
+        if campaign["phase"] == "coupons":
+            await _issue_coupons(campaign, business_name, progress)
+            campaign["phase"] = "send"
+        await _send_all(campaign, business_name, owner, progress)
+    except (asyncio.CancelledError, JobCancelled):
+        await _finish(campaign_id, owner, {"status": "paused"})
+        raise
+    except Exception as e:
+        logger.error(f"Campaign {campaign_id} failed: {e}")
+        await _finish(campaign_id, owner, {"status": "failed", "error": str(e)})
+        raise
+
+    await _finish(campaign_id, owner, {"status": "completed", "phase": "done", "finished_at": _now_iso()})
+    done = await db.campaigns.find_one({"id": campaign_id}, {"_id": 0, "counts": 1})
+    logger.info(f"Campaign {campaign_id} completed: {done['counts']}")
+    return done["counts"]
+
+
+async def start_campaign(campaign_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue the campaign job (first run or resume). Returns the job."""
+    await _update(campaign_id, {"status": "queued", "pause_requested": False, "error": None})
+    job = await submit_job("campaign", {"campaign_id": campaign_id}, user)
+    await db.campaigns.update_one({"id": campaign_id}, {"$set": {"job_id": job["id"]}})
+    return job
+
+
+async def resume_campaigns():
+    """Requeue active campaigns whose job died with its worker (at boot and from the scheduler).
+
+    One worker at a time does this (the `campaigns:resume` lease). A campaign
+    whose job is still queued or running on a live worker is left to it; jobs
+    of dead workers have been failed by `recover_jobs` beforehand.
+    """
+    try:
+        async with hold_lease("campaigns:resume"):
+            campaigns = await db.campaigns.find(
+                {"status": {"$in": list(ACTIVE_STATUSES)}}, {"_id": 0, "id": 1, "job_id": 1, "created_by": 1},
+            ).to_list(None)
+            for campaign in campaigns:
+                if campaign.get("job_id") and await db.jobs.count_documents(
+                    {"id": campaign["job_id"], "status": {"$in": list(ACTIVE_STATUSES)}},
+                ):
+                    continue
+                await start_campaign(campaign["id"], {"username": campaign.get("created_by")})
+                logger.info(f"Campaign {campaign['id']} resumed after its worker stopped")
+    except LeaseBusy:
+        logger.info("Campaign resume is already running on another worker")
+    except Exception as e:
+        logger.error(f"Campaign resume failed: {e}")
@@ -0,0 +1,221 @@
+"""Running cash-register shift totals.
+
+Every cash transaction is written through `record_transaction`, which
+inserts it and then `$inc`s the matching counter on its shift document
+(`cash_sales`, `payouts`, `drops`, `refunds`, `transaction_count`,
+`expected_amount`). Reading a shift's totals is then a single document read,
+no matter how many transactions it has. The `$inc` only matches an open
+shift, so closing a shift (one conditional update) fixes which transactions
+its totals include.
+
+`compute_shift_totals` recomputes the same figures from the transactions
+with one `$group`. It is used at close, for audits (`verify_shift_totals`)
+and for shifts opened before running totals existed. `summarize_shifts` does
+the same for many shifts at once (daily and range reconciliation).
+
+Shifts and transactions belong to a register (till), identified by
+`register_id` ("main" unless the client names one). Each register can have
+one open shift; a unique partial index on (register_id, status) enforces
+it. Open shifts are cached in memory per register for a few seconds, so a
+cash sale does not need an open-shift lookup on every request; a register
+without one is looked up again each time.
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import db, logger
+
+# transaction_type -> running total field on the shift
+TOTAL_FIELDS = {"cash_sale": "cash_sales", "payout": "payouts", "drop": "drops", "refund": "refunds"}
+_TOLERANCE = 0.005
+
+DEFAULT_REGISTER = "main"
+_REGISTER_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+_OPEN_SHIFT_TTL = 5.0  # seconds; a close on another worker is caught by record_transaction
+_open_shifts: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def normalize_register_id(register_id: Optional[str]) -> str:
+    """Default to the main register; raises ValueError for malformed ids."""
+    value = (register_id or "").strip() or DEFAULT_REGISTER
+    if not _REGISTER_RE.match(value):
+        raise ValueError("register_id must be 1-32 letters, digits, '-' or '_'")
+    return value
+
+
+async def get_open_shift(register_id: str = DEFAULT_REGISTER, fresh: bool = False) -> Optional[Dict[str, Any]]:
+    """The register's open shift (cached briefly), or None.
+
+    Only a found shift is cached. A miss is always re-read, so a shift opened
+    on another worker is picked up by the very next cash sale.
+    """
+    cached = _open_shifts.get(register_id)
+    if cached and not fresh and time.monotonic() - cached[0] < _OPEN_SHIFT_TTL:
+        return cached[1]
+    shift = await db.cash_register_shifts.find_one({"register_id": register_id, "status": "open"}, {"_id": 0})
+    if shift:
+        _open_shifts[register_id] = (time.monotonic(), shift)
+    else:
+        _open_shifts.pop(register_id, None)
+    return shift
+
+
+def forget_open_shift(register_id: str):
+    """Drop the cached open shift after this process opens or closes one."""
+    _open_shifts.pop(register_id, None)
+
+
+async def backfill_register_ids():
+    """Assign shifts and transactions from before multi-register support to "main"."""
+    try:
+        for collection in (db.cash_register_shifts, db.cash_register_transactions):
+            result = await collection.update_many(
+                {"register_id": {"$exists": False}}, {"$set": {"register_id": DEFAULT_REGISTER}},
+            )
+            if result.modified_count:
+                logger.info(f"Backfilled register_id on {result.modified_count} {collection.name} documents")
+    except Exception as e:
+        logger.error(f"register_id backfill failed: {e}")
+
+
+def _empty_totals(opening_amount: float) -> Dict[str, Any]:
+    return {
+        "cash_sales": 0.0, "payouts": 0.0, "drops": 0.0, "refunds": 0.0,
+        "transaction_count": 0, "expected_amount": float(opening_amount),
+    }
+
+
+def initial_totals(opening_amount: float) -> Dict[str, Any]:
+    """Running-total fields for a newly opened shift."""
+    return _empty_totals(opening_amount)
+
+
+async def record_transaction(doc: Dict[str, Any]) -> bool:
+    """Insert a cash transaction and fold it into its shift's running totals.
+
+    The transaction is inserted first, so every amount counted in the totals
+    is on record. Returns False (and removes it again) if the shift is no
+    longer open.
+    """
+    field = TOTAL_FIELDS.get(doc["transaction_type"])
+    amount = float(doc["amount"])
+    inc: Dict[str, Any] = {"transaction_count": 1}
+    if field:
+        inc[field] = amount if field == "cash_sales" else abs(amount)
+        # Cash sales bring money in; every other type takes it out
+        inc["expected_amount"] = amount if field == "cash_sales" else -abs(amount)
+    await db.cash_register_transactions.insert_one(doc)
+    doc.pop("_id", None)
+    result = await db.cash_register_shifts.update_one({"id": doc["shift_id"], "status": "open"}, {"$inc": inc})
+    if not result.matched_count:
+        await db.cash_register_transactions.delete_one({"id": doc["id"]})
+        return False
+    return True
+
+
+async def compute_shift_totals(shift: Dict[str, Any]) -> Dict[str, Any]:
+    """Authoritative totals for one shift, aggregated from its transactions."""
+    rows = await db.cash_register_transactions.aggregate([
+        {"$match": {"shift_id": shift["id"]}},
+        {"$group": {
+            "_id": "$transaction_type",
+            "amount": {"$sum": "$amount"},
+            "abs_amount": {"$sum": {"$abs": "$amount"}},
+            "count": {"$sum": 1},
+        }},
+    ]).to_list(None)
+    totals = _empty_totals(shift.get("opening_amount") or 0)
+    for row in rows:
+        field = TOTAL_FIELDS.get(row["_id"])
+        if field:
+            totals[field] = row["amount"] if field == "cash_sales" else row["abs_amount"]
+        totals["transaction_count"] += row["count"]
+    totals["expected_amount"] = (
+        totals["expected_amount"] + totals["cash_sales"] - totals["payouts"] - totals["drops"] - totals["refunds"]
+    )
+    return totals
+
+
+def stored_totals(shift: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Running totals from the shift document, or None for a legacy shift without them."""
+    if "cash_sales" not in shift:
+        return None
+    return {key: shift.get(key, 0) for key in _empty_totals(0)}
+
+
+async def shift_totals(shift: Dict[str, Any]) -> Dict[str, Any]:
+    """Running totals for an open shift; legacy shifts are backfilled once."""
+    totals = stored_totals(shift)
+    if totals is None:
+        totals = await compute_shift_totals(shift)
+        await db.cash_register_shifts.update_one({"id": shift["id"]}, {"$set": totals})
+    return totals
+
+
+async def verify_shift_totals(shift: Dict[str, Any], repair: bool = False) -> Dict[str, Any]:
+    """Compare stored running totals with the transactions; optionally overwrite them."""
+    computed = await compute_shift_totals(shift)
+    stored = stored_totals(shift)
+    mismatches = {
+        key: {"stored": None if stored is None else stored.get(key), "computed": value}
+        for key, value in computed.items()
+        if stored is None or abs(float(stored.get(key) or 0) - float(value)) > _TOLERANCE
+    }
+    # A closed shift's expected_amount was fixed at close; only its counters are checked
+    if shift.get("status") == "closed":
+        mismatches.pop("expected_amount", None)
+    repaired = False
+    if mismatches and repair:
+        fields = dict(computed)
+        if shift.get("status") == "closed":
+            fields.pop("expected_amount")
+        await db.cash_register_shifts.update_one({"id": shift["id"]}, {"$set": fields})
+        repaired = True
+    return {
+        "shift_id": shift["id"],
+        "consistent": not mismatches,
+        "mismatches": mismatches,
+        "computed": computed,
+        "repaired": repaired,
+    }
+
+
+async def summarize_shifts(shifts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cash totals across `shifts` with one aggregation over their transactions.
+
+    Returns overall `totals` (including summed `variance` of closed shifts)
+    and `by_day` rows keyed by the transaction's UTC day.
+    """
+    rows = await db.cash_register_transactions.aggregate([
+        {"$match": {"shift_id": {"$in": [shift["id"] for shift in shifts]}}},
+        {"$group": {
+            "_id": {"day": {"$substrBytes": ["$created_at", 0, 10]}, "type": "$transaction_type"},
+            "amount": {"$sum": "$amount"},
+            "abs_amount": {"$sum": {"$abs": "$amount"}},
+        }},
+    ]).to_list(None) if shifts else []
+
+    def empty():
+        return {field: 0 for field in TOTAL_FIELDS.values()}
+
+    totals, days = empty(), {}
+    for row in rows:
+        field = TOTAL_FIELDS.get(row["_id"]["type"])
+        if not field:
+            continue
+        value = row["amount"] if field == "cash_sales" else row["abs_amount"]
+        totals[field] += value
+        days.setdefault(row["_id"]["day"], empty())[field] += value
+
+    variance_by_day: Dict[str, float] = {}
+    for shift in shifts:
+        if shift.get("difference"):
+            day = (shift.get("closed_at") or "")[:10]
+            variance_by_day[day] = variance_by_day.get(day, 0) + shift["difference"]
+    totals["variance"] = sum(variance_by_day.values())
+    by_day = [
+        {"date": day, **days.get(day, empty()), "variance": variance_by_day.get(day, 0)}
+        for day in sorted(set(days) | set(variance_by_day))
+    ]
+    return {"totals": totals, "by_day": by_day}
@@ -0,0 +1,117 @@
+"""Unique random coupon codes, inserted in bulk.
+
+Codes look like `PREFIX-7KQ2MX9A`: a caller-chosen prefix plus random
+characters from an alphabet without look-alikes (0/O, 1/I). Uniqueness is
+enforced twice: against an in-memory set (duplicates within a batch never reach
+Mongo) and by the unique index on `coupons.code`. A batch is written with one
+`insert_many(ordered=False)`; only documents rejected as duplicate keys get a
+fresh code and are retried.
+"""
+import re
+import secrets
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo.errors import BulkWriteError
+
+from core.config import db, logger
+
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+DEFAULT_CODE_LENGTH = 8
+_PREFIX_RE = re.compile(r"^[A-Z0-9]{1,12}$")
+_DUPLICATE_KEY = 11000
+_MAX_ROUNDS = 8
+_BULK_BATCH = 5000
+MAX_BULK_CODES = 100_000
+
+
+def normalize_prefix(prefix: Optional[str]) -> str:
+    """Upper-case a prefix; raises ValueError unless it is 1-12 letters/digits."""
+    value = (prefix or "").strip().upper().rstrip("-")
+    if not _PREFIX_RE.match(value):
+        raise ValueError("Code prefix must be 1-12 letters or digits")
+    return value
+
+
+def random_code(prefix: str, length: int = DEFAULT_CODE_LENGTH) -> str:
+    # 32-letter alphabet: the low 5 bits of each random byte pick a letter uniformly
+    return f"{prefix}-{''.join(CODE_ALPHABET[b & 31] for b in secrets.token_bytes(length))}"
+
+
+def _fresh_code(prefix: str, length: int, seen: Set[str]) -> str:
+    while True:
+        code = random_code(prefix, length)
+        if code not in seen:
+            seen.add(code)
+            return code
+
+
+async def insert_with_unique_codes(
+    collection,
+    docs: List[Dict[str, Any]],
+    prefix: str,
+    length: int = DEFAULT_CODE_LENGTH,
+    seen: Optional[Set[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Assign a unique `code` to every doc and insert them all.
+
+    `seen` may be shared across calls so codes never repeat within a run.
+    Returns the inserted documents (with their final codes).
+    """
+    seen = set() if seen is None else seen
+    for doc in docs:
+        doc["code"] = _fresh_code(prefix, length, seen)
+
+    pending = docs
+    for _ in range(_MAX_ROUNDS):
+        if not pending:
+            return docs
+        try:
+            await collection.insert_many([dict(doc) for doc in pending], ordered=False)
+            return docs
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != _DUPLICATE_KEY for err in errors):
+                raise
+            # Only the collided documents are retried, each with a new code
+            pending = [pending[err["index"]] for err in errors]
+            for doc in pending:
+                doc["code"] = _fresh_code(prefix, length, seen)
+            logger.info(f"Coupon code collisions retried: {len(pending)}")
+    raise RuntimeError(f"Could not generate unique '{prefix}' codes; use a longer code length")
+
+
+async def create_bulk_coupons(template: Dict[str, Any], count: int, prefix: str,
+                              length: int = DEFAULT_CODE_LENGTH, created_by: Optional[str] = None
+                              ) -> Dict[str, Any]:
+    """Insert `count` coupons sharing `template`, each with a unique random code.
+
+    All coupons carry the same `batch_id`; if any batch fails, the coupons
+    already inserted for it are removed again. Returns the batch id and the
+    codes, in insertion order.
+    """
+    batch_id = str(uuid.uuid4())
+    now_iso = datetime.now(timezone.utc).isoformat()
+    base = {
+        **template,
+        "usage_count": 0,
+        "customer_id": None,
+        "customer_name": None,
+        "created_at": now_iso,
+        "created_by": created_by,
+        "source": "bulk",
+        "batch_id": batch_id,
+    }
+    seen: Set[str] = set()
+    codes: List[str] = []
+    try:
+        for offset in range(0, count, _BULK_BATCH):
+            docs = [{**base, "id": str(uuid.uuid4())} for _ in range(min(_BULK_BATCH, count - offset))]
+            await insert_with_unique_codes(db.coupons, docs, prefix, length, seen)
+            codes.extend(doc["code"] for doc in docs)
+    except Exception:
+        await db.coupons.delete_many({"batch_id": batch_id})
+        raise
+    logger.info(f"Bulk coupons created: {count} '{prefix}' codes (batch {batch_id})")
+    return {"batch_id": batch_id, "codes": codes}
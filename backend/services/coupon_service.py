@@ -0,0 +1,126 @@
+"""Coupon lookup, eligibility and atomic redemption.
+
+`get_coupon` is a read-through LRU cache of coupons by code. Lookups of codes
+that do not exist are cached too, because the checkout screen validates on
+every keystroke. Writes in this process call `invalidate_coupons`; changes
+made by other workers are picked up once an entry is _TTL_SECONDS old.
+Cached data only answers "is this code worth offering". The authoritative
+check is `redeem_coupon`, a single conditional `find_one_and_update` that
+re-checks the active flag, the usage limit and the validity window. A
+limited coupon therefore cannot be over-redeemed by concurrent checkouts.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from core.config import db
+
+_MAX_ENTRIES = 2048
+_TTL_SECONDS = 30.0
+_cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+
+
+class CouponError(ValueError):
+    """A coupon cannot be applied; the message is shown to the cashier."""
+
+
+def normalize_code(code: Optional[str]) -> str:
+    return (code or "").strip().upper()
+
+
+async def get_coupon(code: str) -> Optional[Dict[str, Any]]:
+    """Coupon by code (cached; treat the result as read-only), or None."""
+    code = normalize_code(code)
+    if not code:
+        return None
+    entry = _cache.get(code)
+    if entry and time.monotonic() - entry[0] < _TTL_SECONDS:
+        _cache.move_to_end(code)
+        return entry[1]
+    coupon = await db.coupons.find_one({"code": code}, {"_id": 0})
+    _store(code, coupon)
+    return coupon
+
+
+def _store(code: str, coupon: Optional[Dict[str, Any]]):
+    _cache[code] = (time.monotonic(), coupon)
+    _cache.move_to_end(code)
+    while len(_cache) > _MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def invalidate_coupons(*codes: Optional[str]):
+    """Drop cached entries for `codes`, or the whole cache when none are given."""
+    if not codes:
+        _cache.clear()
+        return
+    for code in codes:
+        _cache.pop(normalize_code(code), None)
+
+
+def coupon_discount(coupon: Dict[str, Any], subtotal: float, customer_id: Optional[str] = None,
+                    now_iso: Optional[str] = None) -> float:
+    """Discount `coupon` gives on `subtotal`; raises CouponError when it does not apply."""
+    if not coupon.get('is_active', False):
+        raise CouponError("This coupon is no longer active")
+
+    # Personalized coupon: locked to a specific customer
+    if coupon.get('customer_id'):
+        if not customer_id:
+            raise CouponError("This coupon is personalized and requires a customer at checkout")
+        if customer_id != coupon.get('customer_id'):
+            raise CouponError("This coupon is not valid for this customer")
+
+    if coupon.get('usage_limit') and coupon.get('usage_count', 0) >= coupon.get('usage_limit'):
+        raise CouponError("This coupon has reached its usage limit")
+
+    if subtotal < coupon.get('min_purchase', 0):
+        raise CouponError(f"Minimum purchase of ${coupon.get('min_purchase', 0):.2f} required")
+
+    now = now_iso or datetime.now(timezone.utc).isoformat()
+    if coupon.get('valid_from') and now < coupon.get('valid_from'):
+        raise CouponError("This coupon is not yet valid")
+    if coupon.get('valid_until') and now > coupon.get('valid_until'):
+        raise CouponError("This coupon has expired")
+
+    if coupon.get('discount_type') == 'percentage':
+        discount = subtotal * (coupon.get('discount_value', 0) / 100)
+        if coupon.get('max_discount') and discount > coupon.get('max_discount'):
+            discount = coupon.get('max_discount')
+    else:  # fixed
+        discount = min(coupon.get('discount_value', 0), subtotal)
+    return discount
+
+
+async def redeem_coupon(coupon_id: str, now_iso: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Count one use of the coupon if it is still redeemable right now.
+
+    Returns the updated coupon, or None when it is inactive, used up or
+    outside its validity window (e.g. another checkout took the last use).
+    """
+    now = now_iso or datetime.now(timezone.utc).isoformat()
+    coupon = await db.coupons.find_one_and_update(
+        {
+            "id": coupon_id,
+            "is_active": True,
+            "$and": [
+                {"$or": [
+                    {"usage_limit": None},
+                    {"usage_limit": 0},
+                    {"$expr": {"$lt": [{"$ifNull": ["$usage_count", 0]}, "$usage_limit"]}},
+                ]},
+                {"$or": [{"valid_from": None}, {"valid_from": ""}, {"valid_from": {"$lte": now}}]},
+                {"$or": [{"valid_until": None}, {"valid_until": ""}, {"valid_until": {"$gte": now}}]},
+            ],
+        },
+        {"$inc": {"usage_count": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if coupon:
+        # Keep the cached usage count current for this process's validations
+        _store(coupon["code"], coupon)
+    return coupon
@@ -0,0 +1,95 @@
+"""RFM retention scoring for customers.
+
+Pure functions with no database or framework imports, so the full-customer
+scoring job can run them in a worker process (see services/jobs.py).
+`rfm_score` scores one customer; `rfm_scores` applies the same formula to
+NumPy arrays covering every customer at once.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def parse_dt(dt):
+    if isinstance(dt, datetime):
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    if isinstance(dt, str):
+        try:
+            return datetime.fromisoformat(dt.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
+
+
+def rfm_score(total_spent: float, sales_count: int, last_sale, max_spent: float, max_count: int,
+              now: datetime) -> Tuple[int, str]:
+    """RFM retention score (0-100) and tier. Frequency and monetary are normalized
+    against the store-wide maxima, so scores are comparable across all customers."""
+    # Recency: 0-40 pts. 0 days = 40 pts. Linearly decays to 0 at 120 days away.
+    if last_sale:
+        days_since = max((now - last_sale).days, 0)
+        recency_score = max(0.0, 40.0 * (1 - min(days_since, 120) / 120))
+    else:
+        recency_score = 0.0
+
+    # Frequency: 0-30 pts relative to the most frequent customer
+    frequency_score = 30.0 * (sales_count / (max_count or 1))
+
+    # Monetary: 0-30 pts relative to the top-spend customer
+    monetary_score = 30.0 * (total_spent / (max_spent or 1))
+
+    retention_score = round(recency_score + frequency_score + monetary_score)
+    retention_score = max(0, min(100, retention_score))
+
+    if retention_score >= 70:
+        retention_tier = "high"
+    elif retention_score >= 40:
+        retention_tier = "medium"
+    else:
+        retention_tier = "low"
+    return retention_score, retention_tier
+
+
+def rfm_scores(total_spent: np.ndarray, sales_count: np.ndarray, days_since: np.ndarray
+               ) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized `rfm_score` against the maxima of the given arrays.
+
+    `days_since` holds whole days since the last sale (NaN = never).
+    Returns (int scores, tier strings).
+    """
+    max_spent = float(total_spent.max(initial=0)) or 1
+    max_count = float(sales_count.max(initial=0)) or 1
+    days = np.maximum(days_since, 0)
+    recency = np.where(np.isnan(days), 0.0, np.maximum(0.0, 40.0 * (1 - np.minimum(days, 120) / 120)))
+    frequency = 30.0 * (sales_count / max_count)
+    monetary = 30.0 * (total_spent / max_spent)
+    scores = np.clip(np.round(recency + frequency + monetary), 0, 100).astype(np.int64)
+    tiers = np.select([scores >= 70, scores >= 40], ["high", "medium"], "low")
+    return scores, tiers
+
+
+def days_since_array(last_sale_values, now: datetime) -> np.ndarray:
+    """Whole days from each ISO timestamp to `now`; NaN where missing or unparseable."""
+    now_ts = now.timestamp()
+    stamps = np.array([
+        dt.timestamp() if dt else np.nan for dt in (parse_dt(v) for v in last_sale_values)
+    ], dtype=np.float64)
+    return np.floor((now_ts - stamps) / 86400.0)
+
+
+def score_customers(rows: List[Dict[str, Any]], now_iso: str) -> List[Dict[str, Any]]:
+    """Score every `customer_stats` row against the maxima of `rows`, best first."""
+    if not rows:
+        return []
+    scores, tiers = rfm_scores(
+        np.array([float(r.get("total_spent") or 0) for r in rows]),
+        np.array([int(r.get("sales_count") or 0) for r in rows], dtype=np.float64),
+        days_since_array([r.get("last_sale_at") for r in rows], parse_dt(now_iso)),
+    )
+    scored = [
+        {**row, "retention_score": int(score), "retention_tier": str(tier)}
+        for row, score, tier in zip(rows, scores, tiers)
+    ]
+    scored.sort(key=lambda r: (r["retention_score"], r.get("total_spent") or 0), reverse=True)
+    return scored
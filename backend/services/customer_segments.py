@@ -0,0 +1,117 @@
+"""Nightly RFM segmentation materialized onto customer documents.
+
+Every customer with purchases is scored against store-wide maxima in one
+vectorized pass over the `customer_stats` projection
+(`services.customer_scoring.rfm_scores`). The score and tier are written back
+as `rfm_score` / `rfm_segment` ("high" | "medium" | "low"); customers without
+purchases get score 0 and segment "none". With the customer indexes, marketing
+filters such as "high-retention customers inactive for 30 days" become indexed
+reads on `customers` (see GET /customers).
+
+`last_sale_at` is copied as well, and advanced on every completed sale by the
+customer_stats projection, so recency filters never wait for the next run.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+from core.config import db, logger, RFM_SEGMENT_HOUR
+from services.customer_scoring import rfm_scores, days_since_array
+
+SEGMENTS = ("high", "medium", "low", "none")
+_BATCH_SIZE = 1000
+_LAST_RUN_KEY = "rfm_segments_last_run"
+
+
+def segment_query(segment: Optional[str] = None, min_score: Optional[int] = None,
+                  inactive_days: Optional[int] = None) -> Dict[str, Any]:
+    """Mongo filter on `customers` for a segment definition (all optional).
+    `inactive_days` keeps customers whose last purchase is at least that old."""
+    query: Dict[str, Any] = {}
+    if segment:
+        if segment not in SEGMENTS:
+            raise ValueError(f"segment must be one of: {', '.join(SEGMENTS)}")
+        query["rfm_segment"] = segment
+    if min_score is not None:
+        query["rfm_score"] = {"$gte": min_score}
+    if inactive_days is not None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max(inactive_days, 0))
+        query["last_sale_at"] = {"$lt": cutoff.isoformat()}
+    return query
+
+
+async def refresh_customer_segments(progress=None) -> Dict[str, Any]:
+    """Score every customer and store the results. Returns counts per segment."""
+    now = datetime.now(timezone.utc)
+    run_iso = now.isoformat()
+    rows = await db.customer_stats.find(
+        {"sales_count": {"$gt": 0}},
+        {"_id": 0, "customer_id": 1, "total_spent": 1, "sales_count": 1, "last_sale_at": 1},
+    ).to_list(None)
+
+    counts = {segment: 0 for segment in SEGMENTS}
+    if rows:
+        scores, tiers = rfm_scores(
+            np.fromiter((float(r.get("total_spent") or 0) for r in rows), dtype=np.float64, count=len(rows)),
+            np.fromiter((int(r.get("sales_count") or 0) for r in rows), dtype=np.float64, count=len(rows)),
+            days_since_array([r.get("last_sale_at") for r in rows], now),
+        )
+        segments, segment_counts = np.unique(tiers, return_counts=True)
+        counts.update({str(s): int(c) for s, c in zip(segments, segment_counts)})
+
+        for offset in range(0, len(rows), _BATCH_SIZE):
+            if progress:
+                await progress(offset, len(rows), "writing scores")
+            ops = [
+                UpdateOne({"id": row["customer_id"]}, {"$set": {
+                    "rfm_score": int(scores[i]),
+                    "rfm_segment": str(tiers[i]),
+                    "rfm_scored_at": run_iso,
+                    "last_sale_at": row.get("last_sale_at"),
+                }})
+                for i, row in enumerate(rows[offset:offset + _BATCH_SIZE], start=offset)
+            ]
+            await db.customers.bulk_write(ops, ordered=False)
+
+    # Everyone not scored in this run has no completed purchases (any more)
+    unscored = await db.customers.update_many(
+        {"rfm_scored_at": {"$ne": run_iso}},
+        {"$set": {"rfm_score": 0, "rfm_segment": "none", "rfm_scored_at": run_iso},
+         "$unset": {"last_sale_at": ""}},
+    )
+    counts["none"] = unscored.modified_count
+
+    await db.settings.update_one(
+        {"id": "app_settings"}, {"$set": {_LAST_RUN_KEY: run_iso}}, upsert=True,
+    )
+    logger.info(f"Customer segments refreshed: {counts}")
+    return {"scored_at": run_iso, "segments": counts}
+
+
+async def maybe_refresh_segments(now: Optional[datetime] = None):
+    """Scheduler hook: refresh once per UTC day, at or after RFM_SEGMENT_HOUR."""
+    now = now or datetime.now(timezone.utc)
+    if now.hour < RFM_SEGMENT_HOUR:
+        return
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0, _LAST_RUN_KEY: 1}) or {}
+    last = settings.get(_LAST_RUN_KEY)
+    if last and last[:10] == now.date().isoformat():
+        return
+    try:
+        await refresh_customer_segments()
+    except Exception as e:
+        logger.error(f"Customer segmentation failed: {e}")
+
+
+async def segment_summary() -> Dict[str, Any]:
+    rows = await db.customers.aggregate([
+        {"$group": {"_id": "$rfm_segment", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0, _LAST_RUN_KEY: 1}) or {}
+    counts = {segment: 0 for segment in SEGMENTS}
+    counts["unscored"] = 0
+    for row in rows:
+        counts[row["_id"] if row["_id"] in SEGMENTS else "unscored"] += row["count"]
+    return {"scored_at": settings.get(_LAST_RUN_KEY), "segments": counts}
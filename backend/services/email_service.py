@@ -1,11 +1,13 @@
 """Email delivery: activation codes and shift reports via SMTP."""
 import os
+import queue
 import smtplib
+import threading
 from datetime import datetime, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from core.config import logger
+from core.config import logger, EMAIL_ADDRESS, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT
 
 # Default VIP threshold (cumulative customer spend) — overridable per-deployment via
 # the `vip_spend_threshold` setting. Kept as a fallback so behavior stays consistent
@@ -252,15 +254,9 @@ def send_shift_report_email(to_email: str, shift_data: dict, pdf_bytes: bytes, b
         return False
 
 
-def send_coupon_email(to_email: str, customer_name: str, coupon: dict, business_name: str = "TECHZONE") -> bool:
-    """Email a personalized coupon code to a customer."""
-    sender_email = os.environ.get("EMAIL_ADDRESS", "")
-    sender_password = os.environ.get("EMAIL_PASSWORD", "")
-
-    if not sender_password:
-        logger.warning("EMAIL_PASSWORD not set; cannot send coupon email")
-        return False
-
+def build_coupon_message(to_email: str, customer_name: str, coupon: dict, business_name: str = "TECHZONE",
+                         sender_email: str = "", subject: str = None) -> MIMEMultipart:
+    """Render the personalized coupon email (shared by single sends and campaigns)."""
     code = coupon.get("code", "")
     description = coupon.get("description", "Your exclusive discount")
     discount_type = coupon.get("discount_type", "percentage")
@@ -290,7 +286,7 @@ def send_coupon_email(to_email: str, customer_name: str, coupon: dict, business_
             pass
 
     msg = MIMEMultipart("alternative")
-    msg["Subject"] = f"A personalized coupon just for you — {code}"
+    msg["Subject"] = subject or f"A personalized coupon just for you — {code}"
     msg["From"] = sender_email
     msg["To"] = to_email
 
@@ -329,6 +325,20 @@ def send_coupon_email(to_email: str, customer_name: str, coupon: dict, business_
     )
     msg.attach(MIMEText(text, "plain"))
     msg.attach(MIMEText(html, "html"))
+    return msg
+
+
+def send_coupon_email(to_email: str, customer_name: str, coupon: dict, business_name: str = "TECHZONE") -> bool:
+    """Email a personalized coupon code to a customer."""
+    sender_email = os.environ.get("EMAIL_ADDRESS", "")
+    sender_password = os.environ.get("EMAIL_PASSWORD", "")
+
+    if not sender_password:
+        logger.warning("EMAIL_PASSWORD not set; cannot send coupon email")
+        return False
+
+    code = coupon.get("code", "")
+    msg = build_coupon_message(to_email, customer_name, coupon, business_name, sender_email)
 
     try:
         server = smtplib.SMTP("smtp.gmail.com", 587)
@@ -627,3 +637,75 @@ def send_followup_email(to_email: str, customer_name: str, items_summary: str, b
     except Exception as e:
         logger.error(f"Failed to send follow-up email: {e}")
         return False
+
+
+class SmtpPool:
+    """Authenticated SMTP connections reused across many sends (bulk campaigns).
+
+    Thread-safe: at most `size` connections exist, and each is used by one
+    sender thread at a time. A connection is replaced after `max_messages`
+    sends or on any SMTP/socket error; a failed send is retried once on a
+    fresh connection before it is reported as failed.
+    """
+
+    def __init__(self, size: int = 3, max_messages: int = 100):
+        self.sender = EMAIL_ADDRESS
+        self.max_messages = max_messages
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @property
+    def configured(self) -> bool:
+        return bool(EMAIL_ADDRESS and EMAIL_PASSWORD)
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        server.starttls()
+        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        return [server, 0]
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn[0].quit()
+        except Exception:
+            pass
+
+    def send(self, to_email: str, message: str) -> bool:
+        """Send one rendered message; blocking, so call it from a worker thread."""
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+            for attempt in range(2):
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    conn[0].sendmail(self.sender, to_email, message)
+                    conn[1] += 1
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Bad address, healthy connection: keep it for the next message
+                    self._idle.put(conn)
+                    logger.warning(f"Campaign email to {to_email} refused: {e}")
+                    return False
+                except (smtplib.SMTPException, OSError) as e:
+                    if conn is not None:
+                        self._discard(conn)
+                        conn = None
+                    if attempt:
+                        logger.warning(f"Campaign email to {to_email} failed: {e}")
+                        return False
+            if conn[1] >= self.max_messages:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+            return True
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
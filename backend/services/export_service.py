@@ -0,0 +1,150 @@
+"""Streaming line-item exports of sales (CSV / XLSX) over arbitrary date ranges.
+
+Rows come from a server-side Mongo cursor (fixed batch size) and are encoded
+chunk by chunk, so memory use is independent of the range exported: a full
+year streams exactly like a single day. One row per sale item, with the sale
+header columns repeated on every line; sales without items yield one row with
+empty item columns. Each line also carries its tax: the amount recorded on
+the item at checkout, or for older sales without it, the sale's tax spread
+pro rata over the lines that are taxable under the current exempt categories.
+
+XLSX cannot be streamed this way: the zip container is only complete once
+the workbook is saved. openpyxl's write-only mode keeps rows out of memory,
+but the file is spooled to a temp file on disk and sent when it is
+finished. Memory stays flat either way; only CSV starts sending at once.
+"""
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+from core.config import db, OPENPYXL_AVAILABLE
+from services.pricing import pricing_context, PricingContext
+
+if OPENPYXL_AVAILABLE:
+    from openpyxl import Workbook
+
+_CURSOR_BATCH = 1000
+_CSV_FLUSH_ROWS = 500
+_XLSX_BATCH_ROWS = 2000
+_FILE_CHUNK = 64 * 1024
+
+EXPORT_COLUMNS = [
+    "sale_id", "created_at", "payment_status", "payment_method", "created_by",
+    "customer_id", "customer_name", "coupon_code",
+    "sale_subtotal", "sale_discount", "points_discount", "sale_tax", "sale_total",
+    "item_id", "item_name", "quantity", "unit_price", "line_subtotal", "line_tax",
+]
+
+
+def _line_taxes(items: List[Dict[str, Any]], tax: float, context: PricingContext) -> List[float]:
+    """Per-line tax: as recorded at checkout, else allocated across taxable lines only."""
+    if all(item.get("tax") is not None for item in items):
+        return [round(float(item["tax"]), 2) for item in items]
+    taxable = [context.is_taxable(item.get("category")) for item in items]
+    taxable_subtotal = sum(float(item.get("subtotal") or 0) for item, t in zip(items, taxable) if t)
+    return [
+        round(tax * float(item.get("subtotal") or 0) / taxable_subtotal, 2) if t and taxable_subtotal else 0.0
+        for item, t in zip(items, taxable)
+    ]
+
+
+def _sale_rows(sale: Dict[str, Any], context: PricingContext) -> List[list]:
+    subtotal = float(sale.get("subtotal") or 0)
+    tax = float(sale.get("tax") or 0)
+    header = [
+        sale.get("id"), sale.get("created_at"), sale.get("payment_status"), sale.get("payment_method"),
+        sale.get("created_by"), sale.get("customer_id"), sale.get("customer_name"), sale.get("coupon_code"),
+        subtotal, float(sale.get("discount") or 0), float(sale.get("points_discount") or 0), tax,
+        float(sale.get("total") or 0),
+    ]
+    items = sale.get("items") or []
+    if not items:
+        return [header + [None] * 6]
+    rows = []
+    for item, line_tax in zip(items, _line_taxes(items, tax, context)):
+        line_subtotal = float(item.get("subtotal") or 0)
+        rows.append(header + [
+            item.get("item_id"), item.get("item_name"), int(item.get("quantity") or 0),
+            float(item.get("price") or 0), line_subtotal, line_tax,
+        ])
+    return rows
+
+
+async def iter_sale_rows(start: datetime, end: datetime, status: str = "completed") -> AsyncIterator[list]:
+    """Yield export rows for sales created in [start, end), oldest first."""
+    query: Dict[str, Any] = {"created_at": {"$gte": start.isoformat(), "$lt": end.isoformat()}}
+    if status != "all":
+        query["payment_status"] = status
+    context = await pricing_context()
+    cursor = db.sales.find(query, {"_id": 0}).sort("created_at", 1).batch_size(_CURSOR_BATCH)
+    async for sale in cursor:
+        for row in _sale_rows(sale, context):
+            yield row
+
+
+async def csv_chunks(rows: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Encode rows as UTF-8 CSV (with BOM so Excel detects the encoding)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    async for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= _CSV_FLUSH_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _append_rows(ws, batch: Iterable[list]):
+    for row in batch:
+        ws.append(row)
+
+
+async def xlsx_chunks(rows: AsyncIterator[list], sheet_title: str = "Sales") -> AsyncIterator[bytes]:
+    """Build a write-only workbook (rows spill to a temp file, not memory), then
+    stream the saved file; the first byte goes out once the workbook is complete.
+    openpyxl is synchronous, so it runs in a thread."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    ws.append(EXPORT_COLUMNS)
+    batch: List[list] = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= _XLSX_BATCH_ROWS:
+            await asyncio.to_thread(_append_rows, ws, batch)
+            batch = []
+    if batch:
+        await asyncio.to_thread(_append_rows, ws, batch)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(wb.save, path)
+        with open(path, "rb") as fh:
+            while True:
+                chunk = await asyncio.to_thread(fh.read, _FILE_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-encode a byte stream incrementally (for Content-Encoding: gzip)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
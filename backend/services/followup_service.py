@@ -0,0 +1,119 @@
+"""Post-purchase follow-up emails, drained by a pool of concurrent senders.
+
+Follow-ups are queued by POST /sales with status "pending" and a `send_at`.
+Every sender atomically claims one due follow-up with `find_one_and_update`.
+The claim sets status "sending" and a lease, so two workers (or two
+scheduler instances) never send the same follow-up. A claim whose lease
+expired, because its process died mid-send, becomes claimable again.
+
+A failed send goes back to "pending" with `send_at` pushed out by an
+exponential backoff. After _MAX_ATTEMPTS attempts it is marked "failed".
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from core.config import db, logger, FOLLOWUP_WORKERS
+from core.security import strip_html
+from services.email_service import send_followup_email
+
+_LEASE_SECONDS = 300
+_MAX_ATTEMPTS = 5
+_BACKOFF_BASE_SECONDS = 300
+_BACKOFF_MAX_SECONDS = 6 * 3600
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(_BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), _BACKOFF_MAX_SECONDS))
+
+
+async def claim_followup(worker_id: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Atomically take the oldest due follow-up (or one whose claim lease expired)."""
+    now = now or datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    return await db.followups.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "send_at": {"$lte": now_iso}},
+            {"status": "sending", "lease_expires_at": {"$lt": now_iso}},
+        ]},
+        {
+            "$set": {
+                "status": "sending",
+                "claimed_by": worker_id,
+                "lease_expires_at": (now + timedelta(seconds=_LEASE_SECONDS)).isoformat(),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("send_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _finish(followup: Dict[str, Any], worker_id: str, sent: bool, error: Optional[str] = None):
+    now = datetime.now(timezone.utc)
+    attempts = int(followup.get("attempts") or 1)
+    if sent:
+        fields = {"status": "sent", "sent_at": now.isoformat(), "last_error": None}
+    elif attempts >= _MAX_ATTEMPTS:
+        fields = {"status": "failed", "last_error": error}
+    else:
+        fields = {"status": "pending", "send_at": (now + _backoff(attempts)).isoformat(), "last_error": error}
+    # Only the current claim holder may settle it (a lease-expired claim may have been retaken)
+    await db.followups.update_one(
+        {"id": followup["id"], "status": "sending", "claimed_by": worker_id},
+        {"$set": fields, "$unset": {"claimed_by": "", "lease_expires_at": ""}},
+    )
+
+
+async def _send(followup: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    return await asyncio.to_thread(
+        send_followup_email,
+        to_email=followup["customer_email"],
+        customer_name=followup.get("customer_name", "Valued Customer"),
+        items_summary=followup.get("items_summary", "your order"),
+        business_name=context["business_name"],
+        days_ago=int(followup.get("days", 14)),
+        review_url=context["review_url"],
+        is_first_purchase=bool(followup.get("is_first_purchase", False)),
+        cumulative_total_spent=float(followup.get("cumulative_total_spent", 0) or 0),
+        vip_threshold=context["vip_threshold"],
+    )
+
+
+async def _worker(context: Dict[str, Any], deadline: float, stats: Dict[str, int]):
+    worker_id = f"{context['run_id']}:{uuid.uuid4().hex[:6]}"
+    while time.monotonic() < deadline:
+        followup = await claim_followup(worker_id)
+        if not followup:
+            return
+        try:
+            sent, error = await _send(followup, context), None
+            if not sent:
+                error = "send failed"
+        except Exception as e:
+            sent, error = False, str(e)
+        await _finish(followup, worker_id, sent, error)
+        stats["sent" if sent else "failed"] += 1
+
+
+async def process_followups(workers: int = FOLLOWUP_WORKERS, max_seconds: float = 200) -> Dict[str, int]:
+    """Drain due follow-ups with `workers` concurrent senders until none are due
+    or `max_seconds` have passed. Returns counts of sent and failed attempts."""
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0}) or {}
+    context = {
+        "run_id": uuid.uuid4().hex[:8],
+        "business_name": strip_html(settings.get("business_name", "TECHZONE")),
+        "review_url": (settings.get("google_review_url") or "").strip() or None,
+        "vip_threshold": float(settings.get("vip_spend_threshold") or 0) or 20000.0,
+    }
+    stats = {"sent": 0, "failed": 0}
+    deadline = time.monotonic() + max_seconds
+    await asyncio.gather(*(_worker(context, deadline, stats) for _ in range(max(1, workers))))
+    if stats["sent"] or stats["failed"]:
+        logger.info(f"Follow-ups processed: {stats}")
+    return stats
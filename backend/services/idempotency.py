@@ -0,0 +1,108 @@
+"""`Idempotency-Key` support for POST endpoints that must not run twice.
+
+A terminal whose request timed out retries it with the same key and gets the
+original response back instead of a second sale, cash movement or payment.
+Keys are scoped per endpoint and user. A key is claimed by inserting it into
+`idempotency_keys` (unique on `key`) before the write path runs. The response
+is stored on the same document, and a TTL index on `expires_at` removes it
+after IDEMPOTENCY_TTL_HOURS. Recent responses are also held in process, so
+most retries are answered without a query.
+
+- Same key while the first request is still running: 409.
+- Same key with a different request body: 422.
+- If the first request fails, the claim is released so it can be retried.
+"""
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
+
+from core.config import db, IDEMPOTENCY_TTL_HOURS
+
+_KEY_RE = re.compile(r"^[\x21-\x7e]{1,128}$")
+_HOT_MAX = 1024
+_HOT_TTL = 600.0
+_STALE_SECONDS = 300  # an in-progress claim this old belongs to a request that died
+_hot: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+
+
+def _fingerprint(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _remember(key: str, fingerprint: str, body: Any):
+    _hot[key] = (time.monotonic(), fingerprint, body)
+    _hot.move_to_end(key)
+    while len(_hot) > _HOT_MAX:
+        _hot.popitem(last=False)
+
+
+def _replay(stored_fingerprint: str, fingerprint: str, body: Any) -> JSONResponse:
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return JSONResponse(content=body, headers={"Idempotent-Replayed": "true"})
+
+
+async def run_idempotent(scope: str, key: Optional[str], user: Dict[str, Any], payload: Dict[str, Any],
+                         handler: Callable[[], Awaitable[Any]]) -> Any:
+    """Run `handler` once per (scope, user, key); replay its response afterwards.
+
+    Without a key the handler simply runs. `payload` is the request body,
+    used to detect a key reused for a different request.
+    """
+    if key is None:
+        return await handler()
+    if not _KEY_RE.match(key):
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-128 printable characters")
+    full_key = f"{scope}:{user['user_id']}:{key}"
+    fingerprint = _fingerprint(payload)
+
+    hot = _hot.get(full_key)
+    if hot and time.monotonic() - hot[0] < _HOT_TTL:
+        return _replay(hot[1], fingerprint, hot[2])
+
+    now = datetime.now(timezone.utc)
+    try:
+        await db.idempotency_keys.insert_one({
+            "key": full_key,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "locked_at": now,
+            "created_at": now.isoformat(),
+            "expires_at": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        })
+    except DuplicateKeyError:
+        existing = await db.idempotency_keys.find_one({"key": full_key}, {"_id": 0})
+        if existing and existing.get("status") == "completed":
+            _remember(full_key, existing["fingerprint"], existing["response"])
+            return _replay(existing["fingerprint"], fingerprint, existing["response"])
+        taken = await db.idempotency_keys.find_one_and_update(
+            {"key": full_key, "status": "in_progress",
+             "locked_at": {"$lt": now - timedelta(seconds=_STALE_SECONDS)}},
+            {"$set": {"fingerprint": fingerprint, "locked_at": now}},
+        )
+        if not taken:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    try:
+        result = await handler()
+    except BaseException:
+        await db.idempotency_keys.delete_one({"key": full_key, "status": "in_progress"})
+        raise
+
+    body = jsonable_encoder(result)
+    await db.idempotency_keys.update_one(
+        {"key": full_key},
+        {"$set": {"status": "completed", "response": body,
+                  "completed_at": datetime.now(timezone.utc).isoformat()}},
+    )
+    _remember(full_key, fingerprint, body)
+    return result
@@ -0,0 +1,387 @@
+"""Background jobs for operations that outlive an HTTP request.
+
+Year-long reports, full-customer scoring, backups, restores and large exports
+can take longer than the reverse proxy's request timeout. Route modules
+register such operations here as job types (`@job_type(...)`). Clients submit a
+job with `POST /jobs/{type}`, poll `GET /jobs/{id}` for the persisted status and
+progress, and fetch the outcome from `GET /jobs/{id}/result`.
+
+* A job runs as an asyncio task in the worker that accepted it. The job
+  document records that worker (`owner`), which refreshes `heartbeat_at`
+  every _HEARTBEAT_SECONDS. Its coroutine gets a `JobContext` for reporting
+  progress and for pushing CPU-bound steps onto a process pool
+  (`ctx.run_cpu`), which keeps the event loop free.
+* Each type has its own concurrency limit. Types that share a `group` also
+  share the limit, so a restore can never overlap a migration. The limit
+  holds across all workers: a job runs only while it holds one of the
+  group's `concurrency` slot leases (services/leases.py). Once a group
+  already has `max_active` jobs queued or running (counted in Mongo), new
+  submissions fail fast with `JobQueueFull`.
+* Small results are stored on the job document. File results (a `JobFile`)
+  are written under JOBS_DIR. Finished jobs expire after JOB_RETENTION_HOURS
+  through a TTL index on `expires_at`.
+* Cancelling a job in its own worker cancels its task at the next await.
+  For a job owned by another worker, cancellation sets `cancel_requested`.
+  The owner picks that up at its next heartbeat or `ctx.progress` call and
+  stops the job. A step already running in a worker process finishes and
+  its result is discarded.
+* Jobs whose heartbeat has gone stale are marked failed, because their
+  worker died. This is checked at boot and periodically by the scheduler.
+  Jobs of live workers are left alone.
+"""
+import asyncio
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import db, logger, JOBS_DIR, JOB_CPU_WORKERS, JOB_RETENTION_HOURS
+from services.leases import WORKER_ID, acquire_lease, hold_lease, new_owner
+
+ACTIVE_STATUSES = ("queued", "running")
+_PROGRESS_INTERVAL = 1.0  # seconds between persisted progress writes
+_HEARTBEAT_SECONDS = 5
+_STALE_SECONDS = 60  # no heartbeat for this long: the owning worker is gone
+_SLOT_TTL = 60
+_SLOT_POLL_SECONDS = 2.0
+
+
+class JobError(RuntimeError):
+    """Base class for job submission failures."""
+
+
+class UnknownJobType(JobError):
+    pass
+
+
+class JobQueueFull(JobError):
+    pass
+
+
+class JobCancelled(Exception):
+    """Raised inside a job whose cancellation was requested from another worker."""
+
+
+@dataclass
+class JobSpec:
+    type: str
+    run: Callable[["JobContext", Dict[str, Any]], Awaitable[Any]]
+    concurrency: int = 1
+    max_active: int = 10
+    roles: Optional[Tuple[str, ...]] = ("admin", "manager")  # None = any signed-in user
+    group: Optional[str] = None
+    timeout: Optional[float] = None
+    public: bool = True  # submittable through POST /jobs/{type}
+    validate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+
+
+@dataclass
+class JobFile:
+    """A job result written to disk (see `JobContext.result_path`)."""
+    path: Path
+    filename: str
+    media_type: str
+    summary: Optional[Dict[str, Any]] = None
+
+
+_SPECS: Dict[str, JobSpec] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+_cpu_executor: Optional[ProcessPoolExecutor] = None
+
+
+def job_type(name: str, **options):
+    """Decorator registering `async def run(ctx, params)` as job type `name`."""
+    def register(run):
+        _SPECS[name] = JobSpec(type=name, run=run, **options)
+        return run
+    return register
+
+
+def job_spec(name: str) -> JobSpec:
+    spec = _SPECS.get(name)
+    if spec is None:
+        raise UnknownJobType(f"Unknown job type: {name}")
+    return spec
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_cpu_executor() -> ProcessPoolExecutor:
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ProcessPoolExecutor(
+            max_workers=JOB_CPU_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _cpu_executor
+
+
+class JobContext:
+    """Handle passed to a running job."""
+
+    def __init__(self, job_id: str, payload: Any = None):
+        self.job_id = job_id
+        # In-memory input (e.g. an uploaded file) that is too large to persist as params
+        self.payload = payload
+        self.latest = {"done": 0, "total": None, "message": None}
+        self._last_progress = 0.0
+
+    async def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None,
+                       force: bool = False):
+        """Persist progress, at most once per second unless `force`."""
+        self.latest = {"done": done, "total": total, "message": message}
+        now = time.monotonic()
+        if not force and now - self._last_progress < _PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        doc = await db.jobs.find_one_and_update(
+            {"id": self.job_id},
+            {"$set": {"progress": self.latest, "updated_at": _now().isoformat()}},
+            projection={"_id": 0, "cancel_requested": 1},
+        )
+        if doc and doc.get("cancel_requested"):
+            raise JobCancelled()
+
+    def result_path(self, suffix: str) -> Path:
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        return JOBS_DIR / f"{self.job_id}{suffix}"
+
+    async def run_cpu(self, fn: Callable, *args):
+        """Run a picklable module-level function on the CPU worker pool."""
+        if JOB_CPU_WORKERS <= 0:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_cpu_executor(), fn, *args)
+
+
+def _public(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if doc is None:
+        return None
+    doc.pop("_id", None)
+    if isinstance(doc.get("expires_at"), datetime):
+        doc["expires_at"] = doc["expires_at"].replace(tzinfo=timezone.utc).isoformat()
+    if doc.get("result_file"):
+        doc["result_url"] = f"/api/jobs/{doc['id']}/result"
+    return doc
+
+
+def _remove_files(job_id: str):
+    if JOBS_DIR.exists():
+        for path in JOBS_DIR.glob(f"{job_id}.*"):
+            path.unlink(missing_ok=True)
+
+
+async def _heartbeat(job_id: str, task: asyncio.Task):
+    """Keep the job's heartbeat fresh; cancel it when another worker asked to."""
+    while True:
+        await asyncio.sleep(_HEARTBEAT_SECONDS)
+        try:
+            doc = await db.jobs.find_one_and_update(
+                {"id": job_id},
+                {"$set": {"heartbeat_at": _now().isoformat()}},
+                projection={"_id": 0, "cancel_requested": 1},
+            )
+        except Exception as e:
+            logger.warning(f"Job {job_id} heartbeat failed: {e}")
+            continue
+        if doc and doc.get("cancel_requested"):
+            task.cancel()
+            return
+
+
+async def _wait_for_slot(group: str, concurrency: int) -> Tuple[str, str]:
+    """Take one of the group's slot leases, polling until one is free."""
+    while True:
+        for slot in range(concurrency):
+            name, owner = f"jobs:{group}:{slot}", new_owner()
+            if await acquire_lease(name, owner, _SLOT_TTL):
+                return name, owner
+        await asyncio.sleep(_SLOT_POLL_SECONDS)
+
+
+async def _run(spec: JobSpec, job_id: str, params: Dict[str, Any], ctx: JobContext):
+    group = spec.group or spec.type
+    status, fields = "failed", {}
+    heartbeat = asyncio.create_task(_heartbeat(job_id, asyncio.current_task()))
+    try:
+        slot, owner = await _wait_for_slot(group, spec.concurrency)
+        async with hold_lease(slot, _SLOT_TTL, owner=owner):
+            await db.jobs.update_one(
+                {"id": job_id, "status": "queued"},
+                {"$set": {"status": "running", "started_at": _now().isoformat()}},
+            )
+            if spec.timeout:
+                outcome = await asyncio.wait_for(spec.run(ctx, params), spec.timeout)
+            else:
+                outcome = await spec.run(ctx, params)
+        if isinstance(outcome, JobFile):
+            fields["result_file"] = {
+                "name": outcome.path.name, "filename": outcome.filename,
+                "media_type": outcome.media_type, "size": outcome.path.stat().st_size,
+            }
+            fields["result"] = outcome.summary
+        else:
+            fields["result"] = outcome
+        total = ctx.latest["total"]
+        fields["progress"] = {"done": total if total is not None else ctx.latest["done"], "total": total,
+                              "message": None}
+        status = "completed"
+    except (asyncio.CancelledError, JobCancelled):
+        status = "cancelled"
+    except asyncio.TimeoutError:
+        fields["error"] = f"Job exceeded its {spec.timeout:.0f}s time limit"
+    except Exception as e:
+        logger.error(f"Job {spec.type} ({job_id}) failed: {e}")
+        fields["error"] = str(e) or e.__class__.__name__
+    finally:
+        heartbeat.cancel()
+        _tasks.pop(job_id, None)
+
+    if status != "completed":
+        _remove_files(job_id)
+    now = _now()
+    try:
+        # Conditional so a cancel recorded while we were finishing is not overwritten
+        await db.jobs.update_one(
+            {"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"$set": {"status": status, "finished_at": now.isoformat(),
+                      "expires_at": now + timedelta(hours=JOB_RETENTION_HOURS), **fields}},
+        )
+    except Exception as e:
+        logger.error(f"Could not record outcome of job {job_id}: {e}")
+
+
+async def submit_job(name: str, params: Optional[Dict[str, Any]], user: Dict[str, Any],
+                     payload: Any = None) -> Dict[str, Any]:
+    """Queue a job and return its document. Validation errors raise ValueError."""
+    spec = job_spec(name)
+    params = dict(params or {})
+    if spec.validate:
+        params = spec.validate(params)
+    group = spec.group or spec.type
+    active = {"group": group, "status": {"$in": list(ACTIVE_STATUSES)}}
+    if await db.jobs.count_documents(active) >= spec.max_active:
+        raise JobQueueFull(f"Too many '{group}' jobs queued, try again shortly")
+
+    now_iso = _now().isoformat()
+    doc = {
+        "id": str(uuid.uuid4()),
+        "type": name,
+        "group": group,
+        "status": "queued",
+        "params": params,
+        "progress": {"done": 0, "total": None, "message": None},
+        "result": None,
+        "result_file": None,
+        "error": None,
+        "owner": WORKER_ID,
+        "heartbeat_at": now_iso,
+        "cancel_requested": False,
+        "created_by": user.get("username"),
+        "created_at": now_iso,
+        "updated_at": now_iso,
+        "started_at": None,
+        "finished_at": None,
+    }
+    await db.jobs.insert_one(doc)
+    # Submissions racing on other workers: only the first `max_active` (by creation) stay
+    ahead = await db.jobs.count_documents({**active, "$or": [
+        {"created_at": {"$lt": now_iso}}, {"created_at": now_iso, "id": {"$lt": doc["id"]}},
+    ]})
+    if ahead >= spec.max_active:
+        await db.jobs.delete_one({"id": doc["id"]})
+        raise JobQueueFull(f"Too many '{group}' jobs queued, try again shortly")
+    _tasks[doc["id"]] = asyncio.create_task(_run(spec, doc["id"], params, JobContext(doc["id"], payload)))
+    return _public(doc)
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _public(await db.jobs.find_one({"id": job_id}))
+
+
+async def list_jobs(username: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Most recent jobs first; all users' jobs when `username` is None."""
+    query = {"created_by": username} if username else {}
+    docs = await db.jobs.find(query, {"params": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    return [_public(d) for d in docs]
+
+
+async def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Cancel a queued or running job; finished jobs are returned unchanged."""
+    task = _tasks.get(job_id)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    else:
+        # Owned by another worker: it stops the job at its next heartbeat or progress call
+        active = {"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}}
+        await db.jobs.update_one(active, {"$set": {"cancel_requested": True}})
+        # ...unless that worker is gone, in which case record the cancellation here
+        now = _now()
+        await db.jobs.update_one(
+            {**active, **_stale_heartbeat(now)},
+            {"$set": {"status": "cancelled", "finished_at": now.isoformat(),
+                      "expires_at": now + timedelta(hours=JOB_RETENTION_HOURS)}},
+        )
+    return await get_job(job_id)
+
+
+def job_file_path(doc: Dict[str, Any]) -> Optional[Path]:
+    info = doc.get("result_file") or {}
+    path = JOBS_DIR / info["name"] if info.get("name") else None
+    return path if path is not None and path.exists() else None
+
+
+def _stale_heartbeat(now: datetime) -> Dict[str, Any]:
+    cutoff = (now - timedelta(seconds=_STALE_SECONDS)).isoformat()
+    return {"$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": None}]}
+
+
+async def recover_jobs():
+    """Mark jobs whose worker died (stale heartbeat) as failed and drop result
+    files of expired jobs. Runs at boot and periodically from the scheduler."""
+    try:
+        now = _now()
+        result = await db.jobs.update_many(
+            {"status": {"$in": list(ACTIVE_STATUSES)}, **_stale_heartbeat(now)},
+            {"$set": {"status": "failed", "error": "Interrupted by a server restart",
+                      "finished_at": now.isoformat(),
+                      "expires_at": now + timedelta(hours=JOB_RETENTION_HOURS)}},
+        )
+        if result.modified_count:
+            logger.warning(f"Marked {result.modified_count} interrupted job(s) as failed")
+        await purge_job_files()
+    except Exception as e:
+        logger.error(f"Job recovery failed: {e}")
+
+
+async def purge_job_files():
+    """Delete result files whose job document has expired (TTL) or was removed."""
+    if not JOBS_DIR.exists():
+        return
+    files = [(p.name.split(".", 1)[0], p) for p in JOBS_DIR.iterdir() if p.is_file()]
+    if not files:
+        return
+    cursor = db.jobs.find({"id": {"$in": list({job_id for job_id, _ in files})}}, {"_id": 0, "id": 1})
+    alive = {doc["id"] async for doc in cursor}
+    for job_id, path in files:
+        if job_id not in alive:
+            path.unlink(missing_ok=True)
+
+
+def shutdown_jobs():
+    """Cancel in-process jobs and stop the CPU worker pool (app shutdown)."""
+    global _cpu_executor
+    for task in list(_tasks.values()):
+        task.cancel()
+    executor, _cpu_executor = _cpu_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,117 @@
+"""Named leases in Mongo: at most one holder at a time across all workers.
+
+A lease is a `leases` document `{id, owner, expires_at, ...}`. `acquire_lease`
+takes it when it is free, expired or already held by the same owner; the holder
+renews it by acquiring again before `expires_at`. `hold_lease` does that in the
+background while its block runs and releases the lease afterwards. If a renewal
+finds the lease taken over (e.g. this worker stalled past the TTL), the block is
+interrupted with `LeaseLost` instead of carrying on next to the new holder.
+
+Owners are unique per acquisition (`new_owner`), so two tasks in one process
+exclude each other just like two workers do. The scheduler keeps its own lease
+(services/scheduler.py).
+"""
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from core.config import db, logger
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseBusy(RuntimeError):
+    """Another owner holds the lease."""
+
+
+class LeaseLost(RuntimeError):
+    """The lease expired and was taken over while its block was still running."""
+
+
+def new_owner() -> str:
+    return f"{WORKER_ID}:{uuid.uuid4().hex[:12]}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def acquire_lease(name: str, owner: str, ttl: float, **fields) -> bool:
+    """Take or extend lease `name` for `ttl` seconds; False if someone else holds it."""
+    now = _now()
+    try:
+        lease = await db.leases.find_one_and_update(
+            {"id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "renewed_at": now, "expires_at": now + timedelta(seconds=ttl), **fields}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False  # upsert raced with the live holder's document
+    return bool(lease) and lease.get("owner") == owner
+
+
+async def update_lease(name: str, owner: str, **fields) -> bool:
+    """Set extra fields on a lease we hold."""
+    result = await db.leases.update_one({"id": name, "owner": owner}, {"$set": fields})
+    return result.matched_count == 1
+
+
+async def release_lease(name: str, owner: str):
+    await db.leases.delete_one({"id": name, "owner": owner})
+
+
+async def read_lease(name: str) -> Optional[Dict[str, Any]]:
+    """The live (unexpired) lease document, or None."""
+    return await db.leases.find_one({"id": name, "expires_at": {"$gt": _now()}}, {"_id": 0})
+
+
+@asynccontextmanager
+async def hold_lease(name: str, ttl: float = 60, owner: Optional[str] = None, **fields):
+    """Hold lease `name` for the duration of the block; yields the owner token.
+
+    Raises LeaseBusy when another owner holds it.
+    """
+    owner = owner or new_owner()
+    if not await acquire_lease(name, owner, ttl, **fields):
+        raise LeaseBusy(f"'{name}' is already running on another worker")
+    task = asyncio.current_task()
+    lost = False
+
+    async def renew():
+        nonlocal lost
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                held = await acquire_lease(name, owner, ttl)
+            except Exception as e:
+                logger.warning(f"Lease {name} renewal failed: {e}")
+                continue
+            if not held:
+                lost = True
+                logger.error(f"Lease {name} was lost by {owner}")
+                task.cancel()
+                return
+
+    renewer = asyncio.create_task(renew())
+    try:
+        yield owner
+    except asyncio.CancelledError:
+        if lost:
+            task.uncancel()
+            raise LeaseLost(f"Lost the '{name}' lease to another worker") from None
+        raise
+    finally:
+        renewer.cancel()
+        if not lost:
+            try:
+                await release_lease(name, owner)
+            except Exception as e:
+                logger.error(f"Lease {name} release failed: {e}")
@@ -0,0 +1,95 @@
+"""On-disk, content-addressed cache of rendered PDFs.
+
+An artifact's key is sha256(kind, TEMPLATE_VERSION, canonical JSON of the
+report data minus `generated_at`), so identical inputs — a re-clicked
+download, a scheduler retry, the email attachment for a report just viewed —
+reuse the exact same bytes instead of re-rendering.
+
+Artifacts live in UPLOAD_DIR/pdf_cache. Regular entries are evicted least-
+recently-used (file mtime is bumped on every hit) once the directory exceeds
+PDF_CACHE_MAX_BYTES. Pinned entries (e.g. closed shift reports, which can no
+longer change) live under `pinned/` with a stable name and are never evicted.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from core.config import logger, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+from services.pdf_templates import TEMPLATE_VERSION
+
+_PINNED_DIR = PDF_CACHE_DIR / "pinned"
+_VOLATILE_KEYS = ("generated_at",)
+
+
+def cache_key(kind: str, data: Dict[str, Any]) -> str:
+    stable = {k: v for k, v in data.items() if k not in _VOLATILE_KEYS}
+    blob = json.dumps([kind, TEMPLATE_VERSION, stable], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def pinned_key(name: str) -> str:
+    """Stable key for an immutable artifact (template version included)."""
+    return f"{name}-v{TEMPLATE_VERSION}"
+
+
+def _path(key: str, pinned: bool) -> Path:
+    return (_PINNED_DIR if pinned else PDF_CACHE_DIR) / f"{key}.pdf"
+
+
+def _read(path: Path) -> Optional[bytes]:
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)  # LRU touch
+    except OSError:
+        pass
+    return data
+
+
+def _write(path: Path, pdf_bytes: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(pdf_bytes)
+    os.replace(tmp, path)
+
+
+def _evict():
+    """Drop least-recently-used regular artifacts until under the size budget."""
+    entries = []
+    total = 0
+    for p in PDF_CACHE_DIR.glob("*.pdf"):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+        total += st.st_size
+    if total <= PDF_CACHE_MAX_BYTES:
+        return
+    entries.sort()
+    for _, size, p in entries:
+        if total <= PDF_CACHE_MAX_BYTES:
+            break
+        try:
+            p.unlink()
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+async def get(key: str, pinned: bool = False) -> Optional[bytes]:
+    return await asyncio.to_thread(_read, _path(key, pinned))
+
+
+async def put(key: str, pdf_bytes: bytes, pinned: bool = False):
+    try:
+        await asyncio.to_thread(_write, _path(key, pinned), pdf_bytes)
+        if not pinned:
+            await asyncio.to_thread(_evict)
+    except OSError as e:
+        logger.warning(f"PDF cache write failed for {key}: {e}")
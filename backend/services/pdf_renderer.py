@@ -0,0 +1,194 @@
+"""Off-loop PDF rendering on a process pool.
+
+ReportLab's `doc.build()` is pure-Python and CPU-bound; running it inside an
+async handler stalls every terminal talking to this server. Callers collect
+report data (async, from Mongo), then `await render_pdf(kind, data)`, which
+renders one of the `services.pdf_templates.RENDERERS` in a worker process.
+
+* Workers are started with the `spawn` context (never fork a process that owns
+  an event loop and Mongo connections) and prebuild the paragraph styles once.
+* At most PDF_RENDER_QUEUE jobs may be queued or running; beyond that
+  `render_pdf` fails fast with `PdfRenderBusy` instead of piling up work.
+* Each job gets PDF_RENDER_TIMEOUT seconds. A job that overruns raises
+  `PdfRenderTimeout` and the pool is recycled so a wedged worker cannot
+  hold a slot forever.
+* PDF_RENDER_WORKERS=0 renders in a thread instead (single-process installs).
+* Results go through `services.pdf_cache`, so identical inputs are rendered
+  once; `pdf_response` adds ETag / 304 handling for download endpoints.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from core.config import logger, PDF_RENDER_WORKERS, PDF_RENDER_QUEUE, PDF_RENDER_TIMEOUT
+from services import pdf_cache
+from services.pdf_templates import RENDERERS, render, warm_styles
+
+
+class PdfRenderError(RuntimeError):
+    """Base class for rendering failures callers may want to map to HTTP 503."""
+
+
+class PdfRenderBusy(PdfRenderError):
+    pass
+
+
+class PdfRenderTimeout(PdfRenderError):
+    pass
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_inflight: Dict[str, "asyncio.Future[bytes]"] = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_styles,
+        )
+    return _executor
+
+
+def _recycle_executor():
+    """Tear down the pool (killing any stuck worker); the next job starts a fresh one."""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is None:
+        return
+    for proc in list((getattr(executor, "_processes", None) or {}).values()):
+        proc.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _render_uncached(kind: str, data: Dict[str, Any], timeout: Optional[float]) -> bytes:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PDF_RENDER_QUEUE)
+    if _slots.locked():
+        raise PdfRenderBusy("PDF renderer is busy, try again shortly")
+
+    timeout = timeout or PDF_RENDER_TIMEOUT
+    async with _slots:
+        if PDF_RENDER_WORKERS <= 0:
+            job = asyncio.to_thread(render, kind, data)
+        else:
+            job = asyncio.get_running_loop().run_in_executor(_get_executor(), render, kind, data)
+        try:
+            return await asyncio.wait_for(job, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"PDF render '{kind}' exceeded {timeout:.0f}s; recycling worker pool")
+            if PDF_RENDER_WORKERS > 0:
+                _recycle_executor()
+            raise PdfRenderTimeout(f"PDF render '{kind}' timed out")
+        except BrokenProcessPool:
+            logger.error(f"PDF worker pool broke while rendering '{kind}'; recycling")
+            _recycle_executor()
+            raise PdfRenderError(f"PDF render '{kind}' failed")
+
+
+async def render_pdf_artifact(
+    kind: str,
+    data: Dict[str, Any],
+    timeout: Optional[float] = None,
+    pin_as: Optional[str] = None,
+) -> Tuple[bytes, str]:
+    """Return (pdf_bytes, cache_key), rendering only on a cache miss.
+
+    `pin_as` names an immutable artifact: it is stored under that stable name
+    and never evicted. Concurrent requests for the same key share one render.
+    """
+    if kind not in RENDERERS:
+        raise ValueError(f"Unknown PDF kind: {kind}")
+    pinned = pin_as is not None
+    key = pdf_cache.pinned_key(pin_as) if pinned else pdf_cache.cache_key(kind, data)
+
+    cached = await pdf_cache.get(key, pinned)
+    if cached is not None:
+        return cached, key
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight), key
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        pdf_bytes = await _render_uncached(kind, data, timeout)
+        await pdf_cache.put(key, pdf_bytes, pinned)
+        future.set_result(pdf_bytes)
+        return pdf_bytes, key
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def render_pdf(kind: str, data: Dict[str, Any], timeout: Optional[float] = None,
+                     pin_as: Optional[str] = None) -> bytes:
+    """Render `kind` with `data` (picklable) off the event loop and return the PDF bytes."""
+    pdf_bytes, _ = await render_pdf_artifact(kind, data, timeout, pin_as)
+    return pdf_bytes
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def pdf_response(
+    kind: str,
+    load_data: Callable[[], Awaitable[Dict[str, Any]]],
+    filename: str,
+    if_none_match: Optional[str] = None,
+    pin_as: Optional[str] = None,
+) -> Response:
+    """Download response for a cached PDF with ETag / If-None-Match (304) support.
+
+    `load_data` is only awaited when the answer is not already known: a pinned
+    artifact that is on disk is served without collecting its data at all.
+    Render failures surface as HTTP 503.
+    """
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if pin_as is not None:
+        key = pdf_cache.pinned_key(pin_as)
+        headers["Cache-Control"] = "private, max-age=31536000, immutable"
+        headers["ETag"] = f'"{key}"'
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        pdf_bytes = await pdf_cache.get(key, pinned=True)
+        if pdf_bytes is not None:
+            return Response(pdf_bytes, media_type="application/pdf", headers=headers)
+        data = await load_data()
+    else:
+        data = await load_data()
+        headers["Cache-Control"] = "private, no-cache"
+        headers["ETag"] = f'"{pdf_cache.cache_key(kind, data)}"'
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    try:
+        pdf_bytes, _ = await render_pdf_artifact(kind, data, pin_as=pin_as)
+    except PdfRenderError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(pdf_bytes, media_type="application/pdf", headers=headers)
+
+
+def shutdown_renderer():
+    """Stop the worker pool (app shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
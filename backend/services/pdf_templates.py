@@ -0,0 +1,441 @@
+"""Pure ReportLab templates: serializable report data in, PDF bytes out.
+
+Nothing here touches the database or the event loop, so every `render_*`
+function can run inside a `services.pdf_renderer` worker process. Paragraph
+styles are built once per process (`pdf_styles`) and reused by every render.
+"""
+from __future__ import annotations
+
+import io
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Part of every PDF cache key: bump whenever any layout below changes.
+TEMPLATE_VERSION = "1"
+
+
+@lru_cache(maxsize=1)
+def pdf_styles() -> Dict[str, Any]:
+    styles = getSampleStyleSheet()
+    return {
+        "styles": styles,
+        # Shift reports / summaries
+        "title": ParagraphStyle('Title', parent=styles['Title'], fontSize=20, textColor=colors.HexColor('#8b5cf6'), spaceAfter=6),
+        "subtitle": ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=12, textColor=colors.gray, alignment=TA_CENTER),
+        "heading": ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=colors.HexColor('#374151'), spaceBefore=20, spaceAfter=10),
+        "footer": ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, textColor=colors.gray, alignment=TA_CENTER),
+        "summary_footer": ParagraphStyle('SummaryFooter', parent=styles['Normal'], fontSize=9, textColor=colors.gray, alignment=TA_CENTER, spaceBefore=20),
+        # Tax report
+        "tax_title": ParagraphStyle('TaxTitle', parent=styles['Heading1'], fontSize=24, alignment=TA_CENTER, spaceAfter=20, textColor=colors.HexColor('#1e3a8a')),
+        "tax_report_title": ParagraphStyle('ReportTitle', parent=styles['Heading2'], fontSize=18, alignment=TA_CENTER, spaceAfter=10),
+        "tax_subtitle": ParagraphStyle('TaxSubtitle', parent=styles['Normal'], fontSize=12, alignment=TA_CENTER, spaceAfter=30, textColor=colors.gray),
+        "tax_heading": ParagraphStyle('TaxHeading', parent=styles['Heading2'], fontSize=14, spaceBefore=20, spaceAfter=10, textColor=colors.HexColor('#374151')),
+    }
+
+
+def warm_styles():
+    """Process-pool initializer: build the style sheet before the first job arrives."""
+    pdf_styles()
+
+
+# ---------- Shared building blocks ----------
+
+def _format_summary_table(
+    opening_amount: float,
+    totals: Dict[str, float],
+    expected: float,
+    closing_amount: float = None,
+    difference: float = None,
+) -> Table:
+    """Build the cash-summary table. If closing_amount is given, appends variance row."""
+    data = [
+        ["Description", "Amount"],
+        ["Opening Float", f"${opening_amount:.2f}"],
+        ["+ Cash Sales", f"${totals['cash_sales']:.2f}"],
+        ["- Payouts", f"${totals['payouts']:.2f}"],
+        ["- Safe Drops", f"${totals['drops']:.2f}"],
+        ["- Refunds", f"${totals['refunds']:.2f}"],
+        ["= Expected Cash", f"${expected:.2f}"],
+    ]
+    if closing_amount is not None:
+        data.append(["Actual Cash Count", f"${closing_amount:.2f}"])
+        diff = difference if difference is not None else closing_amount - expected
+        diff_status = "OVER" if diff > 0 else "SHORT" if diff < 0 else "BALANCED"
+        data.append(["Variance", f"${diff:.2f} ({diff_status})"])
+
+    table = Table(data, colWidths=[3 * inch, 2 * inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f3e8ff')),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('PADDING', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+    ]))
+    return table
+
+
+def _parse_iso(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return None
+
+
+def _format_shift_info_table(shift: Dict[str, Any]) -> Tuple[Table, datetime]:
+    """Return (table, opened_at_datetime) for the Shift Details section."""
+    opened_at = _parse_iso(shift["opened_at"])
+    closed_at = _parse_iso(shift.get("closed_at"))
+    status = "OPEN" if shift["status"] == "open" else "CLOSED"
+
+    rows = [
+        ["Shift ID:", shift["id"][:8] + "..."],
+        ["Status:", status],
+        ["Opened By:", shift.get("opened_by_name", "Unknown")],
+        ["Opened At:", opened_at.strftime("%Y-%m-%d %H:%M:%S") if opened_at else "—"],
+    ]
+    if closed_at:
+        rows.append(["Closed By:", shift.get("closed_by_name", "Unknown")])
+        rows.append(["Closed At:", closed_at.strftime("%Y-%m-%d %H:%M:%S")])
+
+    table = Table(rows, colWidths=[1.5 * inch, 4 * inch])
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#6b7280')),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('PADDING', (0, 0), (-1, -1), 4),
+    ]))
+    return table, opened_at
+
+
+def _format_transactions_table(transactions: List[Dict[str, Any]]) -> Table:
+    data = [["Time", "Type", "Description", "Amount"]]
+    for t in transactions:
+        txn_time = _parse_iso(t["created_at"])
+        txn_type = t["transaction_type"].replace("_", " ").upper()
+        amount = t["amount"]
+        amount_str = f"${amount:.2f}" if amount >= 0 else f"-${abs(amount):.2f}"
+        data.append([
+            txn_time.strftime("%H:%M:%S") if txn_time else "—",
+            txn_type,
+            (t.get("description") or "-")[:30],
+            amount_str,
+        ])
+
+    table = Table(data, colWidths=[1 * inch, 1.2 * inch, 2.5 * inch, 1 * inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#374151')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+        ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
+        ('PADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    ]))
+    return table
+
+
+# ---------- Shift reports ----------
+
+def render_shift_report(data: Dict[str, Any]) -> bytes:
+    """Full PDF report for one shift.
+
+    `data`: business_name/address/phone, shift, transactions, totals, expected, generated_at.
+    """
+    shift = data["shift"]
+    transactions = data["transactions"]
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+    s = pdf_styles()
+    elements: list = []
+
+    # Header
+    elements.append(Paragraph(data["business_name"], s["title"]))
+    elements.append(Paragraph("Cash Register Shift Report", s["subtitle"]))
+    if data.get("business_address"):
+        elements.append(Paragraph(data["business_address"], s["subtitle"]))
+    if data.get("business_phone"):
+        elements.append(Paragraph(data["business_phone"], s["subtitle"]))
+    elements.append(Spacer(1, 20))
+
+    # Shift info
+    info_table, _ = _format_shift_info_table(shift)
+    elements.append(info_table)
+    elements.append(Spacer(1, 20))
+
+    # Summary
+    elements.append(Paragraph("Cash Summary", s["heading"]))
+    closing = shift.get("closing_amount") if shift["status"] == "closed" else None
+    diff = shift.get("difference") if shift["status"] == "closed" else None
+    elements.append(_format_summary_table(shift["opening_amount"], data["totals"], data["expected"], closing, diff))
+    elements.append(Spacer(1, 20))
+
+    # Transactions
+    if transactions:
+        elements.append(Paragraph(f"Transactions ({len(transactions)})", s["heading"]))
+        elements.append(_format_transactions_table(transactions))
+
+    # Notes
+    if shift.get("notes"):
+        elements.append(Spacer(1, 20))
+        elements.append(Paragraph("Notes", s["heading"]))
+        elements.append(Paragraph(shift["notes"], s["styles"]["Normal"]))
+
+    # Footer
+    elements.append(Spacer(1, 40))
+    elements.append(Paragraph(f"Generated on {data['generated_at']}", s["footer"]))
+    elements.append(Paragraph("This report is for internal record-keeping purposes.", s["footer"]))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_close_shift_email(data: Dict[str, Any]) -> bytes:
+    """Compact PDF attached to the auto-email when a shift is closed.
+
+    `data`: business_name, opening_amount, totals, expected, closing_amount, difference.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+    s = pdf_styles()
+    elements = [
+        Paragraph(data["business_name"], s["title"]),
+        Paragraph("Cash Register Shift Report", s["subtitle"]),
+        Spacer(1, 20),
+        _format_summary_table(
+            data["opening_amount"], data["totals"], data["expected"],
+            data["closing_amount"], data["difference"],
+        ),
+    ]
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# ---------- Sales + tax summary ----------
+
+def render_summary(data: Dict[str, Any]) -> bytes:
+    """Combined sales + tax summary for a period.
+
+    `data`: business_name, period_label, start, end, order_count, total_subtotal,
+    total_discount, total_tax, total_revenue, cash_total, card_total,
+    daily [{day, orders, revenue, tax}], generated_at.
+    """
+    start, end = data["start"], data["end"]
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+    s = pdf_styles()
+    elements = []
+
+    elements.append(Paragraph(data["business_name"], s["title"]))
+    elements.append(Paragraph(f"{data['period_label']} Sales &amp; Tax Summary", s["subtitle"]))
+    elements.append(
+        Paragraph(
+            f"{start.strftime('%Y-%m-%d')} &nbsp;&#8594;&nbsp; {end.strftime('%Y-%m-%d')}",
+            s["subtitle"],
+        )
+    )
+    elements.append(Spacer(1, 18))
+
+    elements.append(Paragraph("Financial Overview", s["heading"]))
+    totals = [
+        ["Metric", "Amount"],
+        ["Total Sales (orders)", f"{data['order_count']}"],
+        ["Gross Subtotal", f"${data['total_subtotal']:,.2f}"],
+        ["Discounts (coupons + points)", f"${data['total_discount']:,.2f}"],
+        ["Tax Collected", f"${data['total_tax']:,.2f}"],
+        ["Gross Revenue", f"${data['total_revenue']:,.2f}"],
+        ["— Cash Revenue", f"${data['cash_total']:,.2f}"],
+        ["— Card / Other Revenue", f"${data['card_total']:,.2f}"],
+    ]
+    t = Table(totals, colWidths=[3.5 * inch, 2.0 * inch])
+    t.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#8b5cf6")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+        ("PADDING", (0, 0), (-1, -1), 8),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#e5e7eb")),
+    ]))
+    elements.append(t)
+
+    if data["daily"]:
+        elements.append(Paragraph("Daily Breakdown", s["heading"]))
+        rows = [["Date", "Orders", "Revenue", "Tax"]]
+        for r in data["daily"]:
+            rows.append([
+                r["day"],
+                str(r["orders"]),
+                f"${r['revenue']:,.2f}",
+                f"${r['tax']:,.2f}",
+            ])
+        daily_table = Table(rows, colWidths=[2.0 * inch, 1.0 * inch, 1.5 * inch, 1.0 * inch])
+        daily_table.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#374151")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+            ("PADDING", (0, 0), (-1, -1), 6),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#e5e7eb")),
+        ]))
+        elements.append(daily_table)
+
+    elements.append(Paragraph(f"Generated on {data['generated_at']}", s["summary_footer"]))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# ---------- Tax report ----------
+
+def render_tax_report(data: Dict[str, Any]) -> bytes:
+    """Tax configuration, collection summary, taxable/exempt split and category breakdown.
+
+    `data`: generated_label, tax_enabled, tax_rate, exempt_categories,
+    periods [{label, sales, tax, count}], taxable_total, exempt_total,
+    total_tax_collected, categories [{category, sales, is_exempt}].
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    s = pdf_styles()
+    heading_style = s["tax_heading"]
+    exempt_categories = data["exempt_categories"]
+    taxable_total = data["taxable_total"]
+    exempt_total = data["exempt_total"]
+    total_tax_collected = data["total_tax_collected"]
+
+    elements = []
+
+    # Title
+    elements.append(Paragraph("TECHZONE", s["tax_title"]))
+    elements.append(Paragraph("Tax Report", s["tax_report_title"]))
+    elements.append(Paragraph(f"Generated: {data['generated_label']}", s["tax_subtitle"]))
+
+    # Tax Configuration
+    elements.append(Paragraph("Tax Configuration", heading_style))
+    config_data = [
+        ["Status", "Enabled" if data["tax_enabled"] else "Disabled"],
+        ["Tax Rate", f"{data['tax_rate'] * 100:.1f}%"],
+        ["Exempt Categories", ", ".join(exempt_categories) if exempt_categories else "None"]
+    ]
+    config_table = Table(config_data, colWidths=[2*inch, 4*inch])
+    config_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('PADDING', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+    ]))
+    elements.append(config_table)
+    elements.append(Spacer(1, 20))
+
+    # Tax Collection Summary
+    elements.append(Paragraph("Tax Collection Summary", heading_style))
+    summary_data = [["Period", "Sales", "Tax Collected", "Transactions"]]
+    for p in data["periods"]:
+        summary_data.append([p["label"], f"${p['sales']:.2f}", f"${p['tax']:.2f}", str(p["count"])])
+    summary_table = Table(summary_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('PADDING', (0, 0), (-1, -1), 10),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 20))
+
+    # Taxable vs Exempt
+    elements.append(Paragraph("Taxable vs Exempt Sales (This Month)", heading_style))
+    total_sales = taxable_total + exempt_total
+    taxable_pct = (taxable_total / total_sales * 100) if total_sales > 0 else 0
+    exempt_pct = (exempt_total / total_sales * 100) if total_sales > 0 else 0
+
+    taxable_exempt_data = [
+        ["Type", "Amount", "Percentage"],
+        ["Taxable Sales", f"${taxable_total:.2f}", f"{taxable_pct:.1f}%"],
+        ["Exempt Sales", f"${exempt_total:.2f}", f"{exempt_pct:.1f}%"],
+        ["Total", f"${total_sales:.2f}", "100%"],
+    ]
+    te_table = Table(taxable_exempt_data, colWidths=[2*inch, 2*inch, 2*inch])
+    te_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#059669')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0fdf4')),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('PADDING', (0, 0), (-1, -1), 10),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+    ]))
+    elements.append(te_table)
+    elements.append(Spacer(1, 20))
+
+    # Category Breakdown
+    if data["categories"]:
+        elements.append(Paragraph("Sales by Category (This Month)", heading_style))
+        cat_data = [["Category", "Status", "Sales", "Tax Collected"]]
+
+        for row in sorted(data["categories"], key=lambda r: r["sales"], reverse=True):
+            status = "EXEMPT" if row["is_exempt"] else "TAXABLE"
+            tax_for_cat = 0 if row["is_exempt"] else (row["sales"] / taxable_total * total_tax_collected if taxable_total > 0 else 0)
+            cat_data.append([
+                row["category"].capitalize(),
+                status,
+                f"${row['sales']:.2f}",
+                f"${tax_for_cat:.2f}" if not row["is_exempt"] else "-"
+            ])
+
+        # Total row
+        cat_data.append(["Total", "", f"${total_sales:.2f}", f"${total_tax_collected:.2f}"])
+
+        cat_table = Table(cat_data, colWidths=[1.5*inch, 1.2*inch, 1.5*inch, 1.5*inch])
+        cat_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#eff6ff')),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('PADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+        ]))
+        elements.append(cat_table)
+
+    # Footer
+    elements.append(Spacer(1, 40))
+    elements.append(Paragraph("30 Giltress Street, Kingston 2, JA | 876-633-9251 / 876-843-2416", s["footer"]))
+    elements.append(Paragraph("This report is for internal accounting purposes.", s["footer"]))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# kind -> render function; the names are what `pdf_renderer.render_pdf` accepts
+RENDERERS = {
+    "shift_report": render_shift_report,
+    "close_shift_email": render_close_shift_email,
+    "summary": render_summary,
+    "tax_report": render_tax_report,
+}
+
+
+def render(kind: str, data: Dict[str, Any]) -> bytes:
+    """Worker entry point. Lives here so spawned workers import only ReportLab."""
+    return RENDERERS[kind](data)
@@ -0,0 +1,178 @@
+"""Cart pricing shared by POST /sales/quote and POST /sales.
+
+`price_cart` computes subtotal, tax (with category exemptions), coupon
+discount, points redemption and points earned. Both endpoints call it, so a
+quote always matches the sale that follows it. Pricing reads from memory
+wherever it can:
+
+- The pricing settings are held for _SETTINGS_TTL seconds, with the
+  exempt categories as a lower-cased set. PUT /settings drops them.
+- Each inventory item's type and cost are held for _ITEM_TTL seconds.
+  Misses are fetched with one `$in` query. Inventory writes drop them.
+- Coupons come from the coupon cache (services/coupon_service.py).
+
+Only the customer (points balance, lifetime spend) is read fresh. Nothing is
+written here; POST /sales redeems the coupon and applies the points.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from core.config import db
+from services.coupon_service import get_coupon, coupon_discount, CouponError
+
+_SETTINGS_TTL = 30.0
+_ITEM_TTL = 60.0
+_MAX_ITEMS = 5000
+
+_context: Optional[Tuple[float, "PricingContext"]] = None
+_items: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+
+
+@dataclass(frozen=True)
+class PricingContext:
+    settings: Dict[str, Any]  # the full settings document ({} when none saved yet)
+    tax_rate: float
+    tax_exempt: FrozenSet[str]
+    points_enabled: bool
+    points_per_dollar: float
+    points_threshold: float
+    points_value: float
+
+    def is_taxable(self, item_type: Optional[str]) -> bool:
+        return (item_type or '').lower() not in self.tax_exempt
+
+
+async def pricing_context() -> PricingContext:
+    """Pricing settings, cached for _SETTINGS_TTL seconds."""
+    global _context
+    if _context and time.monotonic() - _context[0] < _SETTINGS_TTL:
+        return _context[1]
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0}) or {}
+    tax_enabled = settings.get('tax_enabled', False)
+    context = PricingContext(
+        settings=settings,
+        tax_rate=settings.get('tax_rate', 0.0) if tax_enabled else 0.0,
+        tax_exempt=frozenset(
+            cat.lower() for cat in settings.get('tax_exempt_categories', []) if tax_enabled and cat
+        ),
+        points_enabled=settings.get('points_enabled', False),
+        points_per_dollar=settings.get('points_per_dollar', 0.002),  # 1 point per $500
+        points_threshold=settings.get('points_redemption_threshold', 3500),
+        points_value=settings.get('points_value', 1),
+    )
+    _context = (time.monotonic(), context)
+    return context
+
+
+async def item_info(item_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """`{"type", "cost_price"}` per inventory item id (None for unknown ids)."""
+    now = time.monotonic()
+    found: Dict[str, Optional[Dict[str, Any]]] = {}
+    missing: List[str] = []
+    for item_id in dict.fromkeys(item_ids):
+        entry = _items.get(item_id)
+        if entry and now - entry[0] < _ITEM_TTL:
+            found[item_id] = entry[1]
+        else:
+            missing.append(item_id)
+    if missing:
+        if len(_items) + len(missing) > _MAX_ITEMS:
+            _items.clear()
+        docs = await db.inventory.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, "type": 1, "cost_price": 1},
+        ).to_list(None)
+        by_id = {doc["id"]: {"type": doc.get("type", ''), "cost_price": doc.get("cost_price")} for doc in docs}
+        for item_id in missing:
+            found[item_id] = by_id.get(item_id)
+            _items[item_id] = (now, found[item_id])
+    return found
+
+
+def invalidate_pricing(*item_ids: str):
+    """Drop cached item data for `item_ids`, or everything (settings too) when none are given."""
+    global _context
+    if not item_ids:
+        _context = None
+        _items.clear()
+        return
+    for item_id in item_ids:
+        _items.pop(item_id, None)
+
+
+async def price_cart(items, customer_id: Optional[str] = None, customer: Optional[Dict[str, Any]] = None,
+                     coupon_code: Optional[str] = None, points_to_use: float = 0) -> Dict[str, Any]:
+    """Price `items` (SaleItem models) for `customer` without writing anything.
+
+    Also fills in each item's `cost_price`, `category` and `tax` snapshot. A coupon
+    that does not apply adds no discount; the reason is returned as
+    `coupon_error`.
+    """
+    context = await pricing_context()
+    info = await item_info(item.item_id for item in items)
+
+    # Calculate totals with category-based tax exemptions
+    subtotal = 0.0
+    taxable_subtotal = 0.0
+    for item in items:
+        inv_item = info.get(item.item_id)
+        item_type = inv_item.get('type', '') if inv_item else ''
+        # Snapshot cost and category so margin reports never re-join inventory
+        item.cost_price = inv_item.get('cost_price') if inv_item else None
+        item.category = item_type or None
+        subtotal += item.subtotal
+        if context.is_taxable(item_type):
+            taxable_subtotal += item.subtotal
+            item.tax = item.subtotal * context.tax_rate
+        else:
+            item.tax = 0.0
+    tax = taxable_subtotal * context.tax_rate
+
+    # Coupon discount (validated against the cached coupon; redeemed by the sale)
+    discount = 0
+    coupon = None
+    coupon_error = None
+    if coupon_code:
+        coupon = await get_coupon(coupon_code)
+        if not coupon:
+            coupon_error = "Invalid coupon code"
+        else:
+            try:
+                discount = coupon_discount(coupon, subtotal, customer_id)
+            except CouponError as e:
+                coupon, coupon_error = None, str(e)
+
+    # Points redemption
+    points_used = 0
+    points_discount = 0
+    points_earned = 0
+    if context.points_enabled and customer:
+        customer_points = customer.get('points_balance', 0)
+        if points_to_use > 0 and customer.get('total_spent', 0) >= context.points_threshold:
+            # Use up to available points, but not more than sale total after other discounts
+            max_points_can_use = min(points_to_use, customer_points)
+            max_discount_from_points = subtotal + tax - discount  # Can't discount more than remaining
+            points_discount = min(max_points_can_use * context.points_value, max_discount_from_points)
+            points_used = points_discount / context.points_value  # Actual points used
+
+    total = subtotal + tax - discount - points_discount
+
+    # Points earned from this purchase (after all discounts applied)
+    if context.points_enabled and customer:
+        points_earned = total * context.points_per_dollar
+
+    return {
+        "subtotal": subtotal,
+        "taxable_subtotal": taxable_subtotal,
+        "tax_rate": context.tax_rate,
+        "tax": tax,
+        "discount": discount,
+        "coupon_code": coupon.get('code') if coupon else None,
+        "coupon_id": coupon.get('id') if coupon else None,
+        "coupon_error": coupon_error,
+        "points_used": points_used,
+        "points_discount": points_discount,
+        "points_earned": points_earned,
+        "points_balance": customer.get('points_balance', 0) if context.points_enabled and customer else None,
+        "total": total,
+    }
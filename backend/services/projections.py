@@ -0,0 +1,678 @@
+"""Read models incrementally maintained from completed sales.
+
+Reports used to `$group` the entire `sales` collection on every request. Every
+write path that completes a sale (cash checkout in `create_sale`, Stripe/PayPal
+confirmation in `routes/payments.py`) now calls `record_completed_sale`, which
+folds that one sale into small, indexed projection collections. Deleting a
+completed sale calls `retract_completed_sale`; closing a cash register shift
+calls `record_closed_shift`. Any projection can be rebuilt
+from `sales` with `rebuild_projections` (admin endpoint + first-boot backfill).
+
+A rebuild runs on one worker at a time (the "projections" lease). It writes
+each projection into `<collection>__rebuild` and swaps it in with
+renameCollection, so readers keep the old rows until the new ones are
+complete. While it runs, the lease lists the projections being rebuilt.
+A sale completed during that window would be counted twice (by its live
+`$inc` and by the recomputation), or lost with the old collection. To
+prevent that, every write that completes a sale or closes a shift includes
+`await projection_marker()`. This stamps the document with the rebuild's
+lease token. Recomputation skips stamped documents, and
+`record_completed_sale` queues them in `projection_backlog` instead of
+applying them. The rebuild replays the queue after the swap.
+"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from core.config import db, logger
+from core.indexes import INDEXES
+from services.leases import hold_lease, update_lease, read_lease, LeaseBusy
+
+_COMPLETED_MATCH = {"payment_status": "completed"}
+_BATCH_SIZE = 1000
+_LEASE = "projections"
+_LEASE_TTL = 120
+_GRACE_SECONDS = 2.0  # lets a write that read the lease just before it changed finish
+_TMP_SUFFIX = "__rebuild"
+
+
+class RebuildInProgress(RuntimeError):
+    pass
+
+
+def _iso(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value) if value else datetime.now(timezone.utc).isoformat()
+
+
+def _day(created_at_iso: str) -> str:
+    """UTC business day ('YYYY-MM-DD') of an ISO timestamp written by this app."""
+    return created_at_iso[:10]
+
+
+def _item_field(item, name, default=None):
+    # Sale items arrive either as dicts (from Mongo) or SaleItem models (from create_sale)
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+# ---------- Customer stats ----------
+
+async def _apply_customer_stats(sale: Dict[str, Any], sign: int):
+    customer_id = sale.get("customer_id")
+    if not customer_id:
+        return
+    created_at = _iso(sale.get("created_at"))
+    update = {
+        "$inc": {
+            "total_spent": sign * float(sale.get("total") or 0),
+            "sales_count": sign,
+        },
+        "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
+    }
+    if sign > 0:
+        # Recency can only move forward incrementally; a retraction leaves it
+        # as-is until the next rebuild.
+        update["$max"] = {"last_sale_at": created_at}
+        update["$min"] = {"first_sale_at": created_at}
+    await db.customer_stats.update_one({"customer_id": customer_id}, update, upsert=True)
+    if sign > 0:
+        # Keeps the recency filter on GET /customers current between segmentation runs
+        await db.customers.update_one({"id": customer_id}, {"$max": {"last_sale_at": created_at}})
+
+
+async def rebuild_customer_stats(target, gen: str) -> int:
+    """Recompute `customer_stats` into `target`. Returns the number of rows written."""
+    pipeline = [
+        {"$match": {**_COMPLETED_MATCH, "customer_id": {"$ne": None}, "projection_gen": {"$ne": gen}}},
+        {"$group": {
+            "_id": "$customer_id",
+            "total_spent": {"$sum": "$total"},
+            "sales_count": {"$sum": 1},
+            "first_sale_at": {"$min": "$created_at"},
+            "last_sale_at": {"$max": "$created_at"},
+        }},
+    ]
+    now_iso = datetime.now(timezone.utc).isoformat()
+    written = 0
+    batch = []
+    async for row in db.sales.aggregate(pipeline, allowDiskUse=True):
+        batch.append({
+            "customer_id": row["_id"],
+            "total_spent": float(row["total_spent"] or 0),
+            "sales_count": int(row["sales_count"]),
+            "first_sale_at": row["first_sale_at"],
+            "last_sale_at": row["last_sale_at"],
+            "updated_at": now_iso,
+        })
+        if len(batch) >= _BATCH_SIZE:
+            await target.insert_many(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        await target.insert_many(batch)
+        written += len(batch)
+    return written
+
+
+# ---------- Item sales (velocity / dead stock) ----------
+#
+# Two shapes are maintained per sold inventory item:
+#   * on the inventory doc itself: `units_sold_total` and `last_sold_at`, so dead
+#     stock is an indexed range scan on `inventory.last_sold_at`;
+#   * `item_sales_daily`: one compact {item_id, day, category, units, revenue, cost}
+#     bucket per item per UTC day, from which rolling 7/30/90-day counters and
+#     gross-margin reports are summed. Cost comes from the `cost_price` snapshot
+#     taken onto each sale line at checkout; lines sold before snapshots existed
+#     fall back to the item's current inventory cost.
+
+
+async def _inventory_costs(item_ids) -> Dict[str, Dict[str, Any]]:
+    """{item_id: {"cost_price", "type"}} for the given ids, in one query."""
+    ids = list(set(item_ids))
+    if not ids:
+        return {}
+    cursor = db.inventory.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "cost_price": 1, "type": 1})
+    return {doc["id"]: doc async for doc in cursor}
+
+
+async def _apply_item_sales(sale: Dict[str, Any], sign: int):
+    items = sale.get("items") or []
+    if not items:
+        return
+    created_at = _iso(sale.get("created_at"))
+    day = _day(created_at)
+    unsnapshotted = [
+        _item_field(item, "item_id") for item in items
+        if _item_field(item, "cost_price") is None or not _item_field(item, "category")
+    ]
+    fallback = await _inventory_costs(i for i in unsnapshotted if i)
+    inventory_ops = []
+    daily_ops = []
+    for item in items:
+        item_id = _item_field(item, "item_id")
+        if not item_id:
+            continue
+        inv = fallback.get(item_id, {})
+        quantity = int(_item_field(item, "quantity", 0) or 0)
+        unit_cost = _item_field(item, "cost_price")
+        if unit_cost is None:
+            unit_cost = inv.get("cost_price") or 0
+        units = sign * quantity
+        revenue = sign * float(_item_field(item, "subtotal", 0) or 0)
+        cost = sign * quantity * float(unit_cost)
+        inv_update = {"$inc": {"units_sold_total": units}}
+        if sign > 0:
+            inv_update["$max"] = {"last_sold_at": created_at}
+        inventory_ops.append(UpdateOne({"id": item_id}, inv_update))
+        daily_ops.append(UpdateOne(
+            {"item_id": item_id, "day": day},
+            {
+                "$inc": {"units": units, "revenue": revenue, "cost": cost},
+                "$set": {"category": _item_field(item, "category") or inv.get("type") or "other"},
+            },
+            upsert=True,
+        ))
+    if inventory_ops:
+        await db.inventory.bulk_write(inventory_ops, ordered=False)
+        await db.item_sales_daily.bulk_write(daily_ops, ordered=False)
+
+
+async def rebuild_item_sales(target, gen: str) -> int:
+    """Recompute `item_sales_daily` into `target`, and the inventory sold counters
+    in place (each item overwritten once, never reset first). Returns buckets written."""
+    daily_pipeline = [
+        {"$match": {**_COMPLETED_MATCH, "projection_gen": {"$ne": gen}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"item_id": "$items.item_id", "day": {"$substrBytes": ["$created_at", 0, 10]}},
+            "units": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.subtotal"},
+            "cost": {"$sum": {"$multiply": ["$items.quantity", {"$ifNull": ["$items.cost_price", 0]}]}},
+            # Units from lines sold before cost snapshots existed; costed at today's price below
+            "uncosted_units": {"$sum": {"$cond": [
+                {"$eq": [{"$ifNull": ["$items.cost_price", None]}, None]}, "$items.quantity", 0,
+            ]}},
+            "category": {"$max": "$items.category"},
+        }},
+    ]
+    inventory = {
+        doc["id"]: doc
+        async for doc in db.inventory.find({}, {"_id": 0, "id": 1, "cost_price": 1, "type": 1})
+    }
+    written = 0
+    batch = []
+    async for row in db.sales.aggregate(daily_pipeline, allowDiskUse=True):
+        inv = inventory.get(row["_id"]["item_id"], {})
+        cost = float(row["cost"] or 0) + int(row["uncosted_units"] or 0) * float(inv.get("cost_price") or 0)
+        batch.append({
+            "item_id": row["_id"]["item_id"],
+            "day": row["_id"]["day"],
+            "category": row.get("category") or inv.get("type") or "other",
+            "units": int(row["units"] or 0),
+            "revenue": float(row["revenue"] or 0),
+            "cost": cost,
+        })
+        if len(batch) >= _BATCH_SIZE:
+            await target.insert_many(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        await target.insert_many(batch)
+        written += len(batch)
+
+    totals_pipeline = [
+        {"$match": {**_COMPLETED_MATCH, "projection_gen": {"$ne": gen}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.item_id",
+            "units": {"$sum": "$items.quantity"},
+            "last_sold_at": {"$max": "$created_at"},
+        }},
+    ]
+    # Overwrite counters item by item, then clear only items with no sales at
+    # all, so the reports never see live inventory zeroed mid-rebuild
+    ops, seen = [], []
+    async for row in db.sales.aggregate(totals_pipeline, allowDiskUse=True):
+        seen.append(row["_id"])
+        ops.append(UpdateOne(
+            {"id": row["_id"]},
+            {"$set": {"units_sold_total": int(row["units"] or 0), "last_sold_at": row["last_sold_at"]}},
+        ))
+        if len(ops) >= _BATCH_SIZE:
+            await db.inventory.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.inventory.bulk_write(ops, ordered=False)
+    await db.inventory.update_many(
+        {"id": {"$nin": seen}, "$or": [{"units_sold_total": {"$ne": 0}}, {"last_sold_at": {"$exists": True}}]},
+        {"$set": {"units_sold_total": 0}, "$unset": {"last_sold_at": ""}},
+    )
+    return written
+
+
+async def rolling_unit_counts(
+    item_ids: Optional[Iterable[str]] = None,
+    windows: Iterable[int] = (7, 30, 90),
+    now: Optional[datetime] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Units sold per item over each trailing window (days, today inclusive).
+
+    One indexed range scan over `item_sales_daily`. Returns
+    {item_id: {"units_7d": n, "units_30d": n, ...}}; items with no sales are absent.
+    """
+    windows = sorted(set(int(w) for w in windows))
+    today = (now or datetime.now(timezone.utc)).date()
+    cutoffs = {w: (today - timedelta(days=w - 1)).isoformat() for w in windows}
+    match: Dict[str, Any] = {"day": {"$gte": cutoffs[windows[-1]]}}
+    if item_ids is not None:
+        match["item_id"] = {"$in": list(item_ids)}
+    group: Dict[str, Any] = {"_id": "$item_id"}
+    for w in windows:
+        group[f"units_{w}d"] = {"$sum": {"$cond": [{"$gte": ["$day", cutoffs[w]]}, "$units", 0]}}
+    rows = await db.item_sales_daily.aggregate([{"$match": match}, {"$group": group}]).to_list(None)
+    return {row.pop("_id"): row for row in rows}
+
+
+async def margin_rows(start_day: str, end_day: str, group_by: str = "sku") -> List[Dict[str, Any]]:
+    """Units, revenue and cost summed from `item_sales_daily` over [start_day, end_day].
+
+    group_by is "sku" (per item_id), "category" or "day"; each row carries the
+    group value under that name.
+    """
+    key = {"sku": "$item_id", "category": "$category", "day": "$day"}[group_by]
+    pipeline = [
+        {"$match": {"day": {"$gte": start_day, "$lte": end_day}}},
+        {"$group": {
+            "_id": key,
+            "units": {"$sum": "$units"},
+            "revenue": {"$sum": "$revenue"},
+            "cost": {"$sum": {"$ifNull": ["$cost", 0]}},
+        }},
+    ]
+    rows = await db.item_sales_daily.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    field = "item_id" if group_by == "sku" else group_by
+    return [{field: row.pop("_id") or "other", **row} for row in rows]
+
+
+# ---------- Coupon stats ----------
+#
+# One row per (coupon code, UTC month 'YYYY-MM') with redemptions, discount
+# given, revenue and last use. Monthly analytics read a single month's rows;
+# all-time performance sums a coupon's months.
+
+async def _apply_coupon_stats(sale: Dict[str, Any], sign: int):
+    code = sale.get("coupon_code")
+    if not code:
+        return
+    created_at = _iso(sale.get("created_at"))
+    update = {
+        "$inc": {
+            "redemptions": sign,
+            "total_discount": sign * float(sale.get("discount") or 0),
+            "total_revenue": sign * float(sale.get("total") or 0),
+            "total_subtotal": sign * float(sale.get("subtotal") or 0),
+        },
+    }
+    if sign > 0:
+        update["$max"] = {"last_used_at": created_at}
+    await db.coupon_stats.update_one({"code": code, "month": created_at[:7]}, update, upsert=True)
+
+
+async def rebuild_coupon_stats(target, gen: str) -> int:
+    """Recompute `coupon_stats` into `target`. Returns the number of rows written."""
+    pipeline = [
+        {"$match": {**_COMPLETED_MATCH, "coupon_code": {"$nin": [None, ""]}, "projection_gen": {"$ne": gen}}},
+        {"$group": {
+            "_id": {"code": "$coupon_code", "month": {"$substrBytes": ["$created_at", 0, 7]}},
+            "redemptions": {"$sum": 1},
+            "total_discount": {"$sum": "$discount"},
+            "total_revenue": {"$sum": "$total"},
+            "total_subtotal": {"$sum": "$subtotal"},
+            "last_used_at": {"$max": "$created_at"},
+        }},
+    ]
+    written = 0
+    batch = []
+    async for row in db.sales.aggregate(pipeline, allowDiskUse=True):
+        batch.append({
+            "code": row["_id"]["code"],
+            "month": row["_id"]["month"],
+            "redemptions": int(row["redemptions"]),
+            "total_discount": float(row["total_discount"] or 0),
+            "total_revenue": float(row["total_revenue"] or 0),
+            "total_subtotal": float(row["total_subtotal"] or 0),
+            "last_used_at": row["last_used_at"],
+        })
+        if len(batch) >= _BATCH_SIZE:
+            await target.insert_many(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        await target.insert_many(batch)
+        written += len(batch)
+    return written
+
+
+async def coupon_totals(month: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Per-coupon totals from `coupon_stats`, for one month ('YYYY-MM') or all time.
+
+    Returns {code: {"redemptions", "total_discount", "total_revenue",
+    "total_subtotal", "last_used_at"}}; codes never redeemed are absent.
+    """
+    match: Dict[str, Any] = {"redemptions": {"$gt": 0}}
+    if month:
+        match["month"] = month
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$code",
+            "redemptions": {"$sum": "$redemptions"},
+            "total_discount": {"$sum": "$total_discount"},
+            "total_revenue": {"$sum": "$total_revenue"},
+            "total_subtotal": {"$sum": "$total_subtotal"},
+            "last_used_at": {"$max": "$last_used_at"},
+        }},
+    ]
+    rows = await db.coupon_stats.aggregate(pipeline).to_list(None)
+    return {row.pop("_id"): row for row in rows}
+
+
+# ---------- Staff daily rollup ----------
+#
+# One row per (username, UTC day) with completed-sale counters (keyed by the
+# sale's `created_by`) and shift-close accuracy counters (keyed by the shift's
+# `closed_by_name`, folded in by `record_closed_shift`).
+
+async def _apply_staff_daily(sale: Dict[str, Any], sign: int):
+    username = sale.get("created_by")
+    if not username:
+        return
+    created_at = _iso(sale.get("created_at"))
+    update = {
+        "$inc": {
+            "sales_count": sign,
+            "total_revenue": sign * float(sale.get("total") or 0),
+            "total_subtotal": sign * float(sale.get("subtotal") or 0),
+        },
+    }
+    if sign > 0:
+        update["$max"] = {"last_sale_at": created_at}
+    await db.staff_daily.update_one({"username": username, "day": _day(created_at)}, update, upsert=True)
+
+
+async def _apply_closed_shift(shift: Dict[str, Any]):
+    username = shift.get("closed_by_name")
+    if not username:
+        return
+    difference = float(shift.get("difference") or 0)
+    await db.staff_daily.update_one(
+        {"username": username, "day": _day(_iso(shift.get("closed_at")))},
+        {"$inc": {
+            "shifts_closed": 1,
+            "sum_abs_variance": abs(difference),
+            "sum_variance": difference,
+        }},
+        upsert=True,
+    )
+
+
+async def record_closed_shift(shift: Dict[str, Any]):
+    """Fold a just-closed cash register shift into the staff rollup.
+
+    `shift` carries the `projection_gen` stamp its close wrote, if any.
+    """
+    try:
+        if "staff_daily" in await _deferred(shift):
+            await _queue("shift", shift, ["staff_daily"])
+        else:
+            await _apply_closed_shift(shift)
+    except Exception as e:
+        logger.warning(f"Projection staff_daily update failed for shift {shift.get('id')}: {e}")
+
+
+async def rebuild_staff_daily(target, gen: str) -> int:
+    """Recompute `staff_daily` from sales and closed shifts into `target`. Returns rows written."""
+    rows: Dict[tuple, Dict[str, Any]] = {}
+
+    def row(username, day):
+        return rows.setdefault((username, day), {
+            "username": username, "day": day,
+            "sales_count": 0, "total_revenue": 0.0, "total_subtotal": 0.0,
+            "shifts_closed": 0, "sum_abs_variance": 0.0, "sum_variance": 0.0,
+        })
+
+    sales_pipeline = [
+        {"$match": {**_COMPLETED_MATCH, "created_by": {"$nin": [None, ""]}, "projection_gen": {"$ne": gen}}},
+        {"$group": {
+            "_id": {"username": "$created_by", "day": {"$substrBytes": ["$created_at", 0, 10]}},
+            "sales_count": {"$sum": 1},
+            "total_revenue": {"$sum": "$total"},
+            "total_subtotal": {"$sum": "$subtotal"},
+            "last_sale_at": {"$max": "$created_at"},
+        }},
+    ]
+    async for r in db.sales.aggregate(sales_pipeline, allowDiskUse=True):
+        doc = row(r["_id"]["username"], r["_id"]["day"])
+        doc["sales_count"] = int(r["sales_count"])
+        doc["total_revenue"] = float(r["total_revenue"] or 0)
+        doc["total_subtotal"] = float(r["total_subtotal"] or 0)
+        doc["last_sale_at"] = r["last_sale_at"]
+
+    shift_pipeline = [
+        {"$match": {"status": "closed", "closed_by_name": {"$nin": [None, ""]}, "projection_gen": {"$ne": gen}}},
+        {"$group": {
+            "_id": {"username": "$closed_by_name", "day": {"$substrBytes": ["$closed_at", 0, 10]}},
+            "shifts_closed": {"$sum": 1},
+            "sum_abs_variance": {"$sum": {"$abs": "$difference"}},
+            "sum_variance": {"$sum": "$difference"},
+        }},
+    ]
+    async for r in db.cash_register_shifts.aggregate(shift_pipeline, allowDiskUse=True):
+        doc = row(r["_id"]["username"], r["_id"]["day"])
+        doc["shifts_closed"] = int(r["shifts_closed"])
+        doc["sum_abs_variance"] = float(r["sum_abs_variance"] or 0)
+        doc["sum_variance"] = float(r["sum_variance"] or 0)
+
+    docs = list(rows.values())
+    for i in range(0, len(docs), _BATCH_SIZE):
+        await target.insert_many(docs[i:i + _BATCH_SIZE])
+    return len(docs)
+
+
+async def staff_totals(since_day: str) -> Dict[str, Dict[str, Any]]:
+    """Sum `staff_daily` buckets from `since_day` ('YYYY-MM-DD') onward, per username."""
+    pipeline = [
+        {"$match": {"day": {"$gte": since_day}}},
+        {"$group": {
+            "_id": "$username",
+            "sales_count": {"$sum": "$sales_count"},
+            "total_revenue": {"$sum": "$total_revenue"},
+            "total_subtotal": {"$sum": "$total_subtotal"},
+            "last_sale_at": {"$max": "$last_sale_at"},
+            "shifts_closed": {"$sum": "$shifts_closed"},
+            "sum_abs_variance": {"$sum": "$sum_abs_variance"},
+            "sum_variance": {"$sum": "$sum_variance"},
+        }},
+    ]
+    rows = await db.staff_daily.aggregate(pipeline).to_list(None)
+    return {row.pop("_id"): row for row in rows if row.get("_id")}
+
+
+# ---------- Write-path entry points ----------
+
+_APPLIERS = (
+    ("customer_stats", _apply_customer_stats),
+    ("item_sales", _apply_item_sales),
+    ("coupon_stats", _apply_coupon_stats),
+    ("staff_daily", _apply_staff_daily),
+)
+
+# name -> (collection probed by the boot backfill, rebuild coroutine)
+_REBUILDERS = {
+    "customer_stats": ("customer_stats", rebuild_customer_stats),
+    "item_sales": ("item_sales_daily", rebuild_item_sales),
+    "coupon_stats": ("coupon_stats", rebuild_coupon_stats),
+    "staff_daily": ("staff_daily", rebuild_staff_daily),
+}
+
+# name -> filter matching rows written by an older projection shape; any hit
+# triggers a rebuild at boot (e.g. daily buckets predating the `cost` field).
+_STALE_PROBES = {
+    "item_sales": {"cost": {"$exists": False}},
+}
+
+
+async def _apply_all(sale: Dict[str, Any], sign: int, only=None):
+    # Each projection is isolated: a failure here must never fail the sale itself.
+    for name, apply in _APPLIERS:
+        if only is not None and name not in only:
+            continue
+        try:
+            await apply(sale, sign)
+        except Exception as e:
+            logger.warning(f"Projection {name} update failed for sale {sale.get('id')}: {e}")
+
+
+async def projection_marker() -> Dict[str, Any]:
+    """Fields to write together with a sale's completion (or a shift's close):
+    the rebuild token while a projection rebuild is running, else nothing."""
+    lease = await read_lease(_LEASE)
+    if lease and lease.get("names"):
+        return {"projection_gen": lease["owner"]}
+    return {}
+
+
+async def projections_rebuilding() -> bool:
+    return bool(await projection_marker())
+
+
+async def _deferred(doc: Dict[str, Any]) -> List[str]:
+    """Projections that must not apply `doc` now: those being rebuilt by the
+    rebuild that stamped it (the recomputation skips it; the backlog replays it)."""
+    gen = doc.get("projection_gen")
+    if not gen:
+        return []
+    lease = await read_lease(_LEASE)
+    if not lease or lease.get("owner") != gen:
+        return []
+    return list(lease.get("names") or [])
+
+
+async def _queue(kind: str, doc: Dict[str, Any], names: List[str]):
+    await db.projection_backlog.insert_one({
+        "gen": doc["projection_gen"],
+        "kind": kind,
+        "names": names,
+        "doc": {k: v for k, v in doc.items() if k != "_id"},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+async def _replay_backlog(gen: Optional[str] = None) -> int:
+    """Apply queued writes (all of them, or one rebuild's) to the live projections."""
+    replayed = 0
+    query = {"gen": gen} if gen else {}
+    async for entry in db.projection_backlog.find(query).sort("_id", 1):
+        if entry["kind"] == "shift":
+            try:
+                await _apply_closed_shift(entry["doc"])
+            except Exception as e:
+                logger.warning(f"Projection staff_daily replay failed for shift {entry['doc'].get('id')}: {e}")
+        else:
+            await _apply_all(entry["doc"], 1, only=entry["names"])
+        await db.projection_backlog.delete_one({"_id": entry["_id"]})
+        replayed += 1
+    return replayed
+
+
+async def record_completed_sale(sale: Dict[str, Any]):
+    """Fold a sale that just reached payment_status=completed into every projection.
+
+    `sale` must include the `projection_marker()` fields written with its completion.
+    """
+    deferred = await _deferred(sale)
+    if deferred:
+        try:
+            await _queue("sale", sale, deferred)
+        except Exception as e:
+            logger.warning(f"Projection backlog write failed for sale {sale.get('id')}: {e}")
+    await _apply_all(sale, 1, only=[name for name, _ in _APPLIERS if name not in deferred])
+
+
+async def retract_completed_sale(sale: Dict[str, Any]):
+    """Undo `record_completed_sale` for a completed sale that is being deleted.
+    Callers refuse deletions while `projections_rebuilding()`."""
+    if sale.get("payment_status") == "completed":
+        await _apply_all(sale, -1)
+
+
+async def _create_indexes(collection: str, target: str):
+    for name, keys, options in INDEXES:
+        if name == collection:
+            await db[target].create_index(keys, **options)
+
+
+async def _rebuild_locked(gen: str, names: List[str], progress=None) -> Dict[str, int]:
+    # Writes queued by a rebuild that died never reached the live projections
+    orphans = await _replay_backlog()
+    if orphans:
+        logger.warning(f"Replayed {orphans} projection write(s) left by an interrupted rebuild")
+    await update_lease(_LEASE, gen, names=names)
+    await asyncio.sleep(_GRACE_SECONDS)
+    results = {}
+    for done, name in enumerate(names):
+        if progress:
+            await progress(done, len(names), name)
+        collection, rebuild = _REBUILDERS[name]
+        tmp = db[collection + _TMP_SUFFIX]
+        await tmp.drop()
+        await _create_indexes(collection, tmp.name)
+        results[name] = await rebuild(tmp, gen)
+        await tmp.rename(collection, dropTarget=True)
+        logger.info(f"Projection {name} rebuilt: {results[name]} row(s)")
+    await update_lease(_LEASE, gen, names=[])
+    await asyncio.sleep(_GRACE_SECONDS)
+    await _replay_backlog(gen)
+    return results
+
+
+async def rebuild_projections(names=None, progress=None) -> Dict[str, int]:
+    """Rebuild the named projections (all when None). Returns rows written per projection.
+
+    `progress`, if given, is awaited as progress(done, total, name) before each rebuild.
+    Raises RebuildInProgress while another worker is rebuilding.
+    """
+    selected = [name for name in _REBUILDERS if not names or name in names]
+    try:
+        async with hold_lease(_LEASE, _LEASE_TTL) as gen:
+            return await _rebuild_locked(gen, selected, progress)
+    except LeaseBusy:
+        raise RebuildInProgress("A projection rebuild is already running")
+
+
+async def bootstrap_projections():
+    """Backfill projections that are still empty, or still in an older shape, while
+    completed sales already exist (first boot after upgrading an existing store).
+    Runs on whichever worker takes the lease first; the others skip it."""
+    try:
+        async with hold_lease(_LEASE, _LEASE_TTL) as gen:
+            await _replay_backlog()
+            if not await db.sales.find_one(_COMPLETED_MATCH, {"_id": 1}):
+                return
+            stale = []
+            for name, (collection, _) in _REBUILDERS.items():
+                if not await db[collection].find_one({}, {"_id": 1}):
+                    stale.append(name)
+                elif name in _STALE_PROBES and await db[collection].find_one(_STALE_PROBES[name], {"_id": 1}):
+                    stale.append(name)
+            if stale:
+                await _rebuild_locked(gen, stale)
+    except LeaseBusy:
+        logger.info("Projection backfill skipped: another worker holds the projections lease")
+    except Exception as e:
+        logger.error(f"Projection backfill failed: {e}")
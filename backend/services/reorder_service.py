@@ -0,0 +1,206 @@
+"""Reorder-point and purchase-order suggestions for the whole catalogue.
+
+Per-SKU daily unit sales come from the `item_sales_daily` projection and are
+loaded into a (SKUs x days) NumPy matrix. Demand rate, variability,
+lead-time-adjusted reorder points and order quantities are then computed for
+every SKU in one vectorized pass (`compute_reorder_points`), and results are
+grouped by supplier so a single call drafts every purchase order.
+
+Classic periodic-review model:
+    safety_stock  = z * sigma_daily * sqrt(lead_time)
+    reorder_point = mu_daily * lead_time + safety_stock
+    order_up_to   = reorder_point + mu_daily * review_days
+    suggested     = ceil(order_up_to - on_hand)   when on_hand <= reorder_point
+SKUs with no sales history fall back to the legacy low-stock heuristic
+(top up to 3x threshold, min 5) once they reach their threshold.
+"""
+from datetime import datetime, timezone, timedelta
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.config import db
+
+DEFAULT_LEAD_TIME_DAYS = 7
+DEFAULT_REVIEW_DAYS = 14
+DEFAULT_SERVICE_LEVEL = 0.95
+DEFAULT_HISTORY_DAYS = 90
+
+
+def daily_demand_matrix(item_idx: np.ndarray, day_idx: np.ndarray, units: np.ndarray,
+                        n_items: int, n_days: int) -> np.ndarray:
+    """Scatter sparse (item, day, units) rows into a dense (n_items, n_days) matrix."""
+    flat = item_idx.astype(np.int64) * n_days + day_idx.astype(np.int64)
+    return np.bincount(flat, weights=units, minlength=n_items * n_days).reshape(n_items, n_days)
+
+
+def compute_reorder_points(
+    demand: np.ndarray,
+    on_hand: np.ndarray,
+    threshold: np.ndarray,
+    lead_time_days,
+    review_days: float = DEFAULT_REVIEW_DAYS,
+    service_level: float = DEFAULT_SERVICE_LEVEL,
+) -> Dict[str, np.ndarray]:
+    """Vectorized reorder computation over every SKU row of `demand`.
+
+    `lead_time_days` may be a scalar or a per-SKU array. Returns arrays keyed
+    by metric, each of length n_items.
+    """
+    n_items, n_days = demand.shape
+    on_hand = np.asarray(on_hand, dtype=np.float64)
+    threshold = np.asarray(threshold, dtype=np.float64)
+    lead = np.broadcast_to(np.asarray(lead_time_days, dtype=np.float64), (n_items,))
+    z = NormalDist().inv_cdf(min(max(service_level, 0.5), 0.9999))
+
+    # Single pass over the matrix for both moments (avoids np.std's temporary copy)
+    total = demand.sum(axis=1)
+    mean = total / n_days
+    if n_days > 1:
+        sumsq = np.einsum("ij,ij->i", demand, demand)
+        var = np.maximum((sumsq - total * mean) / (n_days - 1), 0.0)
+    else:
+        var = np.zeros(n_items)
+    std = np.sqrt(var)
+
+    safety_stock = z * std * np.sqrt(lead)
+    reorder_point = mean * lead + safety_stock
+    order_up_to = reorder_point + mean * review_days
+
+    has_demand = mean > 0
+    suggested = np.where(
+        has_demand & (on_hand <= reorder_point),
+        np.ceil(np.maximum(order_up_to - on_hand, 0.0)),
+        0.0,
+    )
+    legacy = np.maximum(threshold * 3 - on_hand, 5.0)
+    suggested = np.where(~has_demand & (on_hand <= threshold), legacy, suggested)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(has_demand, on_hand / mean, np.inf)
+
+    return {
+        "demand_rate": mean,
+        "demand_std": std,
+        "safety_stock": safety_stock,
+        "reorder_point": reorder_point,
+        "order_up_to": order_up_to,
+        "suggested_qty": suggested,
+        "days_of_cover": days_of_cover,
+    }
+
+
+async def _supplier_directory() -> Dict[str, Dict[str, Any]]:
+    suppliers = await db.suppliers.find({}, {"_id": 0}).to_list(None)
+    return {(s.get("name") or "").strip().lower(): s for s in suppliers}
+
+
+async def build_reorder_plan(
+    item_ids: Optional[List[str]] = None,
+    history_days: int = DEFAULT_HISTORY_DAYS,
+    lead_time_days: Optional[int] = None,
+    review_days: int = DEFAULT_REVIEW_DAYS,
+    service_level: float = DEFAULT_SERVICE_LEVEL,
+    include_all: bool = False,
+) -> Dict[str, Any]:
+    """Compute reorder suggestions and group them by supplier.
+
+    `lead_time_days` overrides every supplier's own `lead_time_days`. With
+    `include_all`, SKUs that need no reorder are returned too (qty 0).
+    """
+    inv_query: Dict[str, Any] = {"id": {"$in": item_ids}} if item_ids else {}
+    items = await db.inventory.find(
+        inv_query,
+        {"_id": 0, "id": 1, "name": 1, "sku": 1, "supplier": 1, "quantity": 1,
+         "low_stock_threshold": 1, "cost_price": 1},
+    ).to_list(None)
+    today = datetime.now(timezone.utc).date()
+    start = today - timedelta(days=history_days - 1)
+    params = {
+        "history_days": history_days,
+        "lead_time_days": lead_time_days,
+        "review_days": review_days,
+        "service_level": service_level,
+    }
+    if not items:
+        return {"generated_at": datetime.now(timezone.utc).isoformat(), "params": params, "suppliers": []}
+
+    item_pos = {it["id"]: i for i, it in enumerate(items)}
+    day_pos = {(start + timedelta(days=d)).isoformat(): d for d in range(history_days)}
+
+    bucket_query: Dict[str, Any] = {"day": {"$gte": start.isoformat()}}
+    if item_ids:
+        bucket_query["item_id"] = {"$in": item_ids}
+    rows_i, rows_d, rows_u = [], [], []
+    async for row in db.item_sales_daily.find(bucket_query, {"_id": 0, "item_id": 1, "day": 1, "units": 1}):
+        i = item_pos.get(row.get("item_id"))
+        d = day_pos.get(row.get("day"))
+        if i is None or d is None:
+            continue
+        rows_i.append(i)
+        rows_d.append(d)
+        rows_u.append(row.get("units") or 0)
+
+    demand = daily_demand_matrix(
+        np.asarray(rows_i, dtype=np.int64), np.asarray(rows_d, dtype=np.int64),
+        np.asarray(rows_u, dtype=np.float64), len(items), history_days,
+    )
+
+    directory = await _supplier_directory()
+    default_lead = lead_time_days or DEFAULT_LEAD_TIME_DAYS
+    lead = np.array([
+        lead_time_days or int((directory.get((it.get("supplier") or "").strip().lower()) or {}).get("lead_time_days") or default_lead)
+        for it in items
+    ], dtype=np.float64)
+
+    metrics = compute_reorder_points(
+        demand,
+        on_hand=np.array([float(it.get("quantity") or 0) for it in items]),
+        threshold=np.array([float(it.get("low_stock_threshold") or 10) for it in items]),
+        lead_time_days=lead,
+        review_days=review_days,
+        service_level=service_level,
+    )
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    for i, it in enumerate(items):
+        qty = int(metrics["suggested_qty"][i])
+        if qty <= 0 and not include_all:
+            continue
+        supplier_name = (it.get("supplier") or "").strip()
+        key = supplier_name.lower()
+        group = groups.get(key)
+        if group is None:
+            sup = directory.get(key) or {}
+            group = groups[key] = {
+                "supplier": supplier_name or None,
+                "supplier_id": sup.get("id"),
+                "email": sup.get("email"),
+                "items": [],
+                "total_units": 0,
+                "estimated_cost": 0.0,
+            }
+        cover = metrics["days_of_cover"][i]
+        cost = float(it.get("cost_price") or 0)
+        group["items"].append({
+            "id": it["id"],
+            "name": it.get("name"),
+            "sku": it.get("sku"),
+            "quantity": int(it.get("quantity") or 0),
+            "low_stock_threshold": int(it.get("low_stock_threshold") or 10),
+            "lead_time_days": int(lead[i]),
+            "demand_per_day": round(float(metrics["demand_rate"][i]), 3),
+            "demand_std": round(float(metrics["demand_std"][i]), 3),
+            "safety_stock": round(float(metrics["safety_stock"][i]), 1),
+            "reorder_point": round(float(metrics["reorder_point"][i]), 1),
+            "days_of_cover": None if np.isinf(cover) else round(float(cover), 1),
+            "suggested_order_qty": qty,
+        })
+        group["total_units"] += qty
+        group["estimated_cost"] = round(group["estimated_cost"] + qty * cost, 2)
+
+    suppliers = sorted(groups.values(), key=lambda g: (g["supplier"] is None, (g["supplier"] or "").lower()))
+    for g in suppliers:
+        g["items"].sort(key=lambda x: (x["days_of_cover"] is None, x["days_of_cover"] or 0))
+    return {"generated_at": datetime.now(timezone.utc).isoformat(), "params": params, "suppliers": suppliers}
@@ -1,11 +1,38 @@
-"""Background scheduler: hourly check for auto-email summary reports."""
+"""Background scheduler for periodic maintenance and email jobs.
+
+Every job in `SCHEDULED_JOBS` has its own cadence (plus random jitter, so
+workers and jobs do not fire in lockstep) and a timeout. Jobs run
+concurrently, so a slow SMTP server only delays its own job. Each job's
+`next_run`, `last_run`, outcome and recent durations are persisted in
+`scheduler_jobs`, so a restart does not re-run everything at once.
+
+With several uvicorn/gunicorn workers, each one starts this loop, but only
+the holder of the `scheduler_lease` document runs jobs. The leader renews
+the lease on every tick. If it dies, another worker takes over once the
+lease expires (SCHEDULER_LEASE_SECONDS). A worker that loses the lease
+cancels its running jobs.
+"""
 import asyncio
-from datetime import datetime, timezone
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
 
-from core.config import db, logger
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from core.config import db, logger, SCHEDULER_TICK_SECONDS, SCHEDULER_LEASE_SECONDS
 from core.security import strip_html
 from services.summary_service import build_summary_pdf, send_summary_email
 from services.birthday_service import process_birthday_coupons
+from services.followup_service import process_followups
+from services.analytics_snapshot import maybe_export_snapshot
+from services.jobs import recover_jobs
+from services.campaign_service import resume_campaigns
+from services.customer_segments import maybe_refresh_segments
 from routes.reports import _period_range
 
 
@@ -36,7 +63,7 @@ async def _maybe_send(period: str, enabled_key: str, last_key: str):
     business_name = strip_html(settings.get("business_name", "TECHZONE"))
     try:
         pdf_bytes = await build_summary_pdf(label, start, end)
-        sent = send_summary_email(to_email, pdf_bytes, label, start, end, business_name)
+        sent = await asyncio.to_thread(send_summary_email, to_email, pdf_bytes, label, start, end, business_name)
         if sent:
             await db.settings.update_one(
                 {"id": "app_settings"},
@@ -48,64 +75,176 @@ async def _maybe_send(period: str, enabled_key: str, last_key: str):
         logger.error(f"Auto-summary task failed ({period}): {e}")
 
 
-async def _process_followups():
-    """Send any pending follow-up emails whose send_at has passed."""
-    now_iso = datetime.now(timezone.utc).isoformat()
-    try:
-        cursor = db.followups.find(
-            {"status": "pending", "send_at": {"$lte": now_iso}},
-            {"_id": 0},
-        ).limit(50)
-        followups = await cursor.to_list(50)
-        if not followups:
-            return
+class ScheduledJob:
+    """A periodic job: runs every `interval` seconds (+ up to `jitter`), cut off after `timeout`."""
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], interval: int,
+                 jitter: int = 60, timeout: int = 600):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.interval + random.uniform(0, self.jitter))
+
+
+# The daily/weekly/monthly jobs guard themselves (last-run markers in settings),
+# so their cadence only bounds how late after the due time they fire.
+SCHEDULED_JOBS = [
+    ScheduledJob("weekly_summary", lambda: _maybe_send(
+        "weekly", "auto_summary_weekly_enabled", "auto_summary_last_weekly_sent"), interval=3600, jitter=300),
+    ScheduledJob("monthly_summary", lambda: _maybe_send(
+        "monthly", "auto_summary_monthly_enabled", "auto_summary_last_monthly_sent"), interval=3600, jitter=300),
+    ScheduledJob("followups", process_followups, interval=60, jitter=10, timeout=240),
+    ScheduledJob("birthday_coupons", process_birthday_coupons, interval=3600, jitter=300),
+    ScheduledJob("analytics_snapshot", maybe_export_snapshot, interval=3600, jitter=300, timeout=1800),
+    ScheduledJob("recover_jobs", recover_jobs, interval=300, jitter=30, timeout=300),
+    ScheduledJob("resume_campaigns", resume_campaigns, interval=300, jitter=30, timeout=120),
+    ScheduledJob("customer_segments", maybe_refresh_segments, interval=3600, jitter=300, timeout=1800),
+]
+
+_LEASE_ID = "scheduler"
+_HISTORY = 20  # durations kept per job
 
-        settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0}) or {}
-        business_name = strip_html(settings.get("business_name", "TECHZONE"))
-        review_url = (settings.get("google_review_url") or "").strip() or None
-        vip_threshold = float(settings.get("vip_spend_threshold") or 0) or 20000.0
-        from services.email_service import send_followup_email
-
-        for f in followups:
-            sent = send_followup_email(
-                to_email=f["customer_email"],
-                customer_name=f.get("customer_name", "Valued Customer"),
-                items_summary=f.get("items_summary", "your order"),
-                business_name=business_name,
-                days_ago=int(f.get("days", 14)),
-                review_url=review_url,
-                is_first_purchase=bool(f.get("is_first_purchase", False)),
-                cumulative_total_spent=float(f.get("cumulative_total_spent", 0) or 0),
-                vip_threshold=vip_threshold,
-            )
-            status = "sent" if sent else "failed"
-            await db.followups.update_one(
-                {"id": f["id"]},
-                {"$set": {"status": status, "sent_at": datetime.now(timezone.utc).isoformat()}},
-            )
-    except Exception as e:
-        logger.error(f"Follow-up processor error: {e}")
 
+def _iso(dt: datetime) -> str:
+    return dt.isoformat()
 
-async def summary_scheduler_loop(interval_seconds: int = 3600):
-    """Wake every hour and send weekly/monthly summaries + process follow-ups."""
-    while True:
+
+class Scheduler:
+    def __init__(self, jobs=None):
+        self.jobs = {job.name: job for job in (jobs or SCHEDULED_JOBS)}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._running: Dict[str, asyncio.Task] = {}
+
+    async def _renew_lease(self, now: datetime) -> bool:
+        """Take or extend the leader lease. False if another live worker holds it."""
         try:
-            await _maybe_send(
-                "weekly",
-                "auto_summary_weekly_enabled",
-                "auto_summary_last_weekly_sent",
+            lease = await db.scheduler_lease.find_one_and_update(
+                {"id": _LEASE_ID, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": _iso(now)}}]},
+                {"$set": {
+                    "owner": self.owner,
+                    "heartbeat_at": _iso(now),
+                    "expires_at": _iso(now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
             )
-            await _maybe_send(
-                "monthly",
-                "auto_summary_monthly_enabled",
-                "auto_summary_last_monthly_sent",
+        except DuplicateKeyError:
+            return False  # upsert raced with the live holder's document
+        return bool(lease) and lease.get("owner") == self.owner
+
+    async def release(self):
+        await db.scheduler_lease.delete_one({"id": _LEASE_ID, "owner": self.owner})
+
+    async def _run(self, job: ScheduledJob):
+        started = datetime.now(timezone.utc)
+        clock = time.monotonic()
+        status, error = "ok", None
+        try:
+            await db.scheduler_jobs.update_one(
+                {"name": job.name}, {"$set": {"running_since": _iso(started), "owner": self.owner}}, upsert=True,
             )
-            await _process_followups()
-            await process_birthday_coupons()
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"Timed out after {job.timeout}s"
+            logger.error(f"Scheduled job {job.name} timed out after {job.timeout}s")
+        except asyncio.CancelledError:
+            status, error = "cancelled", "Scheduler lost leadership or shut down"
         except Exception as e:
-            logger.error(f"Scheduler iteration error: {e}")
-        await asyncio.sleep(interval_seconds)
+            status, error = "failed", str(e)
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+        finally:
+            duration = round(time.monotonic() - clock, 3)
+            finished = datetime.now(timezone.utc)
+            try:
+                await db.scheduler_jobs.update_one({"name": job.name}, {
+                    "$set": {
+                        "last_run": _iso(started),
+                        "last_status": status,
+                        "last_error": error,
+                        "last_duration": duration,
+                        "next_run": _iso(job.next_run(finished)),
+                        "running_since": None,
+                    },
+                    "$push": {"durations": {"$each": [duration], "$slice": -_HISTORY}},
+                })
+            except Exception as e:
+                logger.error(f"Scheduler state for {job.name} not saved: {e}")
+            self._running.pop(job.name, None)
+
+    async def _start_due(self, now: datetime):
+        state = {
+            doc["name"]: doc
+            async for doc in db.scheduler_jobs.find({"name": {"$in": list(self.jobs)}}, {"_id": 0})
+        }
+        for name, job in self.jobs.items():
+            if name in self._running:
+                continue
+            next_run = state.get(name, {}).get("next_run")
+            if next_run is None:
+                # First boot: spread the initial runs over the jitter window
+                first = now + timedelta(seconds=random.uniform(0, job.jitter))
+                await db.scheduler_jobs.update_one(
+                    {"name": name}, {"$set": {"next_run": _iso(first)}}, upsert=True,
+                )
+                continue
+            if next_run <= _iso(now):
+                self._running[name] = asyncio.create_task(self._run(job))
+
+    def _cancel_running(self):
+        for task in list(self._running.values()):
+            task.cancel()
+
+    async def tick(self):
+        now = datetime.now(timezone.utc)
+        leader = await self._renew_lease(now)
+        if leader != self.is_leader:
+            logger.info(f"Scheduler {self.owner} {'acquired' if leader else 'lost'} the leader lease")
+            self.is_leader = leader
+            if not leader:
+                self._cancel_running()
+        if leader:
+            await self._start_due(now)
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Scheduler tick error: {e}")
+            await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
+    async def stop(self):
+        self._cancel_running()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        if self.is_leader:
+            try:
+                await self.release()
+            except Exception as e:
+                logger.error(f"Scheduler lease release failed: {e}")
+
+
+async def scheduler_status() -> Dict[str, Any]:
+    """Current leader and per-job state, for the admin status endpoint."""
+    lease: Optional[dict] = await db.scheduler_lease.find_one({"id": _LEASE_ID}, {"_id": 0})
+    state = {doc["name"]: doc async for doc in db.scheduler_jobs.find({}, {"_id": 0})}
+    jobs = []
+    for name, job in ((j.name, j) for j in SCHEDULED_JOBS):
+        doc = state.get(name, {})
+        durations = doc.get("durations") or []
+        jobs.append({
+            **doc,
+            "name": name,
+            "interval_seconds": job.interval,
+            "timeout_seconds": job.timeout,
+            "avg_duration": round(sum(durations) / len(durations), 3) if durations else None,
+        })
+    return {"leader": lease, "jobs": jobs}
 
 
 def start_scheduler(app):
@@ -114,11 +253,16 @@ def start_scheduler(app):
 
     @app.on_event("startup")
     async def _start_scheduler():
-        task_holder["task"] = asyncio.create_task(summary_scheduler_loop())
-        logger.info("Summary email scheduler started (hourly).")
+        scheduler = Scheduler()
+        task_holder["scheduler"] = scheduler
+        task_holder["task"] = asyncio.create_task(scheduler.run_forever())
+        logger.info(f"Scheduler started ({len(scheduler.jobs)} jobs, worker {scheduler.owner}).")
 
     @app.on_event("shutdown")
     async def _stop_scheduler():
         t = task_holder.get("task")
         if t:
             t.cancel()
+        scheduler = task_holder.get("scheduler")
+        if scheduler:
+            await scheduler.stop()
@@ -1,22 +1,17 @@
 """Helpers for cash-register shift calculations and PDF/report generation.
 
 Extracted from `routes/cash_register.py` to keep endpoint handlers slim and testable.
+Layout lives in `services/pdf_templates.py`; rendering runs on the PDF worker pool.
 """
 from __future__ import annotations
 
-import io
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Tuple
 
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
-
 from core.config import db
 from core.security import strip_html
+from services.pdf_renderer import render_pdf
+from services.pdf_templates import _parse_iso
 
 
 # ---------- Totals ----------
@@ -52,181 +47,54 @@ async def fetch_business_info() -> Tuple[Dict[str, Any], str, str, str]:
     return settings, name, addr, phone
 
 
-# ---------- PDF building blocks ----------
+# ---------- Full PDFs ----------
+
+async def shift_report_data(shift: Dict[str, Any], transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Serializable input for the `shift_report` PDF template."""
+    _, business_name, business_address, business_phone = await fetch_business_info()
+
+    totals = calculate_transaction_totals(transactions)
+    expected = calculate_expected_cash(shift["opening_amount"], totals)
 
-def _pdf_styles():
-    styles = getSampleStyleSheet()
     return {
-        "styles": styles,
-        "title": ParagraphStyle('Title', parent=styles['Title'], fontSize=20, textColor=colors.HexColor('#8b5cf6'), spaceAfter=6),
-        "subtitle": ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=12, textColor=colors.gray, alignment=TA_CENTER),
-        "heading": ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=colors.HexColor('#374151'), spaceBefore=20, spaceAfter=10),
-        "footer": ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, textColor=colors.gray, alignment=TA_CENTER),
+        "business_name": business_name,
+        "business_address": business_address,
+        "business_phone": business_phone,
+        "shift": {k: v for k, v in shift.items() if k != "_id"},
+        "transactions": [
+            {k: t.get(k) for k in ("created_at", "transaction_type", "amount", "description")}
+            for t in transactions
+        ],
+        "totals": totals,
+        "expected": expected,
+        "generated_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
     }
 
 
-def _format_summary_table(
-    opening_amount: float,
-    totals: Dict[str, float],
-    expected: float,
-    closing_amount: float = None,
-    difference: float = None,
-) -> Table:
-    """Build the cash-summary table. If closing_amount is given, appends variance row."""
-    data = [
-        ["Description", "Amount"],
-        ["Opening Float", f"${opening_amount:.2f}"],
-        ["+ Cash Sales", f"${totals['cash_sales']:.2f}"],
-        ["- Payouts", f"${totals['payouts']:.2f}"],
-        ["- Safe Drops", f"${totals['drops']:.2f}"],
-        ["- Refunds", f"${totals['refunds']:.2f}"],
-        ["= Expected Cash", f"${expected:.2f}"],
-    ]
-    if closing_amount is not None:
-        data.append(["Actual Cash Count", f"${closing_amount:.2f}"])
-        diff = difference if difference is not None else closing_amount - expected
-        diff_status = "OVER" if diff > 0 else "SHORT" if diff < 0 else "BALANCED"
-        data.append(["Variance", f"${diff:.2f} ({diff_status})"])
-
-    table = Table(data, colWidths=[3 * inch, 2 * inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f3e8ff')),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('PADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-    ]))
-    return table
-
-
-def _parse_iso(value):
-    if isinstance(value, datetime):
-        return value
-    if isinstance(value, str):
-        return datetime.fromisoformat(value.replace("Z", "+00:00"))
-    return None
-
-
-def _format_shift_info_table(shift: Dict[str, Any]) -> Tuple[Table, datetime]:
-    """Return (table, opened_at_datetime) for the Shift Details section."""
+def shift_report_filename(shift: Dict[str, Any]) -> str:
     opened_at = _parse_iso(shift["opened_at"])
-    closed_at = _parse_iso(shift.get("closed_at"))
-    status = "OPEN" if shift["status"] == "open" else "CLOSED"
-
-    rows = [
-        ["Shift ID:", shift["id"][:8] + "..."],
-        ["Status:", status],
-        ["Opened By:", shift.get("opened_by_name", "Unknown")],
-        ["Opened At:", opened_at.strftime("%Y-%m-%d %H:%M:%S") if opened_at else "—"],
-    ]
-    if closed_at:
-        rows.append(["Closed By:", shift.get("closed_by_name", "Unknown")])
-        rows.append(["Closed At:", closed_at.strftime("%Y-%m-%d %H:%M:%S")])
-
-    table = Table(rows, colWidths=[1.5 * inch, 4 * inch])
-    table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#6b7280')),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('PADDING', (0, 0), (-1, -1), 4),
-    ]))
-    return table, opened_at
-
-
-def _format_transactions_table(transactions: List[Dict[str, Any]]) -> Table:
-    data = [["Time", "Type", "Description", "Amount"]]
-    for t in transactions:
-        txn_time = _parse_iso(t["created_at"])
-        txn_type = t["transaction_type"].replace("_", " ").upper()
-        amount = t["amount"]
-        amount_str = f"${amount:.2f}" if amount >= 0 else f"-${abs(amount):.2f}"
-        data.append([
-            txn_time.strftime("%H:%M:%S") if txn_time else "—",
-            txn_type,
-            (t.get("description") or "-")[:30],
-            amount_str,
-        ])
-
-    table = Table(data, colWidths=[1 * inch, 1.2 * inch, 2.5 * inch, 1 * inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#374151')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
-        ('PADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-    ]))
-    return table
+    return f"cash_register_report_{opened_at.strftime('%Y%m%d') if opened_at else 'shift'}_{shift['id'][:8]}.pdf"
 
 
-# ---------- Full PDFs ----------
+def shift_report_pin(shift: Dict[str, Any]):
+    """Closed shifts can no longer change, so their report is cached permanently.
+
+    A legacy shift gets its totals and variance just after the close; until
+    then (`difference` is still None) its report is not pinned.
+    """
+    if shift.get("status") != "closed" or shift.get("difference") is None:
+        return None
+    return f"shift_report-{shift['id']}"
+
 
 async def build_shift_report_pdf(shift: Dict[str, Any], transactions: List[Dict[str, Any]]) -> Tuple[bytes, str]:
     """Build a full PDF report for one shift. Returns (pdf_bytes, filename)."""
-    _, business_name, business_address, business_phone = await fetch_business_info()
+    data = await shift_report_data(shift, transactions)
+    pdf_bytes = await render_pdf("shift_report", data, pin_as=shift_report_pin(shift))
+    return pdf_bytes, shift_report_filename(shift)
 
-    totals = calculate_transaction_totals(transactions)
-    expected = calculate_expected_cash(shift["opening_amount"], totals)
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
-    s = _pdf_styles()
-    elements: list = []
-
-    # Header
-    elements.append(Paragraph(business_name, s["title"]))
-    elements.append(Paragraph("Cash Register Shift Report", s["subtitle"]))
-    if business_address:
-        elements.append(Paragraph(business_address, s["subtitle"]))
-    if business_phone:
-        elements.append(Paragraph(business_phone, s["subtitle"]))
-    elements.append(Spacer(1, 20))
-
-    # Shift info
-    info_table, opened_at = _format_shift_info_table(shift)
-    elements.append(info_table)
-    elements.append(Spacer(1, 20))
-
-    # Summary
-    elements.append(Paragraph("Cash Summary", s["heading"]))
-    closing = shift.get("closing_amount") if shift["status"] == "closed" else None
-    diff = shift.get("difference") if shift["status"] == "closed" else None
-    elements.append(_format_summary_table(shift["opening_amount"], totals, expected, closing, diff))
-    elements.append(Spacer(1, 20))
-
-    # Transactions
-    if transactions:
-        elements.append(Paragraph(f"Transactions ({len(transactions)})", s["heading"]))
-        elements.append(_format_transactions_table(transactions))
-
-    # Notes
-    if shift.get("notes"):
-        elements.append(Spacer(1, 20))
-        elements.append(Paragraph("Notes", s["heading"]))
-        elements.append(Paragraph(shift["notes"], s["styles"]["Normal"]))
-
-    # Footer
-    elements.append(Spacer(1, 40))
-    elements.append(Paragraph(
-        f"Generated on {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}",
-        s["footer"],
-    ))
-    elements.append(Paragraph("This report is for internal record-keeping purposes.", s["footer"]))
-
-    doc.build(elements)
-
-    filename = f"cash_register_report_{opened_at.strftime('%Y%m%d') if opened_at else 'shift'}_{shift['id'][:8]}.pdf"
-    return buffer.getvalue(), filename
-
-
-def build_close_shift_email_pdf(
+async def build_close_shift_email_pdf(
     business_name: str,
     shift: Dict[str, Any],
     totals: Dict[str, float],
@@ -235,14 +103,11 @@ def build_close_shift_email_pdf(
     difference: float,
 ) -> bytes:
     """Compact PDF attached to the auto-email when a shift is closed."""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
-    s = _pdf_styles()
-    elements = [
-        Paragraph(business_name, s["title"]),
-        Paragraph("Cash Register Shift Report", s["subtitle"]),
-        Spacer(1, 20),
-        _format_summary_table(shift["opening_amount"], totals, expected, closing_amount, difference),
-    ]
-    doc.build(elements)
-    return buffer.getvalue()
+    return await render_pdf("close_shift_email", {
+        "business_name": business_name,
+        "opening_amount": shift["opening_amount"],
+        "totals": totals,
+        "expected": expected,
+        "closing_amount": closing_amount,
+        "difference": difference,
+    })
@@ -1,5 +1,4 @@
 """Sales + tax summary PDF generation and email delivery."""
-import io
 import os
 import smtplib
 from datetime import datetime, timezone
@@ -8,29 +7,32 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-
 from core.config import db, logger
 from core.security import strip_html
+from services.pdf_renderer import render_pdf
 
 
-async def _collect_sales(start: datetime, end: datetime) -> list:
-    """Fetch completed sales between [start, end) as plain dicts."""
-    start_iso = start.isoformat()
-    end_iso = end.isoformat()
-    cursor = db.sales.find(
-        {
+async def _daily_totals(start: datetime, end: datetime) -> list:
+    """Per-UTC-day totals of completed sales in [start, end), computed server-side."""
+    pipeline = [
+        {"$match": {
             "payment_status": "completed",
-            "created_at": {"$gte": start_iso, "$lt": end_iso},
-        },
-        {"_id": 0},
-    ).sort("created_at", 1)
-    return await cursor.to_list(10000)
+            "created_at": {"$gte": start.isoformat(), "$lt": end.isoformat()},
+        }},
+        {"$group": {
+            "_id": {"$substrBytes": ["$created_at", 0, 10]},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": {"$ifNull": ["$total", 0]}},
+            "subtotal": {"$sum": {"$ifNull": ["$subtotal", 0]}},
+            "tax": {"$sum": {"$ifNull": ["$tax", 0]}},
+            "discount": {"$sum": {"$add": [
+                {"$ifNull": ["$discount", 0]}, {"$ifNull": ["$points_discount", 0]},
+            ]}},
+            "cash": {"$sum": {"$cond": [{"$eq": ["$payment_method", "cash"]}, {"$ifNull": ["$total", 0]}, 0]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    return await db.sales.aggregate(pipeline).to_list(None)
 
 
 async def build_summary_pdf(period_label: str, start: datetime, end: datetime) -> bytes:
@@ -38,109 +40,34 @@ async def build_summary_pdf(period_label: str, start: datetime, end: datetime) -
     settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0})
     business_name = strip_html(settings.get("business_name", "TECHZONE")) if settings else "TECHZONE"
 
-    sales = await _collect_sales(start, end)
+    # One row per business day; the overview is the sum of those few rows
+    days = await _daily_totals(start, end)
 
-    total_revenue = sum(s.get("total", 0) for s in sales)
-    total_subtotal = sum(s.get("subtotal", 0) for s in sales)
-    total_tax = sum(s.get("tax", 0) for s in sales)
-    total_discount = sum(s.get("discount", 0) + s.get("points_discount", 0) for s in sales)
-    cash_total = sum(s.get("total", 0) for s in sales if s.get("payment_method") == "cash")
+    total_revenue = sum(d["revenue"] for d in days)
+    total_subtotal = sum(d["subtotal"] for d in days)
+    total_tax = sum(d["tax"] for d in days)
+    total_discount = sum(d["discount"] for d in days)
+    cash_total = sum(d["cash"] for d in days)
     card_total = total_revenue - cash_total
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    title_style = ParagraphStyle(
-        "Title", parent=styles["Title"], fontSize=20,
-        textColor=colors.HexColor("#8b5cf6"), spaceAfter=6,
-    )
-    subtitle_style = ParagraphStyle(
-        "Subtitle", parent=styles["Normal"], fontSize=12,
-        textColor=colors.gray, alignment=TA_CENTER,
-    )
-    heading_style = ParagraphStyle(
-        "Heading", parent=styles["Heading2"], fontSize=14,
-        textColor=colors.HexColor("#374151"), spaceBefore=20, spaceAfter=10,
-    )
-    footer_style = ParagraphStyle(
-        "Footer", parent=styles["Normal"], fontSize=9,
-        textColor=colors.gray, alignment=TA_CENTER, spaceBefore=20,
-    )
-
-    elements.append(Paragraph(business_name, title_style))
-    elements.append(Paragraph(f"{period_label} Sales &amp; Tax Summary", subtitle_style))
-    elements.append(
-        Paragraph(
-            f"{start.strftime('%Y-%m-%d')} &nbsp;&#8594;&nbsp; {end.strftime('%Y-%m-%d')}",
-            subtitle_style,
-        )
-    )
-    elements.append(Spacer(1, 18))
-
-    elements.append(Paragraph("Financial Overview", heading_style))
-    totals = [
-        ["Metric", "Amount"],
-        ["Total Sales (orders)", f"{len(sales)}"],
-        ["Gross Subtotal", f"${total_subtotal:,.2f}"],
-        ["Discounts (coupons + points)", f"${total_discount:,.2f}"],
-        ["Tax Collected", f"${total_tax:,.2f}"],
-        ["Gross Revenue", f"${total_revenue:,.2f}"],
-        ["— Cash Revenue", f"${cash_total:,.2f}"],
-        ["— Card / Other Revenue", f"${card_total:,.2f}"],
-    ]
-    t = Table(totals, colWidths=[3.5 * inch, 2.0 * inch])
-    t.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#8b5cf6")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
-        ("PADDING", (0, 0), (-1, -1), 8),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#e5e7eb")),
-    ]))
-    elements.append(t)
-
-    if sales:
-        elements.append(Paragraph("Daily Breakdown", heading_style))
-        by_day = {}
-        for s in sales:
-            try:
-                d = datetime.fromisoformat(s["created_at"].replace("Z", "+00:00")).date()
-            except Exception:
-                continue
-            row = by_day.setdefault(d, {"orders": 0, "revenue": 0.0, "tax": 0.0})
-            row["orders"] += 1
-            row["revenue"] += s.get("total", 0)
-            row["tax"] += s.get("tax", 0)
-
-        rows = [["Date", "Orders", "Revenue", "Tax"]]
-        for d in sorted(by_day.keys()):
-            r = by_day[d]
-            rows.append([
-                d.strftime("%Y-%m-%d"),
-                str(r["orders"]),
-                f"${r['revenue']:,.2f}",
-                f"${r['tax']:,.2f}",
-            ])
-        daily_table = Table(rows, colWidths=[2.0 * inch, 1.0 * inch, 1.5 * inch, 1.0 * inch])
-        daily_table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#374151")),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
-            ("PADDING", (0, 0), (-1, -1), 6),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#e5e7eb")),
-        ]))
-        elements.append(daily_table)
-
-    elements.append(Paragraph(
-        f"Generated on {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}",
-        footer_style,
-    ))
-
-    doc.build(elements)
-    return buffer.getvalue()
+    return await render_pdf("summary", {
+        "business_name": business_name,
+        "period_label": period_label,
+        "start": start,
+        "end": end,
+        "order_count": sum(d["orders"] for d in days),
+        "total_subtotal": total_subtotal,
+        "total_discount": total_discount,
+        "total_tax": total_tax,
+        "total_revenue": total_revenue,
+        "cash_total": cash_total,
+        "card_total": card_total,
+        "daily": [
+            {"day": d["_id"], "orders": d["orders"], "revenue": d["revenue"], "tax": d["tax"]}
+            for d in days
+        ],
+        "generated_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+    })
 
 
 def send_summary_email(to_email: str, pdf_bytes: bytes, period_label: str,
@@ -0,0 +1,80 @@
+"""Tax report PDF: data collection from Mongo for `pdf_templates.render_tax_report`."""
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict
+
+from core.config import db
+
+
+def _period_pipeline(since_iso: str) -> list:
+    return [
+        {"$match": {"created_at": {"$gte": since_iso}, "payment_status": "completed"}},
+        {"$group": {"_id": None, "total_tax": {"$sum": "$tax"}, "total_sales": {"$sum": "$subtotal"}, "transaction_count": {"$sum": 1}}},
+    ]
+
+
+async def collect_tax_report_data() -> Dict[str, Any]:
+    """Everything `pdf_templates.render_tax_report` needs, as plain data."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    month_iso = start_of_month.isoformat()
+
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0})
+    tax_enabled = settings.get('tax_enabled', False) if settings else False
+    tax_rate = settings.get('tax_rate', 0) if settings else 0
+    exempt_categories = settings.get('tax_exempt_categories', []) if settings else []
+
+    periods = []
+    for label, since in (("Today", today), ("This Week", start_of_week), (today.strftime("%B %Y"), start_of_month)):
+        result = await db.sales.aggregate(_period_pipeline(since.isoformat())).to_list(1)
+        row = result[0] if result else {}
+        periods.append({
+            "label": label,
+            "sales": row.get("total_sales", 0),
+            "tax": row.get("total_tax", 0),
+            "count": row.get("transaction_count", 0),
+        })
+
+    # Category breakdown for the month (item types resolved with one $in lookup)
+    all_sales = await db.sales.find(
+        {"created_at": {"$gte": month_iso}, "payment_status": "completed"},
+        {"_id": 0, "items": 1}
+    ).to_list(1000)
+    item_ids = {item.get('item_id') for sale in all_sales for item in sale.get('items', [])}
+    item_types = {
+        inv["id"]: inv.get("type", "other")
+        async for inv in db.inventory.find({"id": {"$in": list(item_ids)}}, {"_id": 0, "id": 1, "type": 1})
+    }
+    exempt_lower = [c.lower() for c in exempt_categories]
+
+    category_totals: Dict[str, Dict[str, Any]] = {}
+    taxable_total = 0
+    exempt_total = 0
+    for sale in all_sales:
+        for item in sale.get('items', []):
+            item_type = item_types.get(item.get('item_id'), 'other')
+            item_subtotal = item.get('subtotal', 0)
+            row = category_totals.setdefault(item_type, {"category": item_type, "sales": 0, "is_exempt": False})
+            row["sales"] += item_subtotal
+            row["is_exempt"] = item_type.lower() in exempt_lower
+            if row["is_exempt"]:
+                exempt_total += item_subtotal
+            else:
+                taxable_total += item_subtotal
+
+    return {
+        "today": today,
+        "generated_label": today.strftime('%B %d, %Y at %I:%M %p'),
+        "tax_enabled": tax_enabled,
+        "tax_rate": tax_rate,
+        "exempt_categories": exempt_categories,
+        "periods": periods,
+        "taxable_total": taxable_total,
+        "exempt_total": exempt_total,
+        "total_tax_collected": periods[2]["tax"],
+        "categories": list(category_totals.values()),
+    }
+
+
+def tax_report_filename() -> str:
+    return f"tax_report_{datetime.now(timezone.utc).strftime('%Y%m%d')}.pdf"
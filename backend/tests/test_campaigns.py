@@ -0,0 +1,61 @@
+"""
+Marketing Campaign API Tests
+Audience preview, validation and lifecycle for /api/campaigns.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestCampaignsAPI:
+    """Campaign endpoint tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_audience_preview(self):
+        response = requests.get(f"{BASE_URL}/api/campaigns/audience?segment=high&inactive_days=30",
+                                headers=self.headers)
+        assert response.status_code == 200
+        assert isinstance(response.json()["recipients"], int)
+
+        bad = requests.get(f"{BASE_URL}/api/campaigns/audience?segment=vip", headers=self.headers)
+        assert bad.status_code == 400
+        print("PASS: audience preview counts segment members")
+
+    def test_create_validation(self):
+        base = {"name": "TEST_campaign", "segment": "high", "discount_value": 10}
+        for override in ({"code_prefix": "no spaces"}, {"discount_type": "bogus"},
+                         {"discount_value": 150}, {"segment": "vip"}):
+            response = requests.post(f"{BASE_URL}/api/campaigns", headers=self.headers, json={**base, **override})
+            assert response.status_code == 400, override
+        print("PASS: invalid campaigns are rejected before anything is queued")
+
+    def test_campaign_lifecycle(self):
+        # An empty audience completes immediately without sending anything
+        response = requests.post(f"{BASE_URL}/api/campaigns", headers=self.headers, json={
+            "name": "TEST_campaign", "segment": "none", "min_score": 101,
+            "discount_value": 5, "code_prefix": "test",
+        })
+        assert response.status_code == 202
+        campaign = response.json()
+        assert campaign["status"] in ("queued", "running", "completed", "failed")
+        assert campaign["coupon"]["code_prefix"] == "TEST"
+        assert campaign["pause_requested"] is False
+
+        fetched = requests.get(f"{BASE_URL}/api/campaigns/{campaign['id']}", headers=self.headers)
+        assert fetched.status_code == 200
+        listed = requests.get(f"{BASE_URL}/api/campaigns", headers=self.headers).json()
+        assert any(c["id"] == campaign["id"] for c in listed)
+        assert requests.get(f"{BASE_URL}/api/campaigns/does-not-exist", headers=self.headers).status_code == 404
+        print("PASS: campaign is created, queued and listed")
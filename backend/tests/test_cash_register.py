@@ -314,6 +314,89 @@ class TestCashRegisterAPI:
                      headers=self.headers, 
                      json={"closing_amount": 325, "notes": "Test cleanup"})
     
+    def test_current_shift_pagination_and_verify(self):
+        """Running totals cover every transaction; the list is paginated; audit agrees"""
+        requests.post(f"{BASE_URL}/api/cash-register/open",
+                     headers=self.headers,
+                     json={"opening_amount": 100.00})
+        for i in range(3):
+            requests.post(f"{BASE_URL}/api/cash-register/transaction",
+                         headers=self.headers,
+                         json={"transaction_type": "payout", "amount": 10.00, "description": f"Payout {i}"})
+
+        response = requests.get(f"{BASE_URL}/api/cash-register/current?limit=2", headers=self.headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["transactions"]) == 2
+        assert data["transactions_total"] == 3
+        assert data["totals"]["payouts"] == 30.00
+        assert data["totals"]["expected_amount"] == 70.00
+
+        shift_id = data["shift"]["id"]
+        audit = requests.get(f"{BASE_URL}/api/cash-register/shift/{shift_id}/verify", headers=self.headers)
+        assert audit.status_code == 200
+        assert audit.json()["consistent"] is True
+        print("PASS: Current shift is paginated and its running totals verify")
+
+        # Cleanup
+        requests.post(f"{BASE_URL}/api/cash-register/close",
+                     headers=self.headers,
+                     json={"closing_amount": 70, "notes": "Test cleanup"})
+
+    def test_daily_and_range_summary(self):
+        """Daily summary and the multi-day reconciliation agree on today's totals"""
+        daily = requests.get(f"{BASE_URL}/api/cash-register/daily-summary", headers=self.headers)
+        assert daily.status_code == 200
+        today = daily.json()["date"]
+
+        response = requests.get(
+            f"{BASE_URL}/api/cash-register/range-summary?start_date={today}&end_date={today}",
+            headers=self.headers,
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["start_date"] == data["end_date"] == today
+        for key in ("cash_sales", "payouts", "drops", "refunds", "variance"):
+            assert key in data["totals"]
+        assert isinstance(data["by_day"], list)
+
+        bad = requests.get(f"{BASE_URL}/api/cash-register/range-summary?start_date=2026-02-01&end_date=2026-01-01",
+                           headers=self.headers)
+        assert bad.status_code == 400
+        print("PASS: Daily and range cash summaries")
+
+    def test_parallel_registers(self):
+        """Two tills keep independent shifts and totals"""
+        opened = requests.post(f"{BASE_URL}/api/cash-register/open",
+                               headers=self.headers,
+                               json={"opening_amount": 40.00, "register_id": "TEST_till2"})
+        assert opened.status_code == 200
+        assert opened.json()["shift"]["register_id"] == "TEST_till2"
+        again = requests.post(f"{BASE_URL}/api/cash-register/open",
+                              headers=self.headers,
+                              json={"opening_amount": 40.00, "register_id": "TEST_till2"})
+        assert again.status_code == 400
+
+        requests.post(f"{BASE_URL}/api/cash-register/transaction",
+                     headers=self.headers,
+                     json={"transaction_type": "drop", "amount": 15.00, "register_id": "TEST_till2"})
+        till = requests.get(f"{BASE_URL}/api/cash-register/current?register_id=TEST_till2", headers=self.headers).json()
+        assert till["totals"]["drops"] == 15.00
+        assert till["totals"]["expected_amount"] == 25.00
+        registers = requests.get(f"{BASE_URL}/api/cash-register/registers", headers=self.headers).json()
+        assert any(r["register_id"] == "TEST_till2" for r in registers)
+
+        bad = requests.post(f"{BASE_URL}/api/cash-register/open",
+                            headers=self.headers,
+                            json={"opening_amount": 1.00, "register_id": "not a valid id"})
+        assert bad.status_code == 400
+        print("PASS: Registers keep separate open shifts")
+
+        # Cleanup
+        requests.post(f"{BASE_URL}/api/cash-register/close",
+                     headers=self.headers,
+                     json={"closing_amount": 25, "notes": "Test cleanup", "register_id": "TEST_till2"})
+
     def test_unauthorized_access(self):
         """Test that endpoints require authentication"""
         # No auth header
@@ -0,0 +1,54 @@
+"""
+Bulk Coupon Generation API Tests
+POST /api/coupons/bulk: unique random codes returned as a CSV download.
+"""
+import csv
+import io
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestBulkCouponsAPI:
+    """Bulk coupon endpoint tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_bulk_codes_csv(self):
+        response = requests.post(f"{BASE_URL}/api/coupons/bulk", headers=self.headers, json={
+            "count": 250, "prefix": "testbulk", "discount_type": "fixed", "discount_value": 5,
+        })
+        assert response.status_code == 200, response.text
+        assert "attachment" in response.headers.get("content-disposition", "")
+        assert response.headers["X-Coupon-Count"] == "250"
+
+        rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+        codes = [row["code"] for row in rows]
+        assert len(codes) == 250 and len(set(codes)) == 250
+        assert all(code.startswith("TESTBULK-") and len(code) == len("TESTBULK-") + 8 for code in codes)
+
+        validate = requests.post(f"{BASE_URL}/api/coupons/validate", headers=self.headers,
+                                 json={"code": codes[0], "subtotal": 50})
+        assert validate.status_code == 200
+        assert validate.json()["discount"] == 5
+        print("PASS: bulk generation returns unique, redeemable codes as CSV")
+
+    def test_bulk_validation(self):
+        base = {"count": 10, "discount_type": "percentage", "discount_value": 10}
+        for override in ({"count": 0}, {"count": 100001}, {"prefix": "BAD PREFIX"},
+                         {"code_length": 4}, {"discount_type": "bogus"}, {"discount_value": 120}):
+            response = requests.post(f"{BASE_URL}/api/coupons/bulk", headers=self.headers, json={**base, **override})
+            assert response.status_code == 400, override
+        print("PASS: invalid bulk requests are rejected")
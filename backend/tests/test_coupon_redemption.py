@@ -0,0 +1,78 @@
+"""
+Coupon Redemption API Tests
+A limited coupon is redeemed atomically by POST /api/sales and never over-used;
+POST /api/coupons/validate reflects creates and edits immediately.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestCouponRedemptionAPI:
+    """Coupon redemption tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def _create_coupon(self, **fields):
+        code = f"TESTRD{uuid.uuid4().hex[:6].upper()}"
+        response = requests.post(f"{BASE_URL}/api/coupons", headers=self.headers, json={
+            "code": code, "discount_type": "fixed", "discount_value": 1, **fields,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    def test_limited_coupon_not_over_redeemed(self):
+        items = requests.get(f"{BASE_URL}/api/inventory", headers=self.headers).json()
+        item = next((i for i in items if i.get("quantity", 0) >= 5), None)
+        if not item:
+            pytest.skip("No inventory item with stock")
+        coupon = self._create_coupon(usage_limit=1)
+
+        def sell(_):
+            return requests.post(f"{BASE_URL}/api/sales", headers=self.headers, json={
+                "items": [{"item_id": item["id"], "item_name": item["name"], "quantity": 1,
+                           "price": item["price"], "subtotal": item["price"]}],
+                "payment_method": "card", "created_by": "admin", "coupon_code": coupon["code"],
+            })
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            sales = list(pool.map(sell, range(4)))
+        assert all(r.status_code == 200 for r in sales), [r.text for r in sales]
+        assert sum(1 for r in sales if r.json().get("coupon_code")) == 1
+
+        stored = requests.get(f"{BASE_URL}/api/coupons/{coupon['id']}", headers=self.headers).json()
+        assert stored["usage_count"] == 1
+        # The legacy client call no longer counts a second use
+        requests.post(f"{BASE_URL}/api/coupons/{coupon['id']}/increment-usage", headers=self.headers)
+        stored = requests.get(f"{BASE_URL}/api/coupons/{coupon['id']}", headers=self.headers).json()
+        assert stored["usage_count"] == 1
+        print("PASS: concurrent checkouts redeem a single-use coupon exactly once")
+
+    def test_validate_sees_edits(self):
+        coupon = self._create_coupon(valid_until="2020-01-01T00:00:00+00:00")
+        validate = lambda: requests.post(f"{BASE_URL}/api/coupons/validate", headers=self.headers,
+                                         json={"code": coupon["code"].lower(), "subtotal": 10})
+        assert validate().status_code == 400
+
+        requests.put(f"{BASE_URL}/api/coupons/{coupon['id']}", headers=self.headers,
+                     json={"valid_until": "2099-01-01T00:00:00+00:00"})
+        response = validate()
+        assert response.status_code == 200 and response.json()["discount"] == 1
+
+        requests.delete(f"{BASE_URL}/api/coupons/{coupon['id']}", headers=self.headers)
+        assert validate().status_code == 404
+        print("PASS: validation reflects coupon edits and deletes")
@@ -0,0 +1,55 @@
+"""
+Idempotency-Key API Tests
+A retried POST /api/sales or /api/cash-register/transaction with the same key
+returns the original response instead of writing twice.
+"""
+import uuid
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestIdempotencyAPI:
+    """Idempotency-Key tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_sale_retry_is_replayed(self):
+        items = requests.get(f"{BASE_URL}/api/inventory", headers=self.headers).json()
+        item = next((i for i in items if i.get("quantity", 0) >= 1), None)
+        if not item:
+            pytest.skip("No inventory item with stock")
+        body = {"items": [{"item_id": item["id"], "item_name": item["name"], "quantity": 1,
+                           "price": item["price"], "subtotal": item["price"]}],
+                "payment_method": "card", "created_by": "admin"}
+        headers = {**self.headers, "Idempotency-Key": f"test-{uuid.uuid4()}"}
+
+        first = requests.post(f"{BASE_URL}/api/sales", headers=headers, json=body)
+        retry = requests.post(f"{BASE_URL}/api/sales", headers=headers, json=body)
+        assert first.status_code == 200 and retry.status_code == 200
+        assert retry.json()["id"] == first.json()["id"]
+        assert retry.headers.get("Idempotent-Replayed") == "true"
+
+        # Same key, different request
+        other = requests.post(f"{BASE_URL}/api/sales", headers=headers, json={**body, "payment_method": "cash"})
+        assert other.status_code == 422
+        print("PASS: a retried sale returns the original sale")
+
+    def test_invalid_key_rejected(self):
+        response = requests.post(f"{BASE_URL}/api/cash-register/transaction",
+                                 headers={**self.headers, "Idempotency-Key": "x" * 200},
+                                 json={"transaction_type": "drop", "amount": 1})
+        assert response.status_code == 400
+        print("PASS: over-long Idempotency-Key rejected")
@@ -0,0 +1,91 @@
+"""
+Background Jobs API Tests
+Submit / poll / result / cancel flow for POST /api/jobs/{type} and the
+admin endpoints that can hand their work to a job (?background=true).
+"""
+import time
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+def _wait(job_id, headers, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{BASE_URL}/api/jobs/{job_id}", headers=headers).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.5)
+    pytest.fail(f"Job {job_id} did not finish within {timeout}s")
+
+
+class TestJobsAPI:
+    """Jobs endpoint tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_staff_performance_job_inline_result(self):
+        response = requests.post(f"{BASE_URL}/api/jobs/staff_performance", headers=self.headers,
+                                 json={"days": 9999})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+        assert job["params"] == {"days": 365}  # clamped like the synchronous endpoint
+        # Owned by the accepting worker, which keeps its heartbeat fresh
+        assert job["owner"] and job["heartbeat_at"] and job["cancel_requested"] is False
+
+        job = _wait(job["id"], self.headers)
+        assert job["status"] == "completed", job.get("error")
+        result = requests.get(f"{BASE_URL}/api/jobs/{job['id']}/result", headers=self.headers)
+        assert result.status_code == 200
+        assert isinstance(result.json()["result"], list)
+        print("PASS: staff_performance job completes with inline result")
+
+    def test_sales_export_job_file_result(self):
+        response = requests.post(f"{BASE_URL}/api/jobs/sales_export", headers=self.headers,
+                                 json={"format": "csv"})
+        assert response.status_code == 202
+        job = _wait(response.json()["id"], self.headers)
+        assert job["status"] == "completed", job.get("error")
+        assert job["result_url"] == f"/api/jobs/{job['id']}/result"
+
+        download = requests.get(f"{BASE_URL}{job['result_url']}", headers=self.headers)
+        assert download.status_code == 200
+        assert "attachment" in download.headers.get("content-disposition", "")
+        assert download.content.decode("utf-8-sig").startswith("sale_id,created_at")
+        print("PASS: sales_export job writes a downloadable CSV")
+
+    def test_invalid_submissions(self):
+        assert requests.post(f"{BASE_URL}/api/jobs/no_such_job", headers=self.headers).status_code == 404
+        # Restore needs an uploaded zip, so it is only reachable via /admin/restore
+        assert requests.post(f"{BASE_URL}/api/jobs/restore", headers=self.headers).status_code == 404
+        bad = requests.post(f"{BASE_URL}/api/jobs/sales_export", headers=self.headers, json={"format": "pdf"})
+        assert bad.status_code == 400
+        assert requests.get(f"{BASE_URL}/api/jobs/does-not-exist", headers=self.headers).status_code == 404
+        print("PASS: unknown, internal-only and invalid jobs are rejected")
+
+    def test_background_rebuild_and_cancel_finished(self):
+        response = requests.post(f"{BASE_URL}/api/admin/rebuild-projections?background=true",
+                                 headers=self.headers, json={"names": ["coupon_stats"]})
+        assert response.status_code == 202
+        job = _wait(response.json()["id"], self.headers)
+        assert job["status"] == "completed", job.get("error")
+        assert "coupon_stats" in job["result"]["rebuilt"]
+
+        cancel = requests.post(f"{BASE_URL}/api/jobs/{job['id']}/cancel", headers=self.headers)
+        assert cancel.status_code == 409
+        listed = requests.get(f"{BASE_URL}/api/jobs", headers=self.headers).json()
+        assert any(j["id"] == job["id"] for j in listed)
+        print("PASS: admin rebuild runs as a job; finished jobs cannot be cancelled")
@@ -0,0 +1,56 @@
+"""
+Sales Quote API Tests
+POST /api/sales/quote prices a cart exactly like POST /api/sales, without writing anything.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestSalesQuoteAPI:
+    """Cart quote tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_quote_matches_sale(self):
+        items = requests.get(f"{BASE_URL}/api/inventory", headers=self.headers).json()
+        item = next((i for i in items if i.get("quantity", 0) >= 2), None)
+        if not item:
+            pytest.skip("No inventory item with stock")
+        cart = {"items": [{"item_id": item["id"], "item_name": item["name"], "quantity": 2,
+                           "price": item["price"], "subtotal": item["price"] * 2}]}
+
+        before = requests.get(f"{BASE_URL}/api/inventory/{item['id']}", headers=self.headers).json()
+        quote = requests.post(f"{BASE_URL}/api/sales/quote", headers=self.headers, json=cart)
+        assert quote.status_code == 200, quote.text
+        quote = quote.json()
+        after = requests.get(f"{BASE_URL}/api/inventory/{item['id']}", headers=self.headers).json()
+        assert after["quantity"] == before["quantity"]
+
+        sale = requests.post(f"{BASE_URL}/api/sales", headers=self.headers,
+                             json={**cart, "payment_method": "card", "created_by": "admin"})
+        assert sale.status_code == 200, sale.text
+        sale = sale.json()
+        for field in ("subtotal", "tax", "discount", "total"):
+            assert sale[field] == pytest.approx(quote[field]), field
+        print("PASS: quote equals the sale totals and writes nothing")
+
+    def test_quote_reports_coupon_error(self):
+        response = requests.post(f"{BASE_URL}/api/sales/quote", headers=self.headers, json={
+            "items": [], "coupon_code": "NO-SUCH-COUPON",
+        })
+        assert response.status_code == 200
+        assert response.json()["discount"] == 0
+        assert response.json()["coupon_error"] == "Invalid coupon code"
+        print("PASS: an unusable coupon is reported, not applied")
@@ -0,0 +1,36 @@
+"""
+Scheduler Status API Tests
+GET /api/admin/scheduler: leader lease and per-job schedule state.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://device-lock-1.preview.emergentagent.com').rstrip('/')
+
+
+class TestSchedulerAPI:
+    """Scheduler status endpoint tests"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    def test_scheduler_status(self):
+        response = requests.get(f"{BASE_URL}/api/admin/scheduler", headers=self.headers)
+        assert response.status_code == 200
+        data = response.json()
+        # One worker holds the lease while the server is up
+        assert data["leader"] and data["leader"]["owner"]
+        names = {job["name"] for job in data["jobs"]}
+        assert {"weekly_summary", "monthly_summary", "followups", "birthday_coupons"} <= names
+        for job in data["jobs"]:
+            assert job["interval_seconds"] > 0 and job["timeout_seconds"] > 0
+        print("PASS: scheduler reports a leader and every job's schedule")